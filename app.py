@@ -1,13 +1,26 @@
 import dash
-from dash import html, dcc, Input, Output, State, callback, ALL, MATCH, callback_context, no_update, clientside_callback, dash_table
+from dash import html, dcc, Input, Output, State, callback, ALL, MATCH, Patch, callback_context, no_update, clientside_callback, dash_table
 import dash_bootstrap_components as dbc
 import json
-from genie_room import genie_query
-import pandas as pd
+from genie_room import genie_query, result_references, stored_answer_parts
 import os
 from dotenv import load_dotenv
-import sqlparse
+import functools
+import math
 from chat_database import ChatDatabase
+from chat_recorder import chat_recorder
+from token_minter import tokenminter
+from config import config
+from models import GenieResponse
+from result_store import result_store, is_large_result, page_records, summarize_columns
+from progress import progress_board
+from render_cache import render_cache
+from result_refresh import result_refresher
+from result_export import EXPORT_FORMATS, RESULT_EXPORTS, export_stream, parquet_available, result_pages, stored_result
+from tracing import tracer
+from structured_logging import log_fields
+from metrics import render_latest, multiprocess_exporter
+from flask import Response, abort, request, stream_with_context
 import logging
 logger = logging.getLogger(__name__)
 
@@ -53,7 +66,25 @@ app.layout = html.Div([
                 html.Div([
                     html.Div("Your conversations with Genie", className="sidebar-header-text"),
                 ], className="sidebar-header"),
-                html.Div([], className="chat-list", id="chat-list")
+                html.Div([
+                    dcc.Input(
+                        id="chat-search",
+                        type="search",
+                        placeholder="Search your questions",
+                        debounce=True,
+                        className="chat-search-input"
+                    )
+                ], className="chat-search"),
+                # Search results replace the chat list while there is a search
+                html.Div([
+                    html.Div([], id="chat-search-results"),
+                    html.Button("Show more results", id="chat-search-more", className="chat-list-more hidden")
+                ], id="chat-search-panel", className="chat-search-panel hidden"),
+                html.Div([
+                    html.Div([], className="chat-list", id="chat-list"),
+                    # Loads the next page of conversations; clicked automatically when the sidebar is scrolled to the end
+                    html.Button("Show older conversations", id="chat-list-more", className="chat-list-more hidden")
+                ], id="chat-list-panel", className="chat-list-panel")
             ], id="sidebar", className="sidebar")
         ], id="left-component", className="left-component"),
 
@@ -243,20 +274,115 @@ app.layout = html.Div([
     ], id="main-content", className="main-content"),
     
     html.Div(id='dummy-output'),
-    dcc.Store(id="chat-trigger", data={"trigger": False, "message": ""}),
+    # The question being asked, and its answer once Genie has given it
+    dcc.Store(id="chat-trigger"),
+    dcc.Store(id="chat-answer"),
+    # The chat item last clicked in the sidebar
+    dcc.Store(id="chat-open"),
     dcc.Store(id="chat-history-store", data=[]),
     dcc.Store(id="query-running-store", data=False),
-    dcc.Store(id="session-store", data={"current_session": None})
+    dcc.Store(id="session-store", data={"current_session": None}),
+    # Keyset cursor of the next page of conversations in the sidebar
+    dcc.Store(id="chat-list-cursor", data={"cursor": None, "done": False}),
+    # The current search and the chats its results belong to
+    dcc.Store(id="chat-search-store", data={"query": "", "offset": None, "hits": {}}),
+    # Polls the progress of the question being answered; enabled only while one is running
+    dcc.Interval(id="progress-interval", interval=500, disabled=True),
+    # Picks up background refreshes of a reopened chat's results; enabled while any are running
+    dcc.Interval(id="refresh-interval", interval=2000, disabled=True),
+    dcc.Store(id="result-versions", data={})
 ])
 
+# Prometheus scrape endpoint on the underlying Flask server
+@app.server.route("/metrics")
+def metrics():
+    return Response(render_latest(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+if multiprocess_exporter:
+    multiprocess_exporter.start()
+
+# Nothing connects at import; the first readiness check mints a token and creates the tables
+@app.server.route("/ready")
+def ready():
+    checks = {}
+    for name, check in (("token", tokenminter.get_token), ("database", db.initialize)):
+        try:
+            check()
+            checks[name] = "ok"
+        except Exception as e:
+            logger.error(f"Readiness check {name} failed: {str(e)}")
+            checks[name] = str(e)
+    is_ready = all(result == "ok" for result in checks.values())
+    body = json.dumps({"status": "ready" if is_ready else "unavailable", "checks": checks})
+    return Response(body, status=200 if is_ready else 503, mimetype="application/json")
+
+# Stream a query result as CSV or Parquet without passing it through the browser
+@app.server.route("/export/<handle>")
+def export_result(handle):
+    export_format = request.args.get("format", "csv")
+    compress = request.args.get("gzip", "").lower() in ("1", "true")
+    if export_format not in EXPORT_FORMATS:
+        abort(400, f"Unsupported export format: {export_format}")
+    if export_format == "parquet" and not parquet_available():
+        abort(501, "Parquet export requires pyarrow")
+
+    try:
+        found = result_pages(handle)
+    except Exception as e:
+        logger.error("Error fetching result for export: %s", e, extra=log_fields(handle=handle))
+        abort(502, "Could not fetch the result from Genie")
+    if found is None:
+        abort(404, "Result not found")
+    pages, source = found
+    RESULT_EXPORTS.inc(format=export_format, source=source)
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"genie-result-{handle}.{extension}"
+    if compress:
+        mimetype, filename = "application/gzip", f"{filename}.gz"
+    return Response(
+        stream_with_context(export_stream(pages, export_format, compress)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # Store chat history
 chat_history = []
 
 # Instantiate ChatDatabase
 db = ChatDatabase()
 
+DEFAULT_USER_ID = "default_user"  # Replace with actual user logic
+
+def render_user_message(text):
+    return html.Div([
+        html.Div([
+            html.Div("Y", className="user-avatar"),
+            html.Span("You", className="model-name")
+        ], className="user-info"),
+        html.Div(text, className="message-text")
+    ], className="user-message message")
+
+def render_chat_item(entry, active=False):
+    """Sidebar entry for a chat; its id is the chat's key in chat-history-store"""
+    return html.Div(
+        entry["queries"][0],
+        className="chat-item active" if active else "chat-item",
+        id={"type": "chat-item", "index": entry["key"]}
+    )
+
+def find_chat(chat_history, key):
+    """Position and entry of the chat with this key, or (None, None)"""
+    for i, entry in enumerate(chat_history or []):
+        if entry["key"] == key:
+            return i, entry
+    return None, None
+
+@functools.lru_cache(maxsize=1024)
 def format_sql_query(sql_query):
-    """Format SQL query using sqlparse library"""
+    """Format SQL query using sqlparse library; memoized, as the same SQL is shown while polling and on every re-render"""
+    import sqlparse  # Imported on first use to keep app start-up fast
+
     formatted_sql = sqlparse.format(
         sql_query,
         keyword_case='upper',  # Makes keywords uppercase
@@ -268,12 +394,86 @@ def format_sql_query(sql_query):
     )
     return formatted_sql
 
-# First callback: Handle inputs and show thinking indicator
-@app.callback(
+def render_thinking_indicator(question_id):
+    """Placeholder for an answer, updated from the question's progress while Genie works on it"""
+    return html.Div([
+        html.Div([
+            html.Span(className="spinner"),
+            html.Span("Thinking...", id={"type": "thinking-status", "index": question_id})
+        ], className="thinking-indicator"),
+        html.Div(id={"type": "thinking-sql", "index": question_id})
+    ], id={"type": "thinking-indicator", "index": question_id}, className="bot-message message")
+
+# Components the browser fills in when a question is asked, so each is still defined once, here
+MESSAGE_TEMPLATES = {
+    "user": render_user_message("__QUESTION_TEXT__"),
+    "thinking": render_thinking_indicator("__QUESTION_ID__"),
+    "chat_item": render_chat_item({"key": "__QUESTION_ID__", "queries": ["__QUESTION_TEXT__"]}, active=True),
+}
+
+# Ask a question. The browser shows it with a thinking indicator, starts a new
+# chat if none is open and passes it to get_model_response through
+# chat-trigger, so a question costs a single server request carrying only itself.
+app.clientside_callback(
+    """
+    function(s1Clicks, s2Clicks, s3Clicks, s4Clicks, sendClicks, submitCount,
+             s1Text, s2Text, s3Text, s4Text, inputValue, messages, chatList, history, session) {
+        var noUpdate = window.dash_clientside.no_update;
+        var triggered = window.dash_clientside.callback_context.triggered;
+        if (!triggered.length) {
+            return Array(8).fill(noUpdate);
+        }
+
+        // Get the user input based on what triggered the callback
+        var suggestions = {'suggestion-1': s1Text, 'suggestion-2': s2Text, 'suggestion-3': s3Text, 'suggestion-4': s4Text};
+        var triggerId = triggered[0].prop_id.split('.')[0];
+        var question = triggerId in suggestions ? suggestions[triggerId] : inputValue;
+        if (!question) {
+            return Array(8).fill(noUpdate);
+        }
+
+        var templates = MESSAGE_TEMPLATES;
+        function newId() {
+            if (window.crypto && window.crypto.randomUUID) {
+                return window.crypto.randomUUID().replace(/-/g, '');
+            }
+            return Date.now().toString(16) + Math.random().toString(16).slice(2);
+        }
+        function fill(template, id) {
+            var text = JSON.stringify(String(question)).slice(1, -1);
+            return JSON.parse(JSON.stringify(template).split('__QUESTION_ID__').join(id).split('__QUESTION_TEXT__').join(text));
+        }
+
+        var questionId = newId();
+        var updatedMessages = (messages || []).concat([fill(templates.user, questionId), fill(templates.thinking, questionId)]);
+
+        // Update chat history; the sidebar only changes when a new chat starts
+        var updatedHistory = (history || []).slice();
+        var currentKey = session && session.current_session;
+        var index = updatedHistory.findIndex(function(entry) { return entry.key === currentKey; });
+        var entry, updatedList = noUpdate, updatedSession = session || {};
+        if (index !== -1) {
+            entry = Object.assign({}, updatedHistory[index], {
+                messages: updatedMessages, queries: updatedHistory[index].queries.concat([question])});
+            updatedHistory[index] = entry;
+        } else {
+            entry = {key: newId(), session_id: null, conversation_id: null, queries: [question], messages: updatedMessages};
+            updatedHistory.unshift(entry);
+            updatedSession = {current_session: entry.key};
+            updatedList = [fill(templates.chat_item, entry.key)].concat((chatList || []).map(function(item) {
+                return Object.assign({}, item, {props: Object.assign({}, item.props, {className: 'chat-item'})});
+            }));
+        }
+
+        var trigger = {message: question, question_id: questionId, session_key: entry.key,
+                       conversation_id: updatedSession.conversation_id || null, session_id: entry.session_id || null};
+        return [updatedMessages, '', 'welcome-container hidden', trigger, true, updatedList, updatedHistory, updatedSession];
+    }
+    """.replace("MESSAGE_TEMPLATES", json.dumps(MESSAGE_TEMPLATES, default=lambda component: component.to_plotly_json())),
     [Output("chat-messages", "children", allow_duplicate=True),
      Output("chat-input-fixed", "value", allow_duplicate=True),
      Output("welcome-container", "className", allow_duplicate=True),
-     Output("chat-trigger", "data", allow_duplicate=True),
+     Output("chat-trigger", "data"),
      Output("query-running-store", "data", allow_duplicate=True),
      Output("chat-list", "children", allow_duplicate=True),
      Output("chat-history-store", "data", allow_duplicate=True),
@@ -290,198 +490,187 @@ def format_sql_query(sql_query):
      State("suggestion-4-text", "children"),
      State("chat-input-fixed", "value"),
      State("chat-messages", "children"),
-     State("welcome-container", "className"),
      State("chat-list", "children"),
      State("chat-history-store", "data"),
      State("session-store", "data")],
     prevent_initial_call=True
 )
-def handle_all_inputs(s1_clicks, s2_clicks, s3_clicks, s4_clicks, send_clicks, submit_clicks,
-                     s1_text, s2_text, s3_text, s4_text, input_value, current_messages,
-                     welcome_class, current_chat_list, chat_history, session_data):
-    ctx = callback_context
-    if not ctx.triggered:
-        return [no_update] * 8
 
-    trigger_id = ctx.triggered[0]["prop_id"].split(".")[0]
-    
-    # Handle suggestion buttons
-    suggestion_map = {
-        "suggestion-1": s1_text,
-        "suggestion-2": s2_text,
-        "suggestion-3": s3_text,
-        "suggestion-4": s4_text
-    }
-    
-    # Get the user input based on what triggered the callback
-    if trigger_id in suggestion_map:
-        user_input = suggestion_map[trigger_id]
-    else:
-        user_input = input_value
-    
-    if not user_input:
-        return [no_update] * 8
-    
-    # Create user message with user info
-    user_message = html.Div([
+TABLE_STYLE = {
+    'display': 'inline-block',
+    'overflowX': 'auto',
+    'width': '95%',
+    'marginRight': '20px'
+}
+
+CELL_STYLE = {
+    'textAlign': 'left',
+    'fontSize': '12px',
+    'padding': '4px 10px',
+    'fontFamily': '-apple-system, BlinkMacSystemFont,Segoe UI, Roboto, Helvetica Neue, Arial, sans-serif',
+    'backgroundColor': 'transparent',
+    'maxWidth': 'fit-content',
+    'minWidth': '100px'
+}
+
+HEADER_STYLE = {
+    'backgroundColor': '#f8f9fa',
+    'fontWeight': '600',
+    'borderBottom': '1px solid #eaecef'
+}
+
+NOTE_STYLE = {"fontSize": "12px", "color": "#666", "marginTop": "-15px", "marginBottom": "10px"}
+
+def make_data_table(table_id, df, **options):
+    """DataTable with the chat's table styling"""
+    return dash_table.DataTable(
+        id=table_id,
+        data=df.to_dict('records'),
+        columns=[{"name": i, "id": i} for i in df.columns],
+        style_table=TABLE_STYLE,
+        style_cell=CELL_STYLE,
+        style_header=HEADER_STYLE,
+        style_data={
+            'whiteSpace': 'normal',
+            'height': 'auto'
+        },
+        fill_width=False,
+        **options
+    )
+
+def render_export_links(handle):
+    """Download links served by the streaming export endpoint"""
+    links = [("CSV", "format=csv"), ("CSV (gzip)", "format=csv&gzip=1")]
+    if parquet_available():
+        links.append(("Parquet", "format=parquet"))
+    children = ["Download full result: "]
+    for i, (label, query) in enumerate(links):
+        if i:
+            children.append(" · ")
+        children.append(html.A(label, href=app.get_relative_path(f"/export/{handle}?{query}")))
+    return html.Div(children, style=NOTE_STYLE)
+
+def render_result_tables(df, handle):
+    """
+    Table components for a query result. Small results are sent whole; large
+    ones stay in the result store and the browser gets column summaries, a
+    head sample it can page through locally, and the full result one page at
+    a time. Downloads always stream from the server.
+    """
+    page_size = config.display.page_size
+    if not is_large_result(df):
+        data_table = make_data_table(
+            f"table-{handle}", df,
+            page_size=page_size,
+            page_current=0,
+            page_action='native'
+        )
+        return [html.Div([data_table], style={'marginBottom': '20px', 'paddingRight': '5px'})]
+
+    with tracer.span("dash.summarize_result", rows=len(df), columns=len(df.columns)):
+        summary = summarize_columns(df)
+    summary_table = make_data_table(f"summary-{handle}", summary, page_action='none')
+    sample = df.iloc[:config.display.sample_rows]
+    sample_table = make_data_table(
+        f"sample-{handle}", sample,
+        page_size=page_size,
+        page_current=0,
+        page_action='native'
+    )
+    data_table = make_data_table(
+        {"type": "result-table", "index": handle}, df.iloc[:page_size],
+        page_size=page_size,
+        page_current=0,
+        page_count=math.ceil(len(df) / page_size),
+        page_action='custom'
+    )
+    tables = [
+        html.Div(f"Large result: {len(df):,} rows x {len(df.columns)} columns. Column summary:",
+                 className="message-text"),
+        html.Div([summary_table], style={'marginBottom': '20px', 'paddingRight': '5px'}),
+        html.Div(f"First {len(sample):,} rows:", className="message-text"),
+        html.Div([sample_table], style={'marginBottom': '20px', 'paddingRight': '5px'}),
+        html.Div("All rows, fetched a page at a time:", className="message-text"),
+        html.Div([data_table], style={'marginBottom': '20px', 'paddingRight': '5px'})
+    ]
+    return tables
+
+def render_query_section(query_text, query_index):
+    """Collapsible formatted SQL for a query answer"""
+    formatted_sql = format_sql_query(query_text)
+
+    return html.Div([
         html.Div([
-            html.Div("Y", className="user-avatar"),
-            html.Span("You", className="model-name")
-        ], className="user-info"),
-        html.Div(user_input, className="message-text")
-    ], className="user-message message")
-    
-    # Add the user message to the chat
-    updated_messages = current_messages + [user_message] if current_messages else [user_message]
-    
-    # Add thinking indicator
-    thinking_indicator = html.Div([
+            html.Button([
+                html.Span("Show code", id={"type": "toggle-text", "index": query_index})
+            ], 
+            id={"type": "toggle-query", "index": query_index}, 
+            className="toggle-query-button",
+            n_clicks=0)
+        ], className="toggle-query-container"),
         html.Div([
-            html.Span(className="spinner"),
-            html.Span("Thinking...")
-        ], className="thinking-indicator")
-    ], className="bot-message message")
-    
-    updated_messages.append(thinking_indicator)
-    
-    # Handle session management
-    if session_data["current_session"] is None:
-        session_data = {"current_session": len(chat_history) if chat_history else 0}
-    
-    current_session = session_data["current_session"]
-    
-    # Update chat history
-    if chat_history is None:
-        chat_history = []
-    
-    if current_session < len(chat_history):
-        chat_history[current_session]["messages"] = updated_messages
-        chat_history[current_session]["queries"].append(user_input)
+            html.Pre([
+                html.Code(formatted_sql, className="sql-code")
+            ], className="sql-pre")
+        ], 
+        id={"type": "query-code", "index": query_index}, 
+        className="query-code-container hidden")
+    ], id={"type": "query-section", "index": query_index}, className="query-section")
+
+def render_answer_part(part, query_index):
+    """Components for one text or query part of an answer"""
+    if part.kind == "text":
+        return [dcc.Markdown(part.text, className="message-text")]
+
+    children = []
+    if part.description:
+        children.append(dcc.Markdown(part.description, className="message-text"))
+    if part.data is None:
+        children.append(html.Div(f"Sorry, this result could not be fetched: {part.error}", className="message-text"))
+    elif part.data.empty:
+        children.append(html.Div("The query returned no rows.", className="message-text"))
     else:
-        chat_history.insert(0, {
-            "session_id": current_session,
-            "queries": [user_input],
-            "messages": updated_messages
-        })
-    
-    # Update chat list
-    updated_chat_list = []
-    for i, session in enumerate(chat_history):
-        first_query = session["queries"][0]
-        is_active = (i == current_session)
-        updated_chat_list.append(
-            html.Div(
-                first_query,
-                className=f"chat-item{'active' if is_active else ''}",
-                id={"type": "chat-item", "index": i}
-            )
-        )
-    
-    return (updated_messages, "", "welcome-container hidden",
-            {"trigger": True, "message": user_input}, True,
-            updated_chat_list, chat_history, session_data)
+        # Wrapped so a background refresh can replace just this result's tables
+        children.append(html.Div(render_result_tables(part.data, part.attachment_id),
+                                 id={"type": "result-view", "index": part.attachment_id}))
+    if part.query_text:
+        children.append(render_query_section(part.query_text, query_index))
+    if part.data is not None and not part.data.empty:
+        # A cut-off result can only be downloaded whole when it can be fetched again
+        if part.complete or result_store.source(part.attachment_id) is not None:
+            children.append(render_export_links(part.attachment_id))
+        else:
+            children.append(html.Div(f"Showing the first {len(part.data)} rows; the full result was not saved.",
+                                     style=NOTE_STYLE))
+    return children
 
-# Second callback: Make API call and show response
-@app.callback(
-    [Output("chat-messages", "children", allow_duplicate=True),
-     Output("chat-history-store", "data", allow_duplicate=True),
-     Output("chat-trigger", "data", allow_duplicate=True),
-     Output("query-running-store", "data", allow_duplicate=True)],
-    [Input("chat-trigger", "data")],
-    [State("chat-messages", "children"),
-     State("chat-history-store", "data")],
-    prevent_initial_call=True
-)
-def get_model_response(trigger_data, current_messages, chat_history):
-    if not trigger_data or not trigger_data.get("trigger"):
-        return dash.no_update, dash.no_update, dash.no_update, dash.no_update
-    
-    user_input = trigger_data.get("message", "")
-    if not user_input:
-        return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+def render_bot_response(answer, query_index):
+    """Build the Dash component tree for a Genie answer, one section per attachment"""
+    genie_message_id = answer.message_id
+    with tracer.span("dash.render_response", message_id=genie_message_id, parts=len(answer.parts)):
+        sections = []
+        for i, part in enumerate(answer.parts):
+            # Suffix ids only for later parts so single-part answers keep their ids
+            suffix = f"-{i}" if i else ""
+            sections.extend(render_answer_part(part, f"{query_index}{suffix}"))
+        content = html.Div(sections)
 
-    try:
-        # Unpack the message_id from genie_query
-        response, query_text, genie_message_id = genie_query(user_input)
-        
-        # Create bot response based on response type
-        if isinstance(response, str):
-            content = dcc.Markdown(response, className="message-text")
+        if answer.similar_question:
+            # A reused answer is rated where it was first given, so it has a note instead of rating buttons
+            footer = html.Div(f"Answered from a similar question: “{answer.similar_question}”",
+                              className="similar-question-note")
         else:
-            # Data table response
-            df = pd.DataFrame(response)
-            table_id = f"table-{len(chat_history)}"
-            
-            data_table = dash_table.DataTable(
-                id=table_id,
-                data=df.to_dict('records'),
-                columns=[{"name": i, "id": i} for i in df.columns],
-                export_format="csv",
-                export_headers="display",
-                page_size=10,
-                style_table={
-                    'display': 'inline-block',
-                    'overflowX': 'auto',
-                    'width': '95%',
-                    'marginRight': '20px'
-                },
-                style_cell={
-                    'textAlign': 'left',
-                    'fontSize': '12px',
-                    'padding': '4px 10px',
-                    'fontFamily': '-apple-system, BlinkMacSystemFont,Segoe UI, Roboto, Helvetica Neue, Arial, sans-serif',
-                    'backgroundColor': 'transparent',
-                    'maxWidth': 'fit-content',
-                    'minWidth': '100px'
-                },
-                style_header={
-                    'backgroundColor': '#f8f9fa',
-                    'fontWeight': '600',
-                    'borderBottom': '1px solid #eaecef'
-                },
-                style_data={
-                    'whiteSpace': 'normal',
-                    'height': 'auto'
-                },
-                fill_width=False,
-                page_current=0,
-                page_action='native'
-            )
+            footer = html.Div([
+                html.Button(
+                    id={"type": "thumbs-up-button", "index": genie_message_id},
+                    className="thumbs-up-button"
+                ),
+                html.Button(
+                    id={"type": "thumbs-down-button", "index": genie_message_id},
+                    className="thumbs-down-button"
+                )
+            ], className="message-actions")
 
-            # Format SQL query if available
-            query_section = None
-            if query_text is not None:
-                formatted_sql = format_sql_query(query_text)
-                query_index = f"{len(chat_history)}-{len(current_messages)}"
-                
-                query_section = html.Div([
-                    html.Div([
-                        html.Button([
-                            html.Span("Show code", id={"type": "toggle-text", "index": query_index})
-                        ], 
-                        id={"type": "toggle-query", "index": query_index}, 
-                        className="toggle-query-button",
-                        n_clicks=0)
-                    ], className="toggle-query-container"),
-                    html.Div([
-                        html.Pre([
-                            html.Code(formatted_sql, className="sql-code")
-                        ], className="sql-pre")
-                    ], 
-                    id={"type": "query-code", "index": query_index}, 
-                    className="query-code-container hidden")
-                ], id={"type": "query-section", "index": query_index}, className="query-section")
-            
-            content = html.Div([
-                html.Div([data_table], style={
-                    'marginBottom': '20px',
-                    'paddingRight': '5px'
-                }),
-                query_section if query_section else None,
-                html.Div("Click the export button in the table header to download as CSV", 
-                         style={"fontSize": "12px", "color": "#666", "marginTop": "-15px", "marginBottom": "10px"})
-            ])
-        
         # Create bot response
         bot_response = html.Div([
             html.Div([
@@ -490,35 +679,35 @@ def get_model_response(trigger_data, current_messages, chat_history):
             ], className="model-info"),
             html.Div([
                 content,
-                html.Div([
-                    html.Div([
-                        html.Button(
-                            id={"type": "thumbs-up-button", "index": genie_message_id},
-                            className="thumbs-up-button"
-                        ),
-                        html.Button(
-                            id={"type": "thumbs-down-button", "index": genie_message_id},
-                            className="thumbs-down-button"
-                        )
-                    ], className="message-actions")
-                ], className="message-footer")
+                html.Div([footer], className="message-footer")
             ], className="message-content")
         ], className="bot-message message", **{"data-message-id": genie_message_id})
-        
-        # Update messages and chat history
-        updated_messages = current_messages[:-1] + [bot_response] if current_messages else [bot_response]
-        
-        # Update chat history safely
-        if chat_history and len(chat_history) > 0:
-            chat_history[0]["messages"] = updated_messages
-        else:
-            chat_history = [{
-                "session_id": 0,
-                "queries": [user_input],
-                "messages": updated_messages
-            }]
-        
-        return updated_messages, chat_history, {"trigger": False, "message": ""}, False
+        return bot_response
+
+# Answer the question passed through chat-trigger. Nothing but the question goes
+# up and nothing but the rendered answer comes back; show_answer puts it in place.
+@app.callback(
+    Output("chat-answer", "data"),
+    Input("chat-trigger", "data"),
+    prevent_initial_call=True
+)
+def get_model_response(trigger_data):
+    user_input = (trigger_data or {}).get("message")
+    if not user_input:
+        return no_update
+
+    question_id = trigger_data.get("question_id")
+    on_status = progress_board.publisher(question_id) if question_id else None
+    delivery = {"question_id": question_id, "session_key": trigger_data.get("session_key")}
+    try:
+        with tracer.span("dash.get_model_response"):
+            # Follow-ups go to the session's Genie conversation so it keeps the context, and
+            # every answer is saved to the chat's session whichever conversation gave it
+            answer = genie_query(user_input, conversation_id=trigger_data.get("conversation_id"), on_status=on_status,
+                                 session_id=trigger_data.get("session_id"))
+            bot_response = render_bot_response(answer, query_index=question_id)
+        return {**delivery, "message": bot_response, "conversation_id": answer.conversation_id,
+                "session_id": answer.session_id}
         
     except Exception as e:
         error_msg = f"Sorry, I encountered an error: {str(e)}. Please try again later."
@@ -531,24 +720,163 @@ def get_model_response(trigger_data, current_messages, chat_history):
                 html.Div(error_msg, className="message-text")
             ], className="message-content")
         ], className="bot-message message")
-        
-        # Update messages and chat history with error
-        updated_messages = current_messages[:-1] + [error_response] if current_messages else [error_response]
-        
-        # Update chat history safely
-        if chat_history and len(chat_history) > 0:
-            chat_history[0]["messages"] = updated_messages
-        else:
-            chat_history = [{
-                "session_id": 0,
-                "queries": [user_input],
-                "messages": updated_messages
-            }]
-        
-        return updated_messages, chat_history, {"trigger": False, "message": ""}, False
+        # Without a conversation id, the chat keeps the conversation it had
+        return {**delivery, "message": error_response}
+    finally:
+        if question_id:
+            progress_board.finish(question_id)
 
-# Toggle sidebar and speech button
+# Replace the question's thinking indicator with its answer, in the open chat and its history entry
+app.clientside_callback(
+    """
+    function(answer, messages, history, session) {
+        var noUpdate = window.dash_clientside.no_update;
+        if (!answer) {
+            return [noUpdate, noUpdate, noUpdate, noUpdate];
+        }
+        function place(list) {
+            return list.map(function(message) {
+                var id = message && message.props && message.props.id;
+                return id && id.type === 'thinking-indicator' && id.index === answer.question_id ? answer.message : message;
+            });
+        }
+
+        var hasConversation = 'conversation_id' in answer;
+        var updatedHistory = (history || []).map(function(entry) {
+            if (entry.key !== answer.session_key) {
+                return entry;
+            }
+            return Object.assign({}, entry, {
+                messages: entry.messages ? place(entry.messages) : entry.messages,
+                conversation_id: hasConversation ? answer.conversation_id : entry.conversation_id,
+                session_id: answer.session_id || entry.session_id
+            });
+        });
+
+        // The user may have switched to another chat while Genie was answering
+        var showing = Boolean(session) && session.current_session === answer.session_key;
+        var updatedSession = showing && hasConversation ?
+            Object.assign({}, session, {conversation_id: answer.conversation_id}) : noUpdate;
+        return [showing ? place(messages || []) : noUpdate, updatedHistory, updatedSession, false];
+    }
+    """,
+    [Output("chat-messages", "children", allow_duplicate=True),
+     Output("chat-history-store", "data", allow_duplicate=True),
+     Output("session-store", "data", allow_duplicate=True),
+     Output("query-running-store", "data", allow_duplicate=True)],
+    [Input("chat-answer", "data")],
+    [State("chat-messages", "children"),
+     State("chat-history-store", "data"),
+     State("session-store", "data")],
+    prevent_initial_call=True
+)
+
+# Show Genie's progress on the question being answered
 @app.callback(
+    [Output({"type": "thinking-status", "index": ALL}, "children"),
+     Output({"type": "thinking-sql", "index": ALL}, "children")],
+    [Input("progress-interval", "n_intervals")],
+    [State({"type": "thinking-status", "index": ALL}, "id")],
+    prevent_initial_call=True
+)
+def show_progress(n_intervals, status_ids):
+    statuses, sql_sections = [], []
+    for status_id in status_ids:
+        progress = progress_board.get(status_id["index"])
+        if progress is None:
+            statuses.append(no_update)
+            sql_sections.append(no_update)
+            continue
+        statuses.append(progress.label)
+        sql_sections.append(html.Pre([
+            html.Code(format_sql_query(progress.sql), className="sql-code")
+        ], className="sql-pre") if progress.sql else None)
+    return statuses, sql_sections
+
+def result_view_handles(components):
+    """Result handles of every result view in a serialized component tree"""
+    handles = []
+    stack = [components]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            props = node.get("props", {})
+            component_id = props.get("id")
+            if isinstance(component_id, dict) and component_id.get("type") == "result-view":
+                handles.append(component_id["index"])
+            else:
+                stack.append(props.get("children"))
+    return handles
+
+# Swap in refreshed results, leaving unchanged tables alone
+@app.callback(
+    [Output({"type": "result-view", "index": ALL}, "children"),
+     Output("result-versions", "data", allow_duplicate=True),
+     Output("refresh-interval", "disabled", allow_duplicate=True)],
+    [Input("refresh-interval", "n_intervals")],
+    [State({"type": "result-view", "index": ALL}, "id"),
+     State("result-versions", "data")],
+    prevent_initial_call=True
+)
+def apply_result_refreshes(n_intervals, view_ids, shown_versions):
+    shown_versions = dict(shown_versions or {})
+    handles = [view_id["index"] for view_id in view_ids]
+    children = []
+    for handle in handles:
+        version = result_refresher.version(handle)
+        df = result_store.get(handle) if version > shown_versions.get(handle, 0) else None
+        if df is None:
+            children.append(no_update)
+            continue
+        children.append(render_result_tables(df, handle))
+        shown_versions[handle] = version
+    return children, shown_versions, not result_refresher.pending(handles)
+
+# Serve pages of large results from the result store
+@app.callback(
+    Output({"type": "result-table", "index": MATCH}, "data"),
+    [Input({"type": "result-table", "index": MATCH}, "page_current")],
+    [State({"type": "result-table", "index": MATCH}, "page_size"),
+     State({"type": "result-table", "index": MATCH}, "columns"),
+     State({"type": "result-table", "index": MATCH}, "id")],
+    prevent_initial_call=True
+)
+def page_result_table(page_current, page_size, columns, table_id):
+    handle = table_id["index"]
+    try:
+        df = stored_result(handle)
+    except Exception as e:
+        logger.error("Error fetching result for paging: %s", e, extra=log_fields(handle=handle))
+        df = None
+    if df is None:
+        logger.warning("Result is no longer available for paging", extra=log_fields(handle=handle))
+        if not columns:
+            return no_update
+        # One row in the first column says why the page is missing, instead of an empty table
+        return [{columns[0]["id"]: "This result is no longer available. Reopen the chat to load it again."}]
+    return page_records(df, page_current, page_size)
+
+# Toggle sidebar and speech button; pure UI state, so it runs in the browser
+app.clientside_callback(
+    """
+    function(n_clicks, sidebarClass, mainContentClass) {
+        if (!n_clicks) {
+            // Initial state
+            return [sidebarClass, {display: 'flex'}, {display: 'none'}, 'logo-container', 'nav-left',
+                    'left-component', mainContentClass];
+        }
+        if (sidebarClass.indexOf('sidebar-open') !== -1) {
+            // Sidebar is closing
+            return ['sidebar', {display: 'flex'}, {display: 'none'}, 'logo-container', 'nav-left',
+                    'left-component', 'main-content'];
+        }
+        // Sidebar is opening
+        return ['sidebar sidebar-open', {display: 'none'}, {display: 'flex'}, 'logo-container logo-container-open',
+                'nav-left nav-left-open', 'left-component left-component-open', 'main-content main-content-shifted'];
+    }
+    """,
     [Output("sidebar", "className"),
      Output("new-chat-button", "style"),
      Output("sidebar-new-chat-button", "style"),
@@ -558,63 +886,306 @@ def get_model_response(trigger_data, current_messages, chat_history):
      Output("main-content", "className")],
     [Input("sidebar-toggle", "n_clicks")],
     [State("sidebar", "className"),
-     State("left-component", "className"),
      State("main-content", "className")]
 )
-def toggle_sidebar(n_clicks, current_sidebar_class, current_left_component_class, current_main_content_class):
-    if n_clicks:
-        if "sidebar-open" in current_sidebar_class:
-            # Sidebar is closing
-            return "sidebar", {"display": "flex"}, {"display": "none"}, "logo-container", "nav-left", "left-component", "main-content"
-        else:
-            # Sidebar is opening
-            return "sidebar sidebar-open", {"display": "none"}, {"display": "flex"}, "logo-container logo-container-open", "nav-left nav-left-open", "left-component left-component-open", "main-content main-content-shifted"
-    # Initial state
-    return current_sidebar_class, {"display": "flex"}, {"display": "none"}, "logo-container", "nav-left", "left-component", current_main_content_class
+
+def load_chat_messages(entry):
+    """Render a stored chat's messages from the database"""
+    limit = config.display.history_message_limit
+    messages, more = db.get_session_messages(entry["session_id"], DEFAULT_USER_ID, limit=limit)
+    rendered_answers = {}
+    for i, message in enumerate(messages):
+        if message.role != "user":
+            rendered_answers[i] = render_cache.get(message.genie_message_id, f"{entry['key']}-{i}")
+    # Results of every answer that has to be rendered, fetched in one query
+    results = db.get_results([result_hash for i, rendered in rendered_answers.items() if rendered is None
+                              for result_hash in result_references(messages[i].content)])
+    components = []
+    for i, message in enumerate(messages):
+        if message.role == "user":
+            components.append(render_user_message(message.content))
+            continue
+        query_index = f"{entry['key']}-{i}"
+        rendered = rendered_answers[i]
+        if rendered is None:
+            parts = stored_answer_parts(message.content, message.query_text, message.genie_message_id, results,
+                                        saved_at=message.timestamp.timestamp() if message.timestamp else None)
+            answer = GenieResponse(conversation_id=entry["conversation_id"], message_id=message.genie_message_id, parts=parts)
+            rendered = render_bot_response(answer, query_index=query_index)
+            render_cache.put(message.genie_message_id, query_index, rendered,
+                             [part.attachment_id for part in parts if part.data is not None])
+        components.append(rendered)
+    if more:
+        components.append(html.Div(f"Showing the first {limit} messages of this chat.", style=NOTE_STYLE))
+    return components
+
+# Load the sidebar's conversations from the database a page at a time
+@app.callback(
+    [Output("chat-list", "children", allow_duplicate=True),
+     Output("chat-history-store", "data", allow_duplicate=True),
+     Output("chat-list-cursor", "data"),
+     Output("chat-list-more", "className")],
+    [Input("chat-list-more", "n_clicks")],
+    [State("chat-list-cursor", "data")],
+    prevent_initial_call="initial_duplicate"
+)
+def load_chat_sessions(n_clicks, cursor_data):
+    if cursor_data and cursor_data.get("done"):
+        return [no_update] * 4
+    try:
+        sessions, cursor = db.list_sessions(
+            DEFAULT_USER_ID, limit=config.display.history_page_size, before=(cursor_data or {}).get("cursor"))
+    except Exception as e:
+        logger.error(f"Error loading chat sessions: {str(e)}")
+        return no_update, no_update, no_update, "chat-list-more"
+
+    # Not hydrated: messages are loaded when the chat is opened. Chats already
+    # opened from search are in the sidebar and are skipped.
+    opened = set((cursor_data or {}).get("opened") or [])
+    entries = [{
+        "key": session.session_id,
+        "session_id": session.session_id,
+        "conversation_id": session.conversationId,
+        "queries": [session.firstQuery],
+        "messages": None
+    } for session in sessions if session.session_id not in opened]
+    chat_list, chat_history = Patch(), Patch()
+    chat_list.extend([render_chat_item(entry) for entry in entries])
+    chat_history.extend(entries)
+    return (chat_list, chat_history, {"cursor": cursor, "done": cursor is None, "opened": list(opened)},
+            "chat-list-more hidden" if cursor is None else "chat-list-more")
+
+# Click the load button when the sidebar is scrolled near its end
+app.clientside_callback(
+    """
+    function(children) {
+        var sidebar = document.getElementById('sidebar');
+        var button = document.getElementById('chat-list-more');
+        if (button) {
+            delete button.dataset.loading;
+        }
+        if (sidebar && !sidebar.dataset.infiniteScroll) {
+            sidebar.dataset.infiniteScroll = 'true';
+            sidebar.addEventListener('scroll', function() {
+                var more = document.getElementById('chat-list-more');
+                if (!more || more.dataset.loading || more.offsetParent === null) {
+                    return;
+                }
+                if (sidebar.scrollTop + sidebar.clientHeight >= sidebar.scrollHeight - 100) {
+                    more.dataset.loading = 'true';
+                    more.click();
+                }
+            });
+        }
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output("chat-list-more", "title"),
+    Input("chat-list", "children"),
+    prevent_initial_call=True
+)
+
+# Mark the clicked chat item active in the browser, without waiting for its
+# messages, and open it through chat-open; items being added to the sidebar
+# thereby cost no server request
+app.clientside_callback(
+    """
+    function(nClicks, ids) {
+        var noUpdate = window.dash_clientside.no_update;
+        var triggered = window.dash_clientside.callback_context.triggered;
+        // Also fires when items are added to the list, with nothing clicked
+        if (!triggered.length || !triggered[0].value) {
+            return [noUpdate, noUpdate];
+        }
+        var propId = triggered[0].prop_id;
+        var clicked = JSON.parse(propId.slice(0, propId.lastIndexOf('.'))).index;
+        var classNames = ids.map(function(id) {
+            return id.index === clicked ? 'chat-item active' : 'chat-item';
+        });
+        return [classNames, {key: clicked, clicked_at: Date.now()}];
+    }
+    """,
+    [Output({"type": "chat-item", "index": ALL}, "className"),
+     Output("chat-open", "data")],
+    Input({"type": "chat-item", "index": ALL}, "n_clicks"),
+    State({"type": "chat-item", "index": ALL}, "id"),
+    prevent_initial_call=True
+)
 
 # Add callback for chat item selection
 @app.callback(
     [Output("chat-messages", "children", allow_duplicate=True),
      Output("welcome-container", "className", allow_duplicate=True),
-     Output("chat-list", "children", allow_duplicate=True),
-     Output("session-store", "data", allow_duplicate=True)],
-    [Input({"type": "chat-item", "index": ALL}, "n_clicks")],
+     Output("chat-history-store", "data", allow_duplicate=True),
+     Output("session-store", "data", allow_duplicate=True),
+     Output("refresh-interval", "disabled", allow_duplicate=True),
+     Output("result-versions", "data")],
+    [Input("chat-open", "data")],
     [State("chat-history-store", "data"),
-     State("chat-list", "children"),
      State("session-store", "data")],
     prevent_initial_call=True
 )
-def show_chat_history(n_clicks, chat_history, current_chat_list, session_data):
-    ctx = dash.callback_context
-    if not ctx.triggered:
-        return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+def show_chat_history(open_data, chat_history, session_data):
+    if not open_data:
+        return [dash.no_update] * 6
     
-    # Get the clicked item index
-    triggered_id = ctx.triggered[0]["prop_id"].split(".")[0]
-    clicked_index = json.loads(triggered_id)["index"]
+    # Get the clicked item's chat
+    clicked_key = open_data["key"]
+    clicked_index, entry = find_chat(chat_history, clicked_key)
+    if entry is None:
+        return [dash.no_update] * 6
     
-    if not chat_history or clicked_index >= len(chat_history):
-        return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+    try:
+        # The clicked item was already marked active in the browser
+        messages, welcome_class, _, history_update, new_session_data, refresh_disabled, versions = open_chat(
+            entry, clicked_index, chat_history, session_data)
+        return messages, welcome_class, history_update, new_session_data, refresh_disabled, versions
+    except Exception as e:
+        logger.error(f"Error loading chat {clicked_key}: {str(e)}")
+        return [dash.no_update] * 6
+
+def open_chat(entry, index, chat_history, session_data, is_new=False):
+    """
+    Outputs that show a chat: its messages, the sidebar's active item, the
+    session it resumes and background refreshes of its results. A new entry
+    (opened from search before its page was loaded) is added to the end of the
+    sidebar and the history.
+    """
+    # Stored chats are loaded from the database the first time they are opened
+    history_update = dash.no_update
+    messages = entry["messages"]
+    if messages is None:
+        messages = load_chat_messages(entry)
+        if is_new:
+            history_update = Patch()
+            history_update.append({**entry, "messages": messages})
+        else:
+            history_update = Patch()
+            history_update[index]["messages"] = messages
     
-    # Update session data to the clicked session
-    new_session_data = {"current_session": clicked_index}
+    # Update session data to the clicked session, resuming its Genie conversation
+    new_session_data = {"current_session": entry["key"],
+                        "conversation_id": entry.get("conversation_id")}
     
-    # Update active state in chat list
-    updated_chat_list = []
-    for i, item in enumerate(current_chat_list):
-        new_class = "chat-item active" if i == clicked_index else "chat-item"
-        updated_chat_list.append(
-            html.Div(
-                item["props"]["children"],
-                className=new_class,
-                id={"type": "chat-item", "index": i}
-            )
-        )
+    # Move the active state in the chat list
+    updated_chat_list = Patch()
+    previous_index, _ = find_chat(chat_history, (session_data or {}).get("current_session"))
+    if previous_index is not None:
+        updated_chat_list[previous_index]["props"]["className"] = "chat-item"
+    if is_new:
+        updated_chat_list.append(render_chat_item(entry, active=True))
+    else:
+        updated_chat_list[index]["props"]["className"] = "chat-item active"
+    
+    # Re-run stale results of the reopened chat in the background
+    handles = result_view_handles(messages)
+    result_refresher.refresh(handles)
     
-    return (chat_history[clicked_index]["messages"], 
+    return (messages, 
             "welcome-container hidden", 
             updated_chat_list,
-            new_session_data)
+            history_update,
+            new_session_data,
+            not result_refresher.pending(handles),
+            {})
+
+def render_search_hit(hit):
+    """A search result in the sidebar; its id is the Genie message that matched"""
+    meta = hit.created_at.strftime("%d %b %Y")
+    if hit.first_query != hit.question:
+        meta += f" · in \"{hit.first_query}\""
+    return html.Div([
+        html.Div(hit.question, className="chat-search-question"),
+        html.Div(meta, className="chat-search-meta")
+    ], className="chat-item chat-search-hit", id={"type": "search-hit", "index": hit.genie_message_id})
+
+# Search past questions and answers from the sidebar
+@app.callback(
+    [Output("chat-search-results", "children"),
+     Output("chat-search-store", "data"),
+     Output("chat-search-more", "className"),
+     Output("chat-search-panel", "className"),
+     Output("chat-list-panel", "className")],
+    [Input("chat-search", "value"),
+     Input("chat-search-more", "n_clicks")],
+    [State("chat-search-store", "data")],
+    prevent_initial_call=True
+)
+def search_chats(query, more_clicks, search_data):
+    query = (query or "").strip()
+    if not query:
+        return [], {"query": "", "offset": None, "hits": {}}, "chat-list-more hidden", "chat-search-panel hidden", "chat-list-panel"
+
+    more = callback_context.triggered[0]["prop_id"].startswith("chat-search-more") and query == search_data.get("query")
+    offset = (search_data.get("offset") or 0) if more else 0
+    try:
+        hits, next_offset = db.search_messages(DEFAULT_USER_ID, query, limit=config.display.history_page_size, offset=offset)
+    except Exception as e:
+        logger.error(f"Error searching chats for {query!r}: {str(e)}")
+        return ([html.Div("Search is not available right now.", className="chat-search-empty")],
+                {"query": query, "offset": None, "hits": {}}, "chat-list-more hidden", "chat-search-panel", "chat-list-panel hidden")
+
+    known = dict(search_data.get("hits") or {}) if more else {}
+    known.update({hit.genie_message_id: {"session_id": hit.session_id, "conversation_id": hit.conversation_id,
+                                         "first_query": hit.first_query} for hit in hits})
+    if more:
+        results = Patch()
+        results.extend([render_search_hit(hit) for hit in hits])
+    else:
+        results = [render_search_hit(hit) for hit in hits] or [
+            html.Div("No past questions match your search.", className="chat-search-empty")]
+    return (results, {"query": query, "offset": next_offset, "hits": known},
+            "chat-list-more hidden" if next_offset is None else "chat-list-more",
+            "chat-search-panel", "chat-list-panel hidden")
+
+# Open the chat a search result belongs to
+@app.callback(
+    [Output("chat-messages", "children", allow_duplicate=True),
+     Output("welcome-container", "className", allow_duplicate=True),
+     Output("chat-list", "children", allow_duplicate=True),
+     Output("chat-history-store", "data", allow_duplicate=True),
+     Output("session-store", "data", allow_duplicate=True),
+     Output("refresh-interval", "disabled", allow_duplicate=True),
+     Output("result-versions", "data", allow_duplicate=True),
+     Output("chat-list-cursor", "data", allow_duplicate=True)],
+    [Input({"type": "search-hit", "index": ALL}, "n_clicks")],
+    [State("chat-search-store", "data"),
+     State("chat-history-store", "data"),
+     State("session-store", "data"),
+     State("chat-list-cursor", "data")],
+    prevent_initial_call=True
+)
+def open_search_hit(n_clicks, search_data, chat_history, session_data, cursor_data):
+    ctx = dash.callback_context
+    if not ctx.triggered or not ctx.triggered[0]["value"]:
+        return [dash.no_update] * 8
+    
+    genie_message_id = json.loads(ctx.triggered[0]["prop_id"].rsplit(".", 1)[0])["index"]
+    hit = (search_data.get("hits") or {}).get(genie_message_id)
+    if hit is None:
+        return [dash.no_update] * 8
+    
+    index, entry = find_chat(chat_history, hit["session_id"])
+    cursor_update = dash.no_update
+    is_new = entry is None
+    if is_new:
+        # Not in the sidebar yet: added now, and skipped when its page loads later
+        index = len(chat_history or [])
+        entry = {
+            "key": hit["session_id"],
+            "session_id": hit["session_id"],
+            "conversation_id": hit["conversation_id"],
+            "queries": [hit["first_query"]],
+            "messages": None
+        }
+        cursor_data = cursor_data or {"cursor": None, "done": False}
+        cursor_update = {**cursor_data, "opened": (cursor_data.get("opened") or []) + [entry["key"]]}
+    
+    try:
+        return (*open_chat(entry, index, chat_history, session_data, is_new=is_new), cursor_update)
+    except Exception as e:
+        logger.error(f"Error loading chat {entry['key']}: {str(e)}")
+        return [dash.no_update] * 8
 
 # Modify the clientside callback to target the chat-container
 app.clientside_callback(
@@ -636,55 +1207,61 @@ app.clientside_callback(
 @app.callback(
     [Output("welcome-container", "className", allow_duplicate=True),
      Output("chat-messages", "children", allow_duplicate=True),
-     Output("chat-trigger", "data", allow_duplicate=True),
      Output("query-running-store", "data", allow_duplicate=True),
      Output("chat-history-store", "data", allow_duplicate=True),
-     Output("session-store", "data", allow_duplicate=True)],
+     Output("session-store", "data", allow_duplicate=True),
+     Output("chat-list", "children", allow_duplicate=True)],
     [Input("new-chat-button", "n_clicks"),
      Input("sidebar-new-chat-button", "n_clicks")],
     [State("chat-messages", "children"),
-     State("chat-trigger", "data"),
      State("chat-history-store", "data"),
      State("chat-list", "children"),
      State("query-running-store", "data"),
      State("session-store", "data")],
     prevent_initial_call=True
 )
-def reset_to_welcome(n_clicks1, n_clicks2, chat_messages, chat_trigger, chat_history_store, 
+def reset_to_welcome(n_clicks1, n_clicks2, chat_messages, chat_history_store, 
                     chat_list, query_running, session_data):
     # Reset session when starting a new chat
     new_session_data = {"current_session": None}
-    return ("welcome-container visible", [], {"trigger": False, "message": ""}, 
-            False, chat_history_store, new_session_data)
+    updated_chat_list = no_update
+    current_index, _ = find_chat(chat_history_store, (session_data or {}).get("current_session"))
+    if current_index is not None:
+        updated_chat_list = Patch()
+        updated_chat_list[current_index]["props"]["className"] = "chat-item"
+    return ("welcome-container visible", [], False, chat_history_store, new_session_data, updated_chat_list)
 
-@app.callback(
+# Hide the welcome screen whenever the chat has messages
+app.clientside_callback(
+    """
+    function(chatMessages) {
+        var hasMessages = Array.isArray(chatMessages) ? chatMessages.length > 0 : Boolean(chatMessages);
+        return [hasMessages ? 'welcome-container hidden' : 'welcome-container visible'];
+    }
+    """,
     [Output("welcome-container", "className", allow_duplicate=True)],
     [Input("chat-messages", "children")],
     prevent_initial_call=True
 )
-def reset_query_running(chat_messages):
-    # Return as a single-item list
-    if chat_messages:
-        return ["welcome-container hidden"]
-    else:
-        return ["welcome-container visible"]
 
-# Add callback to disable input while query is running
-@app.callback(
+# Disable input while query is running
+app.clientside_callback(
+    """
+    function(queryRunning) {
+        // Show tooltip when query is running, hide it otherwise
+        var tooltipClass = queryRunning ? 'query-tooltip visible' : 'query-tooltip hidden';
+        return [queryRunning, queryRunning, queryRunning, queryRunning, tooltipClass, !queryRunning];
+    }
+    """,
     [Output("chat-input-fixed", "disabled"),
      Output("send-button-fixed", "disabled"),
      Output("new-chat-button", "disabled"),
      Output("sidebar-new-chat-button", "disabled"),
-     Output("query-tooltip", "className")],
+     Output("query-tooltip", "className"),
+     Output("progress-interval", "disabled")],
     [Input("query-running-store", "data")],
     prevent_initial_call=True
 )
-def toggle_input_disabled(query_running):
-    # Show tooltip when query is running, hide it otherwise
-    tooltip_class = "query-tooltip visible" if query_running else "query-tooltip hidden"
-    
-    # Disable input and buttons when query is running
-    return query_running, query_running, query_running, query_running, tooltip_class
 
 
 # Fix the callback for thumbs up/down buttons
@@ -700,7 +1277,7 @@ def toggle_input_disabled(query_running):
 )
 def handle_feedback(up_clicks, down_clicks, up_class, down_class, button_id):
     genie_message_id = button_id["index"]
-    user_id = "default_user"  # Replace with actual user logic
+    user_id = DEFAULT_USER_ID
 
     # Determine rating
     if up_clicks and (not down_clicks or up_clicks > down_clicks):
@@ -712,28 +1289,38 @@ def handle_feedback(up_clicks, down_clicks, up_class, down_class, button_id):
         new_up_class = "thumbs-up-button"
         new_down_class = "thumbs-down-button active" if rating == "down" else "thumbs-down-button"
 
+    # Written behind the answer it rates, which may not be saved yet
     if genie_message_id:
-        try:
-            db.update_message_rating(genie_message_id, user_id, rating)
-        except Exception as e:
-            print(f"Failed to update rating: {e}")
+        chat_recorder.rate(genie_message_id, rating, user_id=user_id)
 
     return new_up_class, new_down_class
 
-# Add callback for toggling SQL query visibility
-@app.callback(
+# Toggle SQL query visibility
+app.clientside_callback(
+    """
+    function(nClicks) {
+        if (nClicks % 2 === 1) {
+            return ['query-code-container visible', 'Hide code'];
+        }
+        return ['query-code-container hidden', 'Show code'];
+    }
+    """,
     [Output({"type": "query-code", "index": MATCH}, "className"),
      Output({"type": "toggle-text", "index": MATCH}, "children")],
     [Input({"type": "toggle-query", "index": MATCH}, "n_clicks")],
     prevent_initial_call=True
 )
-def toggle_query_visibility(n_clicks):
-    if n_clicks % 2 == 1:
-        return "query-code-container visible", "Hide code"
-    return "query-code-container hidden", "Show code"
 
-# Add callbacks for welcome text customization
-@app.callback(
+# Open the welcome text editor filled with the current text
+app.clientside_callback(
+    """
+    function(nClicks, title, description, s1, s2, s3, s4) {
+        if (!nClicks) {
+            return Array(7).fill(window.dash_clientside.no_update);
+        }
+        return [true, title, description, s1, s2, s3, s4];
+    }
+    """,
     [Output("edit-welcome-modal", "is_open", allow_duplicate=True),
      Output("welcome-title-input", "value"),
      Output("welcome-description-input", "value"),
@@ -750,10 +1337,6 @@ def toggle_query_visibility(n_clicks):
      State("suggestion-4-text", "children")],
     prevent_initial_call=True
 )
-def open_modal(n_clicks, current_title, current_description, s1, s2, s3, s4):
-    if not n_clicks:
-        return [no_update] * 7
-    return True, current_title, current_description, s1, s2, s3, s4
 
 @app.callback(
     [Output("welcome-title", "children", allow_duplicate=True),
@@ -808,4 +1391,8 @@ def handle_modal_actions(save_clicks, close_clicks,
 
 
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    from structured_logging import log_pipeline
+
+    log_pipeline.configure()
+    # Development server; use serve.py for multi-worker production serving
+    app.run_server(host=config.server.host, port=config.server.port, debug=config.server.debug)
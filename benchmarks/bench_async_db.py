@@ -0,0 +1,103 @@
+"""
+Throughput of the sync and async chat database under concurrent load.
+
+Run against a local Postgres by pointing DB_HOST, DB_PORT, DB_NAME and
+DATABRICKS_CLIENT_ID (used as the database user) at it. The OAuth token is
+still injected as the password, which a trust-auth local server ignores.
+
+    python benchmarks/bench_async_db.py --concurrency 32 --operations 2000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from chat_database import ChatDatabase, AsyncChatDatabase
+from db_config import db_manager, get_async_db_manager
+from models import MessageResponse
+
+BENCH_USER = "bench_user"
+
+def make_message(index: int) -> tuple:
+    conversation_id = str(uuid.uuid4())
+    message = MessageResponse(
+        message_id=str(uuid.uuid4()),
+        genie_message_id=str(uuid.uuid4()),
+        content=f"benchmark question {index}",
+        role="user",
+        timestamp=datetime.now(timezone.utc)
+    )
+    return str(uuid.uuid4()), conversation_id, message
+
+def report(label: str, latencies: list, elapsed: float) -> None:
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{label:>6}: {len(latencies) / elapsed:8.1f} ops/s  "
+          f"p50={quantiles[49] * 1000:6.2f}ms  p95={quantiles[94] * 1000:6.2f}ms  p99={quantiles[98] * 1000:6.2f}ms")
+
+def run_sync(operations: int, concurrency: int) -> None:
+    db = ChatDatabase()
+
+    def operation(index: int) -> float:
+        session_id, conversation_id, message = make_message(index)
+        start = time.perf_counter()
+        db.save_message_to_session(session_id, BENCH_USER, message, conversation_id)
+        db.update_message_rating(message.message_id, BENCH_USER, "up")
+        db.get_message_rating(message.message_id, BENCH_USER)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(operation, range(operations)))
+    report("sync", latencies, time.perf_counter() - start)
+
+async def run_async(operations: int, concurrency: int) -> None:
+    db = AsyncChatDatabase()
+    await db.initialize()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def operation(index: int) -> float:
+        session_id, conversation_id, message = make_message(index)
+        async with semaphore:
+            start = time.perf_counter()
+            await db.save_message_to_session(session_id, BENCH_USER, message, conversation_id)
+            await db.update_message_rating(message.message_id, BENCH_USER, "up")
+            await db.get_message_rating(message.message_id, BENCH_USER)
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(operation(i) for i in range(operations)))
+    report("async", list(latencies), time.perf_counter() - start)
+    await get_async_db_manager().cleanup()
+
+def cleanup() -> None:
+    with db_manager.managed_connection() as conn:
+        conn.execute(text("DELETE FROM genie_message_ratings WHERE user_id = :user_id"), {"user_id": BENCH_USER})
+        conn.execute(text("DELETE FROM genie_messages WHERE user_id = :user_id"), {"user_id": BENCH_USER})
+        conn.execute(text("DELETE FROM genie_sessions WHERE user_id = :user_id"), {"user_id": BENCH_USER})
+        conn.commit()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operations", type=int, default=1000, help="save + rate + read cycles per mode")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent simulated users")
+    args = parser.parse_args()
+
+    print(f"{args.operations} operations at concurrency {args.concurrency}")
+    try:
+        run_sync(args.operations, args.concurrency)
+        asyncio.run(run_async(args.operations, args.concurrency))
+    finally:
+        cleanup()
+        db_manager.cleanup()
+
+if __name__ == "__main__":
+    main()
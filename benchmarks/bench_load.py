@@ -0,0 +1,219 @@
+"""
+Load test for the Genie question path against the local Genie stand-in.
+
+Scenarios, each run with --users concurrent simulated users asking
+--questions questions apiece:
+  genie    end-to-end genie_query: start conversation, poll, fetch, process
+  followup genie_query follow-ups sent to each user's existing conversation; compare with genie
+  process  process_genie_response on a completed message: result fetch and DataFrame build
+  db       ChatDatabase.save_message_to_session writes (needs a local Postgres, see
+           bench_message_writes.py for the connection settings)
+
+Reports p50/p95/p99 latency, throughput, errors and peak memory per scenario.
+
+    python benchmarks/bench_load.py --users 16 --questions 5 --completion-time 1 --rows 10000
+    python benchmarks/bench_load.py --scenario db --users 32 --questions 50 --json results.json
+
+A .env file in the working directory overrides the environment this script
+sets up, so run it from a checkout without one.
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from genie_stub_server import GenieStubServer, add_settings_arguments, settings_from_args
+
+QUESTIONS = [
+    "Which women's team won the latest NFL?",
+    "How many teams participated in the 2025 Allianz Hurling League?",
+    "Which team lost the most matches in the NFL league?",
+    "Which team had the highest ELO rating in 2001?",
+]
+
+def summarize(name: str, latencies: list, errors: int, elapsed: float, peak_bytes: int) -> dict:
+    result = {
+        "scenario": name,
+        "operations": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "peak_traced_mb": round(peak_bytes / 2 ** 20, 2) if peak_bytes else None,
+        # ru_maxrss is kilobytes on Linux
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if len(latencies) >= 2:
+        quantiles = statistics.quantiles(latencies, n=100)
+        result.update(p50_ms=round(quantiles[49] * 1000, 2), p95_ms=round(quantiles[94] * 1000, 2),
+                      p99_ms=round(quantiles[98] * 1000, 2))
+    return result
+
+def print_result(result: dict) -> None:
+    print(f"{result['scenario']:>8}: {result['operations']:5d} ops  {result['errors']:3d} errors  "
+          f"{result['throughput_per_second'] or 0:8.2f} ops/s  "
+          f"p50={result.get('p50_ms', 0):9.2f}ms  p95={result.get('p95_ms', 0):9.2f}ms  p99={result.get('p99_ms', 0):9.2f}ms  "
+          f"peak={result['peak_traced_mb'] or 0:7.2f}MB  rss={result['max_rss_mb']:7.1f}MB")
+
+def run_concurrently(name: str, operation, users: int, per_user: int, trace_memory: bool) -> dict:
+    """Run operation(user, index) per_user times on each of users threads"""
+    def user_loop(user: int) -> tuple:
+        latencies, errors = [], 0
+        for index in range(per_user):
+            start = time.perf_counter()
+            try:
+                ok = operation(user, index)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += 0 if ok else 1
+        return latencies, errors
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        results = list(executor.map(user_loop, range(users)))
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    latencies = [latency for user_latencies, _ in results for latency in user_latencies]
+    return summarize(name, latencies, sum(errors for _, errors in results), elapsed, peak)
+
+def scenario_genie(args) -> dict:
+    from genie_room import genie_query
+
+    def operation(user: int, index: int) -> bool:
+        answer = genie_query(QUESTIONS[(user + index) % len(QUESTIONS)])
+        return answer.message_id is not None
+
+    return run_concurrently("genie", operation, args.users, args.questions, args.trace_memory)
+
+def scenario_followup(args) -> dict:
+    from genie_room import genie_query
+
+    # Each user's conversation is started outside the timed operations
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        started = executor.map(lambda user: genie_query(QUESTIONS[user % len(QUESTIONS)]), range(args.users))
+        conversations = {user: answer.conversation_id for user, answer in enumerate(started)}
+
+    def operation(user: int, index: int) -> bool:
+        answer = genie_query(QUESTIONS[(user + index) % len(QUESTIONS)], conversation_id=conversations[user])
+        # A restarted conversation replaces the expired one
+        conversations[user] = answer.conversation_id or conversations[user]
+        return answer.message_id is not None
+
+    return run_concurrently("followup", operation, args.users, args.questions, args.trace_memory)
+
+def scenario_process(args) -> dict:
+    from genie_room import GenieClient, process_genie_response
+
+    client = GenieClient()
+    # One completed data answer, processed repeatedly
+    for question in QUESTIONS:
+        started = client.start_conversation(question)
+        message = client.wait_for_message_completion(started["conversation_id"], started["message_id"])
+        if any("query" in attachment for attachment in message.get("attachments", [])):
+            break
+    conversation_id, message_id = started["conversation_id"], started["message_id"]
+
+    def operation(user: int, index: int) -> bool:
+        process_genie_response(client, conversation_id, message_id, message)
+        return True
+
+    return run_concurrently("process", operation, args.users, args.questions, args.trace_memory)
+
+def scenario_db(args) -> dict:
+    from sqlalchemy import text
+    from chat_database import ChatDatabase
+    from db_config import db_manager
+    from models import MessageResponse
+
+    db = ChatDatabase()
+    user_id = "bench_user"
+
+    def operation(user: int, index: int) -> bool:
+        message = MessageResponse(
+            message_id=str(uuid.uuid4()),
+            genie_message_id=str(uuid.uuid4()),
+            content=QUESTIONS[index % len(QUESTIONS)],
+            role="user",
+            timestamp=datetime.now(timezone.utc)
+        )
+        db.save_message_to_session(f"bench-{user}-{index // 4}", user_id, message, f"bench-conversation-{user}")
+        return True
+
+    try:
+        return run_concurrently("db", operation, args.users, args.questions, args.trace_memory)
+    finally:
+        with db_manager.managed_connection() as conn:
+            conn.execute(text("DELETE FROM genie_messages WHERE user_id = :user_id"), {"user_id": user_id})
+            conn.execute(text("DELETE FROM genie_sessions WHERE user_id = :user_id"), {"user_id": user_id})
+            conn.commit()
+
+SCENARIOS = {"genie": scenario_genie, "followup": scenario_followup, "process": scenario_process, "db": scenario_db}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run; repeatable (default: genie and process)")
+    parser.add_argument("--users", type=int, default=8, help="concurrent simulated users")
+    parser.add_argument("--questions", type=int, default=5, help="operations per user")
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="GENIE_POLL_INTERVAL for the client")
+    parser.add_argument("--genie-url", help="use an already running stand-in instead of starting one")
+    parser.add_argument("--trace-memory", action="store_true", help="measure peak Python allocations with tracemalloc")
+    parser.add_argument("--json", help="also write results to this file")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+    scenarios = args.scenario or ["genie", "process"]
+
+    server = None
+    url = args.genie_url
+    if not url:
+        server = GenieStubServer(settings_from_args(args)).start()
+        url = server.url
+
+    # Must be set before the app modules read their configuration
+    os.environ.update({
+        "DATABRICKS_HOST": url,
+        "DATABRICKS_CLIENT_ID": os.getenv("DATABRICKS_CLIENT_ID", "bench"),
+        "DATABRICKS_CLIENT_SECRET": os.getenv("DATABRICKS_CLIENT_SECRET", "bench"),
+        "SPACE_ID": "bench",
+        "GENIE_POLL_INTERVAL": str(args.poll_interval),
+    })
+    logging.basicConfig(level=logging.WARNING)
+    if "db" not in scenarios:
+        # Without a database the background recorder's retries are expected noise
+        for name in ("chat_recorder", "chat_database", "db_config"):
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    print(f"Genie stand-in at {url}; {args.users} users x {args.questions} operations")
+    results = []
+    try:
+        for name in scenarios:
+            result = SCENARIOS[name](args)
+            print_result(result)
+            results.append(result)
+    finally:
+        if server:
+            print(f"stand-in requests: {json.dumps(server.state.request_counts, sort_keys=True)}")
+            server.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Cost of logging on request threads: the former logging.basicConfig setup,
+where every call formats its message and writes it to the stream under the
+handler lock, against the buffered pipeline in structured_logging, with
+and without sampling.
+
+Each of --threads threads logs --records per-question records, as the Genie
+client does, plus one warning in every 100. The caller-side time of each call
+is recorded; the writer thread's is not, but it competes for the GIL.
+
+    python benchmarks/bench_logging.py --threads 8 --records 20000
+    python benchmarks/bench_logging.py --write-delay 0.0001
+
+Writes go to --output (default: the null device). --write-delay makes every
+write block for that many seconds, like stdout piped to a log collector that
+is falling behind.
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import LoggingConfig
+from structured_logging import LOG_RECORDS, LogPipeline, log_fields
+
+QUESTION = "Which team lost the most matches in the NFL league during the 2024 season?"
+
+def run_threads(threads: int, records: int, log_call) -> dict:
+    latencies = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index: int) -> None:
+        conversation_id = f"conversation-{index}"
+        barrier.wait()
+        for i in range(records):
+            start = time.perf_counter()
+            log_call(conversation_id, i)
+            latencies[index].append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    samples = sorted(latency for thread_latencies in latencies for latency in thread_latencies)
+    return {
+        "elapsed": elapsed,
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p99_us": samples[int(len(samples) * 0.99)] * 1e6,
+    }
+
+def eager_call(logger: logging.Logger):
+    def call(conversation_id: str, i: int) -> None:
+        if i % 100 == 0:
+            logger.warning(f"Polling for message {i} in conversation {conversation_id} is slow")
+        else:
+            logger.info(f"Continuing conversation {conversation_id} with question: {QUESTION[:30]}...")
+    return call
+
+def lazy_call(logger: logging.Logger):
+    def call(conversation_id: str, i: int) -> None:
+        if i % 100 == 0:
+            logger.warning("Polling for message %s is slow", i, extra=log_fields(conversation_id=conversation_id))
+        else:
+            logger.info("Continuing conversation with question: %s...", QUESTION[:30],
+                        extra=log_fields(conversation_id=conversation_id))
+    return call
+
+class SlowStream:
+    """A stream whose writes block, releasing the GIL as a full pipe does"""
+    def __init__(self, stream, delay: float):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        return self.stream.write(text)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+def reset_root() -> None:
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8, help="concurrent logging threads")
+    parser.add_argument("--records", type=int, default=20000, help="records per thread")
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="rate for the sampled run")
+    parser.add_argument("--buffer-size", type=int, default=10000, help="LOG_BUFFER_SIZE for the pipeline runs")
+    parser.add_argument("--output", default=os.devnull, help="where records are written")
+    parser.add_argument("--write-delay", type=float, default=0.0, help="seconds each write blocks")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench.genie_room")
+    with open(args.output, "a") as output:
+        stream = SlowStream(output, args.write_delay) if args.write_delay else output
+        sys.stderr, original_stderr = stream, sys.stderr
+        try:
+            reset_root()
+            logging.basicConfig(level=logging.INFO, stream=stream)
+            results = [("basicConfig, eager f-strings", run_threads(args.threads, args.records, eager_call(logger)), None)]
+
+            for label, rates in (("async pipeline", ""), (f"async pipeline, sampled {args.sample_rate}", f"bench={args.sample_rate}")):
+                reset_root()
+                before = {outcome: LOG_RECORDS.value(outcome=outcome) for outcome in ("written", "sampled", "dropped")}
+                pipeline = LogPipeline()
+                pipeline.configure(LoggingConfig(level="INFO", buffer_size=args.buffer_size, sample_rates=rates))
+                result = run_threads(args.threads, args.records, lazy_call(logger))
+                drain_start = time.perf_counter()
+                pipeline.stop()
+                result["drain"] = time.perf_counter() - drain_start
+                counts = {outcome: LOG_RECORDS.value(outcome=outcome) - before[outcome] for outcome in before}
+                results.append((label, result, counts))
+        finally:
+            sys.stderr = original_stderr
+            reset_root()
+
+    total = args.threads * args.records
+    print(f"{args.threads} threads x {args.records} records to {args.output}, writes blocking {args.write_delay * 1e6:.0f} us")
+    for label, result, counts in results:
+        line = (f"{label:>34}: mean {result['mean_us']:6.1f} us  p50 {result['p50_us']:6.1f} us  "
+                f"p99 {result['p99_us']:7.1f} us  {total / result['elapsed']:9.0f} calls/s")
+        if counts:
+            line += (f"  written {counts['written']:.0f} sampled {counts['sampled']:.0f} dropped {counts['dropped']:.0f}"
+                     f"  drain {result['drain'] * 1000:.0f} ms")
+        print(line)
+
+if __name__ == "__main__":
+    main()
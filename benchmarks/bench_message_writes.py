@@ -0,0 +1,100 @@
+"""
+Per-message latency of ChatDatabase.save_message_to_session before and after
+the single-round-trip prepared write.
+
+"before" replays the previous write path: SELECT the session, INSERT it when
+missing, INSERT the message and COMMIT, each as freshly parsed text() SQL.
+"after" is the current save_message_to_session.
+
+Run against a local Postgres by pointing DB_HOST, DB_PORT, DB_NAME and
+DATABRICKS_CLIENT_ID (used as the database user) at it.
+
+    python benchmarks/bench_message_writes.py --messages 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from chat_database import ChatDatabase
+from db_config import db_manager
+from models import MessageResponse
+
+BENCH_USER = "bench_user"
+
+def legacy_save(session_id: str, user_id: str, message: MessageResponse, conversation_id: str) -> None:
+    with db_manager.managed_connection() as conn:
+        result = conn.execute(text(
+            'SELECT session_id FROM genie_sessions WHERE session_id = :session_id AND user_id = :user_id'
+        ), {'session_id': session_id, 'user_id': user_id})
+        if not result.fetchone():
+            conn.execute(text("""
+                INSERT INTO genie_sessions (session_id, user_id, conversation_id, first_query, created_at, is_active)
+                VALUES (:session_id, :user_id, :conversation_id, :first_query, :created_at, :is_active)
+            """), {'session_id': session_id, 'user_id': user_id, 'conversation_id': conversation_id,
+                   'first_query': message.content, 'created_at': message.timestamp, 'is_active': True})
+        conn.execute(text("""
+            INSERT INTO genie_messages (
+                message_id, genie_message_id, session_id, conversation_id, user_id, content, role,
+                status, query_text, created_at
+            ) VALUES (
+                :message_id, :genie_message_id, :session_id, :conversation_id, :user_id, :content, :role,
+                :status, :query_text, :created_at
+            )
+        """), {'message_id': message.message_id, 'genie_message_id': message.genie_message_id,
+               'session_id': session_id, 'conversation_id': conversation_id, 'user_id': user_id,
+               'content': message.content, 'role': message.role, 'status': 'COMPLETED',
+               'query_text': None, 'created_at': message.timestamp})
+        conn.commit()
+
+def measure(label: str, save, messages: int, per_session: int) -> None:
+    latencies = []
+    session_id = conversation_id = None
+    for index in range(messages):
+        # Mix session creation with follow-ups, as a chat does
+        if index % per_session == 0:
+            session_id, conversation_id = str(uuid.uuid4()), str(uuid.uuid4())
+        message = MessageResponse(
+            message_id=str(uuid.uuid4()),
+            genie_message_id=str(uuid.uuid4()),
+            content=f"benchmark message {index}",
+            role="user",
+            timestamp=datetime.now(timezone.utc)
+        )
+        start = time.perf_counter()
+        save(session_id, BENCH_USER, message, conversation_id)
+        latencies.append(time.perf_counter() - start)
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{label:>6}: mean={statistics.mean(latencies) * 1000:6.2f}ms  p50={quantiles[49] * 1000:6.2f}ms  "
+          f"p95={quantiles[94] * 1000:6.2f}ms  p99={quantiles[98] * 1000:6.2f}ms")
+
+def cleanup() -> None:
+    with db_manager.managed_connection() as conn:
+        conn.execute(text("DELETE FROM genie_messages WHERE user_id = :user_id"), {"user_id": BENCH_USER})
+        conn.execute(text("DELETE FROM genie_sessions WHERE user_id = :user_id"), {"user_id": BENCH_USER})
+        conn.commit()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000, help="messages written per variant")
+    parser.add_argument("--per-session", type=int, default=4, help="messages per chat session")
+    args = parser.parse_args()
+
+    db = ChatDatabase()
+    try:
+        # Warm the pool so both variants start from open connections
+        measure("warmup", db.save_message_to_session, 50, args.per_session)
+        measure("before", legacy_save, args.messages, args.per_session)
+        measure("after", db.save_message_to_session, args.messages, args.per_session)
+    finally:
+        cleanup()
+        db_manager.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Callbacks, server round trips and bytes on the wire for one question, as the
+Dash renderer issues them.
+
+The app's callback graph (/_dash-dependencies) is walked from the send
+button: every callback with an input changed by an earlier one fires. Server
+callbacks are posted to /_dash-update-component with the state a browser
+would hold, and their request and response sizes are recorded; clientside
+callbacks are counted but cost no request. Adding a chat to the sidebar fires
+callbacks with ALL inputs on chat items, as the renderer does; with nothing
+clicked they leave everything unchanged.
+
+The browser holds one open chat with --turns answered questions and --chats
+other chats, every answer showing a --rows row result. Two questions are
+measured: a follow-up in the open chat and the first question of a new chat.
+Progress polling while Genie works (progress-interval) is not counted.
+
+    python benchmarks/bench_question_callbacks.py --turns 10 --chats 20 --rows 100
+    python benchmarks/bench_question_callbacks.py --json callbacks.json
+
+A .env file in the working directory overrides the environment this script
+sets up, so run it from a checkout without one.
+"""
+import argparse
+import json
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from genie_stub_server import GenieStubServer, StubSettings
+
+QUESTION = "Which team lost the most matches in the NFL league?"
+SQL = "SELECT team, COUNT(*) AS losses FROM matches WHERE result = 'L' GROUP BY team ORDER BY losses DESC"
+
+def prop_key(component_id, prop: str) -> str:
+    """A property as the renderer names it in changedPropIds"""
+    if isinstance(component_id, dict):
+        component_id = json.dumps(component_id, sort_keys=True, separators=(",", ":"))
+    return f"{component_id}.{prop}"
+
+def parse_outputs(output: str) -> list:
+    """{id, property} of each output in a dependency's output string"""
+    outputs = []
+    for item in output.strip(".").split("..."):
+        component_id, prop = item.rsplit(".", 1)
+        if component_id.startswith("{"):
+            component_id = json.loads(component_id)
+        outputs.append({"id": component_id, "property": prop.split("@")[0]})
+    return outputs
+
+def load_dependencies(client) -> list:
+    """The callback graph, with pattern-matching ids parsed into dicts"""
+    dependencies = client.get("/_dash-dependencies").get_json()
+    for dependency in dependencies:
+        for item in dependency["inputs"] + dependency["state"]:
+            if item["id"].startswith("{"):
+                item["id"] = json.loads(item["id"])
+    return dependencies
+
+def find_components(value, found: dict) -> dict:
+    """Every component with a dict id in a layout value, grouped by id type"""
+    if isinstance(value, list):
+        for item in value:
+            find_components(item, found)
+    elif isinstance(value, dict):
+        props = value.get("props")
+        if isinstance(props, dict):
+            if isinstance(props.get("id"), dict):
+                found.setdefault(props["id"].get("type"), []).append(props)
+            for child in props.values():
+                find_components(child, found)
+        else:
+            for child in value.values():
+                find_components(child, found)
+    return found
+
+def layout_state(node, state: dict) -> dict:
+    """Properties of every component with a string id in the initial layout"""
+    if isinstance(node, list):
+        for item in node:
+            layout_state(item, state)
+    elif isinstance(node, dict) and isinstance(node.get("props"), dict):
+        props = node["props"]
+        if isinstance(props.get("id"), str):
+            for prop, value in props.items():
+                state[prop_key(props["id"], prop)] = value
+        layout_state(props.get("children"), state)
+    return state
+
+class QuestionWalk:
+    """Fires the callbacks one question sets off and measures the server ones"""
+    def __init__(self, client, dependencies: list, state: dict, added: dict):
+        self.client = client
+        self.dependencies = dependencies
+        self.state = state
+        self.added = added  # changed property -> component type it adds, firing ALL inputs on that type
+
+    def _value(self, dependency_input: dict):
+        component_id, prop = dependency_input["id"], dependency_input["property"]
+        if isinstance(component_id, dict):
+            components = []
+            for props in find_components(list(self.state.values()), {}).get(component_id["type"], []):
+                components.append({"id": props["id"], "property": prop, "value": props.get(prop)})
+            return components
+        return {"id": component_id, "property": prop, "value": self.state.get(prop_key(component_id, prop))}
+
+    def _post(self, dependency: dict, changed: list) -> tuple:
+        outputs = parse_outputs(dependency["output"])
+        body = json.dumps({
+            "output": dependency["output"],
+            # A single output is sent on its own, several as a list
+            "outputs": outputs if dependency["output"].startswith("..") else outputs[0],
+            "inputs": [self._value(item) for item in dependency["inputs"]],
+            "state": [self._value(item) for item in dependency["state"]],
+            "changedPropIds": changed,
+        }, default=str)
+        response = self.client.post("/_dash-update-component", data=body, content_type="application/json")
+        if response.status_code == 200:
+            for component_id, props in response.get_json().get("response", {}).items():
+                for prop, value in props.items():
+                    # Patches are applied by the renderer; later callbacks here only need whole values
+                    if not (isinstance(value, dict) and "__dash_patch_update" in value):
+                        self.state[prop_key(component_id, prop)] = value
+        elif response.status_code != 204:
+            raise RuntimeError(f"{dependency['output']} returned {response.status_code}: {response.data[:200]}")
+        return len(body), len(response.data)
+
+    def run(self, start: str) -> dict:
+        fired, server, bytes_up, bytes_down = set(), [], 0, 0
+        clientside = 0
+        changed = [start]
+        while changed:
+            prop = changed.pop(0)
+            for index, dependency in enumerate(self.dependencies):
+                if index in fired or not self._triggered_by(dependency, prop):
+                    continue
+                fired.add(index)
+                added = prop in self.added
+                outputs = [prop_key(output["id"], output["property"]) for output in parse_outputs(dependency["output"])]
+                if dependency.get("clientside_function"):
+                    clientside += 1
+                else:
+                    up, down = self._post(dependency, [prop])
+                    bytes_up += up
+                    bytes_down += down
+                    server.append({"outputs": outputs, "bytes_up": up, "bytes_down": down})
+                # Fired by items being added, with nothing clicked, this app's callbacks change nothing
+                if not added:
+                    changed.extend(output for output in outputs if "{" not in output)
+        return {"clientside_callbacks": clientside, "server_requests": len(server), "bytes_up": bytes_up,
+                "bytes_down": bytes_down, "server_callbacks": server}
+
+    def _triggered_by(self, dependency: dict, prop: str) -> bool:
+        for dependency_input in dependency["inputs"]:
+            component_id = dependency_input["id"]
+            if isinstance(component_id, dict):
+                if self.added.get(prop) == component_id.get("type") and "ALL" in json.dumps(component_id):
+                    return True
+            elif prop_key(component_id, dependency_input["property"]) == prop:
+                return True
+        return False
+
+def render_chat(app_module, key: str, turns: int, rows: int) -> dict:
+    """A chat-history-store entry whose messages are turns answered questions"""
+    import pandas as pd
+    from plotly.io.json import to_json_plotly
+    from models import AnswerPart, GenieResponse
+
+    df = pd.DataFrame({f"column_{j}": [str(i * (j + 1)) for i in range(rows)] for j in range(5)})
+    messages = []
+    for turn in range(turns):
+        messages.append(app_module.render_user_message(QUESTION))
+        answer = GenieResponse(conversation_id=f"conversation-{key}", message_id=f"{key}-{turn}", parts=[
+            AnswerPart(kind="text", text="Here are the teams with the most losses."),
+            AnswerPart(kind="query", attachment_id=f"{key}-{turn}", query_text=SQL, data=df),
+        ])
+        messages.append(app_module.render_bot_response(answer, query_index=f"{key}-{turn}"))
+    return {"key": key, "session_id": key, "conversation_id": f"conversation-{key}",
+            "queries": [QUESTION] * turns, "messages": json.loads(to_json_plotly(messages))}
+
+def scenario_state(app_module, initial: dict, chats: list, open_key, question_id: str) -> dict:
+    """Client state right before the send button is clicked"""
+    from plotly.io.json import to_json_plotly
+
+    open_entry = next((chat for chat in chats if chat["key"] == open_key), None)
+    chat_list = [app_module.render_chat_item(chat, active=chat["key"] == open_key) for chat in chats]
+    session = {"current_session": open_key, "conversation_id": open_entry["conversation_id"]} if open_entry else {"current_session": None}
+    return {
+        **initial,
+        "chat-input-fixed.value": QUESTION,
+        "send-button-fixed.n_clicks": 1,
+        "chat-messages.children": open_entry["messages"] if open_entry else [],
+        "chat-history-store.data": chats,
+        "chat-list.children": json.loads(to_json_plotly(chat_list)),
+        "session-store.data": session,
+        # As the send button's clientside callback leaves it
+        "chat-trigger.data": {"message": QUESTION, "question_id": question_id,
+                              "session_key": open_key or uuid.uuid4().hex, "conversation_id": session.get("conversation_id")},
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=10, help="answered questions in the open chat")
+    parser.add_argument("--chats", type=int, default=20, help="other chats in the sidebar, each with --turns answers")
+    parser.add_argument("--rows", type=int, default=100, help="rows in each shown result")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    with GenieStubServer(StubSettings(completion_time=0.1, rows=args.rows)) as server:
+        os.environ.update({
+            "DATABRICKS_HOST": server.url,
+            "DATABRICKS_CLIENT_ID": os.getenv("DATABRICKS_CLIENT_ID", "bench"),
+            "DATABRICKS_CLIENT_SECRET": os.getenv("DATABRICKS_CLIENT_SECRET", "bench"),
+            "SPACE_ID": "bench",
+            "GENIE_POLL_INTERVAL": "0.05",
+            "SIMILAR_QUESTIONS": "false",
+        })
+        import app as app_module
+
+        client = app_module.app.server.test_client()
+        dependencies = load_dependencies(client)
+        initial = layout_state(client.get("/_dash-layout").get_json(), {})
+        chats = [render_chat(app_module, f"chat-{i}", args.turns, args.rows) for i in range(args.chats + 1)]
+
+        results = []
+        for name, open_key, added in (("follow_up", "chat-0", {}),
+                                      ("new_chat", None, {"chat-list.children": "chat-item"})):
+            state = scenario_state(app_module, initial, chats, open_key, uuid.uuid4().hex)
+            result = {"scenario": name, **QuestionWalk(client, dependencies, state, added).run("send-button-fixed.n_clicks")}
+            results.append(result)
+            print(f"{name:>9}: {result['server_requests']} server requests, {result['clientside_callbacks']} clientside callbacks, "
+                  f"{result['bytes_up'] / 1024:8.1f} KiB up, {result['bytes_down'] / 1024:8.1f} KiB down")
+            for callback in result["server_callbacks"]:
+                print(f"           {callback['bytes_up'] / 1024:8.1f} KiB up {callback['bytes_down'] / 1024:8.1f} KiB down  "
+                      f"{', '.join(callback['outputs'])}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
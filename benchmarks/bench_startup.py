@@ -0,0 +1,134 @@
+"""
+Cold start of app.py: how long importing it takes, and how long until the
+first page has been served.
+
+Each run is a fresh interpreter. The "lazy" run imports the app as it is
+now, then serves "/" and "/_dash-layout". Every --eager step additionally
+does one piece of work the app used to do at import, timed on its own, so
+the output shows what each deferred initialization takes off the start-up
+path:
+  pandas    import pandas
+  sqlparse  import sqlparse
+  fastapi   import fastapi (previously imported by chat_database)
+  token     mint the first OAuth token
+  engine    create the database engine and start its pool threads
+  schema    connect and run the CREATE TABLE IF NOT EXISTS statements (needs --db)
+
+Tokens are minted against the local Genie stand-in; --db uses the database
+settings from the environment, as bench_message_writes.py does.
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 5 --db --json startup.json
+
+A .env file in the working directory overrides the environment this script
+sets up, so run it from a checkout without one.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from genie_stub_server import GenieStubServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _initialize_schema():
+    from chat_database import ChatDatabase
+    ChatDatabase().initialize()
+
+def _create_engine():
+    from db_config import db_manager
+    return db_manager.engine
+
+def _mint_token():
+    from token_minter import tokenminter
+    return tokenminter.get_token()
+
+EAGER_STEPS = {
+    "pandas": lambda: __import__("pandas"),
+    "sqlparse": lambda: __import__("sqlparse"),
+    "fastapi": lambda: __import__("fastapi"),
+    "token": _mint_token,
+    "engine": _create_engine,
+    "schema": _initialize_schema,
+}
+
+def child(steps: list) -> None:
+    """Runs in the fresh interpreter; prints its timings as JSON"""
+    sys.path.insert(0, ROOT)
+    timings = {}
+    start = time.perf_counter()
+    import app
+    timings["import_app"] = time.perf_counter() - start
+
+    for step in steps:
+        step_start = time.perf_counter()
+        EAGER_STEPS[step]()
+        timings[step] = time.perf_counter() - step_start
+
+    client = app.app.server.test_client()
+    request_start = time.perf_counter()
+    for path in ("/", "/_dash-layout"):
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+    timings["first_request"] = time.perf_counter() - request_start
+    timings["time_to_first_request"] = time.perf_counter() - start
+    print(json.dumps(timings))
+
+def run(steps: list, env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", *steps],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(name: str, runs: list) -> dict:
+    return {"mode": name, **{key: round(statistics.median(run[key] for run in runs) * 1000, 1) for key in runs[0]}}
+
+def print_result(result: dict) -> None:
+    steps = "  ".join(f"{key}={value:.1f}" for key, value in result.items()
+                      if key not in ("mode", "import_app", "first_request", "time_to_first_request"))
+    print(f"{result['mode']:>6}: import {result['import_app']:7.1f} ms  first request {result['first_request']:6.1f} ms  "
+          f"time to first request {result['time_to_first_request']:7.1f} ms  {steps}")
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per mode; medians are reported")
+    parser.add_argument("--eager", action="append", choices=sorted(EAGER_STEPS),
+                        help="step for the eager run; repeatable (default: all except schema, which needs --db)")
+    parser.add_argument("--db", action="store_true", help="include the schema step against a real database")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+    steps = args.eager or [step for step in EAGER_STEPS if step != "schema" or args.db]
+
+    with GenieStubServer() as server:
+        env = {
+            **os.environ,
+            "DATABRICKS_HOST": server.url,
+            "DATABRICKS_CLIENT_ID": os.getenv("DATABRICKS_CLIENT_ID", "bench"),
+            "DATABRICKS_CLIENT_SECRET": os.getenv("DATABRICKS_CLIENT_SECRET", "bench"),
+            "SPACE_ID": "bench",
+        }
+        print(f"Genie stand-in at {server.url}; {args.runs} runs per mode")
+        results = []
+        for name, mode_steps in (("lazy", []), ("eager", steps)):
+            result = summarize(name, [run(mode_steps, env) for _ in range(args.runs)])
+            print_result(result)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Token endpoint calls and get_token stalls with several worker processes,
+each minting its own tokens against sharing them through the file-locked
+token cache.
+
+Every process runs --threads threads calling get_token every few
+milliseconds for --duration seconds, as request threads and new database
+connections do, with tokens living --lifetime seconds and refreshed
+--margin seconds before they expire. The token endpoint is the local
+stand-in, answering after its configured latency. Each thread's first call,
+waiting for the process's first token, is not counted.
+
+    python benchmarks/bench_token_cache.py --processes 8 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from genie_stub_server import GenieStubServer, StubSettings
+
+# A get_token call slower than this waited on a refresh
+STALL_SECONDS = 0.005
+
+def worker(url: str, cache_dir, args, results) -> None:
+    from token_minter import TokenMinter
+
+    minter = TokenMinter("bench", "bench", url, cache_dir=cache_dir)
+    minter.lifetime = timedelta(seconds=args.lifetime)
+    minter.refresh_margin = timedelta(seconds=args.margin)
+    latencies = []
+    deadline = time.monotonic() + args.duration
+
+    def call_repeatedly() -> None:
+        # The first call waits for the process's first token, however tokens are shared
+        minter.get_token()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            minter.get_token()
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.002)
+
+    threads = [threading.Thread(target=call_repeatedly) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stalls = [latency for latency in latencies if latency > STALL_SECONDS]
+    results.put({"calls": len(latencies), "stalls": len(stalls), "stalled_seconds": sum(stalls),
+                 "max": max(latencies)})
+
+def run(server: GenieStubServer, cache_dir, args) -> dict:
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    before = server.state.token_count
+    processes = [context.Process(target=worker, args=(server.url, cache_dir, args, results)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    per_process = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {
+        "token_requests": server.state.token_count - before,
+        "calls": sum(result["calls"] for result in per_process),
+        "stalls": sum(result["stalls"] for result in per_process),
+        "stalled_seconds": sum(result["stalled_seconds"] for result in per_process),
+        "max": max(result["max"] for result in per_process),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=8, help="worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="threads per process calling get_token")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds each run lasts")
+    parser.add_argument("--lifetime", type=float, default=3.0, help="seconds a token is used for")
+    parser.add_argument("--margin", type=float, default=1.0, help="seconds before expiry a token is refreshed")
+    parser.add_argument("--latency", type=float, default=0.05, help="token endpoint latency in seconds")
+    args = parser.parse_args()
+
+    with GenieStubServer(StubSettings(latency=args.latency, latency_jitter=0.0)) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        cache_dir = os.path.join(directory, "tokens")
+        for label, directory_for_run in (("per process", None), ("shared cache", cache_dir)):
+            result = run(server, directory_for_run, args)
+            print(f"{label:>12}: {result['token_requests']:4d} token requests, {result['stalls']:4d} stalled calls "
+                  f"({result['stalled_seconds'] * 1000:7.0f} ms in total, longest {result['max'] * 1000:5.0f} ms) "
+                  f"of {result['calls']} get_token calls")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Local stand-in for the Databricks endpoints GenieClient and TokenMinter use.
+
+Implements /oidc/v1/token, the Genie start-conversation, messages,
+query-result and execute-query endpoints, and SQL statement result chunks,
+with configurable latency, completion time, result size and chunking, and
+429/5xx injection, so the app and the benchmarks can run without a workspace.
+
+    python benchmarks/genie_stub_server.py --port 8765 --completion-time 3 --rows 5000
+
+Then point the app at it:
+
+    DATABRICKS_HOST=http://127.0.0.1:8765 SPACE_ID=stub GENIE_POLL_INTERVAL=0.5 python app.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# Status sequence a message moves through before COMPLETED, as the real API reports it
+STATUS_SEQUENCE = ["SUBMITTED", "FILTERING_CONTEXT", "ASKING_AI", "PENDING_WAREHOUSE", "EXECUTING_QUERY"]
+
+@dataclass
+class StubSettings:
+    latency: float = 0.05
+    latency_jitter: float = 0.02
+    completion_time: float = 2.0
+    rows: int = 100
+    columns: int = 5
+    chunk_rows: int = 0  # rows per result chunk, followed via next_chunk_index; 0 returns everything inline
+    execute_changes: bool = False  # execute-query returns different rows on every run
+    text_ratio: float = 0.2
+    query_attachments: int = 1
+    error_rate_429: float = 0.0
+    error_rate_5xx: float = 0.0
+    conversation_ttl: float = 0.0  # seconds before a conversation "expires"; 0 keeps them forever
+
+class StubState:
+    """Conversations and messages held by the stand-in"""
+    def __init__(self, settings: StubSettings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.conversations: Dict[str, float] = {}
+        self.messages: Dict[str, dict] = {}
+        self.token_count = 0
+        self.request_counts: Dict[str, int] = {}
+        self._data_cache: Dict[tuple, list] = {}
+        self.executions: Dict[str, int] = {}
+
+    def count(self, endpoint: str) -> None:
+        with self.lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+
+    def new_message(self, conversation_id: str, content: str) -> dict:
+        message_id = uuid.uuid4().hex
+        # Text answers are chosen deterministically from the question so repeats behave the same
+        is_text = (zlib.crc32(content.encode()) % 1000) / 1000 < self.settings.text_ratio
+        message = {
+            "id": message_id,
+            "message_id": message_id,
+            "conversation_id": conversation_id,
+            "content": content,
+            "created": time.time(),
+            "is_text": is_text,
+            "attachment_ids": [uuid.uuid4().hex for _ in range(max(1, self.settings.query_attachments))],
+        }
+        with self.lock:
+            self.conversations.setdefault(conversation_id, time.time())
+            self.messages[message_id] = message
+        return message
+
+    def conversation_alive(self, conversation_id: str) -> bool:
+        created = self.conversations.get(conversation_id)
+        if created is None:
+            return False
+        ttl = self.settings.conversation_ttl
+        return not ttl or time.time() - created < ttl
+
+    def message_view(self, message: dict) -> dict:
+        elapsed = time.time() - message["created"]
+        progress = elapsed / self.settings.completion_time if self.settings.completion_time else 1.0
+        if progress >= 1.0:
+            status = "COMPLETED"
+        else:
+            status = STATUS_SEQUENCE[min(len(STATUS_SEQUENCE) - 1, int(progress * len(STATUS_SEQUENCE)))]
+        view = {
+            "id": message["id"],
+            "message_id": message["message_id"],
+            "conversation_id": message["conversation_id"],
+            "content": message["content"],
+            "status": status,
+        }
+        # The generated SQL is visible from EXECUTING_QUERY on, before the result is ready
+        if status in ("EXECUTING_QUERY", "COMPLETED"):
+            if message["is_text"]:
+                view["attachments"] = [{
+                    "attachment_id": message["attachment_ids"][0],
+                    "text": {"content": f"Stub answer to: {message['content']}"},
+                }]
+            else:
+                view["attachments"] = [{
+                    "attachment_id": attachment_id,
+                    "query": {
+                        "query": f"SELECT * FROM stub.results_{index} LIMIT {self.settings.rows}",
+                        "description": f"Stub query {index}",
+                    },
+                } for index, attachment_id in enumerate(message["attachment_ids"])]
+        return view
+
+    def data_array(self, seed: str, cache: bool = True) -> list:
+        key = (seed, self.settings.rows, self.settings.columns)
+        with self.lock:
+            cached = self._data_cache.get(key)
+        if cached is None:
+            rng = random.Random(seed)
+            cached = [[f"r{row}c{column}" if column == 0 else str(rng.randint(0, 10000))
+                       for column in range(self.settings.columns)] for row in range(self.settings.rows)]
+            if cache:
+                with self.lock:
+                    self._data_cache[key] = cached
+        return cached
+
+    def result_chunk(self, attachment_id: str, chunk_index: int) -> dict:
+        data = self.data_array(attachment_id)
+        size = self.settings.chunk_rows or len(data) or 1
+        start = chunk_index * size
+        chunk = {"chunk_index": chunk_index, "row_offset": start, "data_array": data[start:start + size]}
+        if start + size < len(data):
+            chunk["next_chunk_index"] = chunk_index + 1
+        return chunk
+
+    def query_result(self, attachment_id: str) -> dict:
+        return {
+            "statement_response": {
+                # Chunks are served by statement id, so it carries the attachment id
+                "statement_id": f"stmt-{attachment_id}",
+                "status": {"state": "SUCCEEDED"},
+                "manifest": {"schema": {"columns": [
+                    {"name": f"col_{column}", "type_name": "STRING" if column == 0 else "INT", "position": column}
+                    for column in range(self.settings.columns)
+                ]}, "total_row_count": self.settings.rows},
+                "result": self.result_chunk(attachment_id, 0),
+            }
+        }
+
+SPACE_PREFIX = r"/api/2\.0/genie/spaces/[^/]+"
+ROUTES = [
+    ("POST", re.compile(r"^/oidc/v1/token$"), "token"),
+    ("POST", re.compile(SPACE_PREFIX + r"/start-conversation$"), "start_conversation"),
+    ("POST", re.compile(SPACE_PREFIX + r"/conversations/(?P<cid>[^/]+)/messages$"), "send_message"),
+    ("GET", re.compile(SPACE_PREFIX + r"/conversations/(?P<cid>[^/]+)/messages/(?P<mid>[^/]+)$"), "get_message"),
+    ("GET", re.compile(SPACE_PREFIX + r"/conversations/(?P<cid>[^/]+)/messages/(?P<mid>[^/]+)/attachments/(?P<aid>[^/]+)/query-result$"), "query_result"),
+    ("POST", re.compile(SPACE_PREFIX + r"/conversations/(?P<cid>[^/]+)/messages/(?P<mid>[^/]+)/attachments/(?P<aid>[^/]+)/execute-query$"), "execute_query"),
+    ("GET", re.compile(r"^/api/2\.0/sql/statements/stmt-(?P<aid>[^/]+)/result/chunks/(?P<index>\d+)$"), "result_chunk"),
+]
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        path = self.path.split("?", 1)[0]
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                break
+        else:
+            return self._send(404, {"error_code": "NOT_FOUND", "message": f"No route for {method} {path}"})
+
+        settings = self.state.settings
+        self.state.count(name)
+        time.sleep(max(0.0, settings.latency + random.uniform(-settings.latency_jitter, settings.latency_jitter)))
+        if name != "token":
+            roll = random.random()
+            if roll < settings.error_rate_429:
+                return self._send(429, {"error_code": "RESOURCE_EXHAUSTED", "message": "Too Many Requests"}, {"Retry-After": "1"})
+            if roll < settings.error_rate_429 + settings.error_rate_5xx:
+                return self._send(503, {"error_code": "TEMPORARILY_UNAVAILABLE", "message": "Injected failure"})
+
+        body = {}
+        if raw and self.headers.get("Content-Type", "").startswith("application/json"):
+            body = json.loads(raw)
+        getattr(self, f"_{name}")(body, **match.groupdict())
+
+    def _send(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _token(self, body):
+        with self.state.lock:
+            self.state.token_count += 1
+            count = self.state.token_count
+        self._send(200, {"access_token": f"stub-token-{count}", "token_type": "Bearer", "expires_in": 3600})
+
+    def _start_conversation(self, body):
+        message = self.state.new_message(uuid.uuid4().hex, body.get("content", ""))
+        self._send(200, {
+            "conversation_id": message["conversation_id"],
+            "message_id": message["message_id"],
+            "conversation": {"id": message["conversation_id"]},
+            "message": self.state.message_view(message),
+        })
+
+    def _send_message(self, body, cid):
+        if not self.state.conversation_alive(cid):
+            return self._send(404, {"error_code": "NOT_FOUND", "message": "Conversation not found"})
+        message = self.state.new_message(cid, body.get("content", ""))
+        self._send(200, self.state.message_view(message))
+
+    def _get_message(self, body, cid, mid):
+        message = self.state.messages.get(mid)
+        if not message or message["conversation_id"] != cid:
+            return self._send(404, {"error_code": "NOT_FOUND", "message": "Message not found"})
+        self._send(200, self.state.message_view(message))
+
+    def _query_result(self, body, cid, mid, aid):
+        message = self.state.messages.get(mid)
+        if not message or aid not in message["attachment_ids"]:
+            return self._send(404, {"error_code": "NOT_FOUND", "message": "Attachment not found"})
+        self._send(200, self.state.query_result(aid))
+
+    def _execute_query(self, body, cid, mid, aid):
+        if not self.state.settings.execute_changes:
+            return self._query_result(body, cid, mid, aid)
+        with self.state.lock:
+            run = self.state.executions[aid] = self.state.executions.get(aid, 0) + 1
+        result = self.state.query_result(aid)
+        # A fresh seed per run stands in for the underlying table changing
+        result["statement_response"]["result"]["data_array"] = self.state.data_array(f"{aid}:{run}", cache=False)
+        result["statement_response"]["result"].pop("next_chunk_index", None)
+        self._send(200, result)
+
+    def _result_chunk(self, body, aid, index):
+        self._send(200, self.state.result_chunk(aid, int(index)))
+
+class GenieStubServer:
+    """Runs the stand-in on a background thread; usable as a context manager"""
+    def __init__(self, settings: Optional[StubSettings] = None, host: str = "127.0.0.1", port: int = 0):
+        self.state = StubState(settings or StubSettings())
+        handler = type("BoundStubHandler", (StubHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "GenieStubServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="genie-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "GenieStubServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+def add_settings_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = StubSettings()
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="base seconds added to every request")
+    parser.add_argument("--latency-jitter", type=float, default=defaults.latency_jitter)
+    parser.add_argument("--completion-time", type=float, default=defaults.completion_time, help="seconds until a message is COMPLETED")
+    parser.add_argument("--rows", type=int, default=defaults.rows, help="rows per query result")
+    parser.add_argument("--columns", type=int, default=defaults.columns, help="columns per query result")
+    parser.add_argument("--execute-changes", action="store_true", help="execute-query returns different rows on every run")
+    parser.add_argument("--chunk-rows", type=int, default=defaults.chunk_rows, help="rows per result chunk; 0 returns results inline")
+    parser.add_argument("--text-ratio", type=float, default=defaults.text_ratio, help="fraction of questions answered with text")
+    parser.add_argument("--query-attachments", type=int, default=defaults.query_attachments, help="query attachments per data answer")
+    parser.add_argument("--error-rate-429", type=float, default=defaults.error_rate_429)
+    parser.add_argument("--error-rate-5xx", type=float, default=defaults.error_rate_5xx)
+    parser.add_argument("--conversation-ttl", type=float, default=defaults.conversation_ttl, help="seconds until follow-ups get 404; 0 never")
+
+def settings_from_args(args: argparse.Namespace) -> StubSettings:
+    return StubSettings(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        completion_time=args.completion_time,
+        rows=args.rows,
+        columns=args.columns,
+        chunk_rows=args.chunk_rows,
+        execute_changes=args.execute_changes,
+        text_ratio=args.text_ratio,
+        query_attachments=args.query_attachments,
+        error_rate_429=args.error_rate_429,
+        error_rate_5xx=args.error_rate_5xx,
+        conversation_ttl=args.conversation_ttl,
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = GenieStubServer(settings_from_args(args), host=args.host, port=args.port)
+    print(f"Genie stand-in listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
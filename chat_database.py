@@ -1,23 +1,360 @@
+import asyncio
 import threading
-from fastapi import HTTPException
 from datetime import datetime
 import logging
-from db_config import db_manager
-from models import MessageResponse
+from typing import Dict, List, Optional, Sequence, Tuple
+from db_config import db_manager, get_async_db_manager
+from models import ChatHistoryItem, MessageResponse, SearchHit
+from structured_logging import log_fields
+from result_blobs import RESULT_BLOB_WRITES, ResultBlob, decode_result, result_blob_index
 from sqlalchemy import text
 import time
 
 logger = logging.getLogger(__name__)
 
+# Statements shared by the sync and async databases
+SCHEMA_STATEMENTS = [
+    # Create genie_sessions table
+    text("""
+        CREATE TABLE IF NOT EXISTS genie_sessions (
+            session_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            conversation_id TEXT NOT NULL,
+            first_query TEXT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE
+        )
+    """),
+    # Create genie_messages table
+    text("""
+        CREATE TABLE IF NOT EXISTS genie_messages (
+            message_id TEXT PRIMARY KEY,
+            genie_message_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            conversation_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            role TEXT NOT NULL,
+            status TEXT DEFAULT 'completed',
+            query_text TEXT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES genie_sessions(session_id)
+        )
+    """),
+    # Create genie_message_ratings table
+    text("""
+        CREATE TABLE IF NOT EXISTS genie_message_ratings (
+            message_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            rating TEXT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (message_id, user_id),
+            FOREIGN KEY (message_id) REFERENCES genie_messages(message_id)
+        )
+    """),
+    # Query results of answers, stored once per distinct content and shared by every
+    # message referencing them
+    text("""
+        CREATE TABLE IF NOT EXISTS genie_result_blobs (
+            result_hash TEXT PRIMARY KEY,
+            data BYTEA NOT NULL,
+            raw_bytes BIGINT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+    """),
+    text("ALTER TABLE genie_messages ADD COLUMN IF NOT EXISTS result_hashes TEXT[]"),
+    # Indexes backing the keyset-paginated history reads
+    text("""
+        CREATE INDEX IF NOT EXISTS genie_sessions_user_created_idx
+        ON genie_sessions (user_id, created_at, session_id)
+    """),
+    text("""
+        CREATE INDEX IF NOT EXISTS genie_messages_session_created_idx
+        ON genie_messages (session_id, created_at, message_id)
+    """),
+]
+
+# Full-text search over questions, answers and SQL, plus trigram matching of questions.
+# Kept apart from SCHEMA_STATEMENTS because pg_trgm may not be installable; chat
+# storage works without it, only search is disabled. Postgres maintains the
+# generated column and both indexes on every write.
+SEARCH_SCHEMA_STATEMENTS = [
+    text("CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+    # Answers embed result rows, so only their start is indexed; to_tsvector rejects values over 1MB
+    text("""
+        ALTER TABLE genie_messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            to_tsvector('english', left(coalesce(content, ''), 20000) || ' ' || coalesce(query_text, ''))
+        ) STORED
+    """),
+    text("""
+        CREATE INDEX IF NOT EXISTS genie_messages_search_idx
+        ON genie_messages USING GIN (search_vector)
+    """),
+    text("""
+        CREATE INDEX IF NOT EXISTS genie_messages_question_trgm_idx
+        ON genie_messages USING GIN (content gin_trgm_ops) WHERE role = 'user'
+    """),
+    # Questions and answers of one turn share their Genie message id
+    text("""
+        CREATE INDEX IF NOT EXISTS genie_messages_genie_message_idx
+        ON genie_messages (genie_message_id)
+    """),
+]
+
+# One hit per question and answer turn, ranked by the better of the full-text rank
+# of either message and the trigram similarity of the question
+SEARCH_MESSAGES_SQL = text("""
+    WITH search AS (
+        SELECT websearch_to_tsquery('english', :query) AS tsquery
+    ), hits AS (
+        SELECT m.genie_message_id,
+               max(greatest(
+                   ts_rank_cd(m.search_vector, search.tsquery),
+                   CASE WHEN m.role = 'user' THEN similarity(m.content, :query) ELSE 0 END
+               )) AS score
+        FROM genie_messages m, search
+        WHERE m.user_id = :user_id
+          AND (m.search_vector @@ search.tsquery OR (m.role = 'user' AND m.content % :query))
+        GROUP BY m.genie_message_id
+    )
+    SELECT hits.genie_message_id, hits.score, question.session_id, question.conversation_id,
+           question.content AS question, question.created_at, answer.query_text, s.first_query
+    FROM hits
+    JOIN genie_messages question
+      ON question.genie_message_id = hits.genie_message_id AND question.role = 'user' AND question.user_id = :user_id
+    JOIN genie_sessions s ON s.session_id = question.session_id AND s.is_active
+    LEFT JOIN genie_messages answer
+      ON answer.genie_message_id = hits.genie_message_id AND answer.role = 'assistant' AND answer.user_id = :user_id
+    ORDER BY hits.score DESC, question.created_at DESC, hits.genie_message_id
+    LIMIT :limit OFFSET :offset
+""")
+
+def _search_params(user_id: str, query: str, limit: int, offset: int) -> dict:
+    return {"user_id": user_id, "query": query, "limit": limit + 1, "offset": offset}
+
+def _search_page(rows: list, limit: int, offset: int) -> Tuple[List[SearchHit], Optional[int]]:
+    hits = [SearchHit(
+        genie_message_id=row.genie_message_id,
+        session_id=row.session_id,
+        conversation_id=row.conversation_id,
+        question=row.question,
+        first_query=row.first_query,
+        query_text=row.query_text,
+        created_at=row.created_at,
+        score=float(row.score)
+    ) for row in rows[:limit]]
+    return hits, offset + limit if len(rows) > limit else None
+
+# Session upsert and message insert in one statement. The session row is created if
+# missing, and replays of the same message are no-ops; foreign keys are checked at the
+# end of the statement, so the message may reference the session inserted alongside it.
+_SAVE_MESSAGE_BODY = """
+    WITH new_session AS (
+        INSERT INTO genie_sessions (session_id, user_id, conversation_id, first_query, created_at, is_active)
+        VALUES ({session_id}, {user_id}, {conversation_id}, {content}, {created_at}, TRUE)
+        ON CONFLICT (session_id) DO NOTHING
+    )
+    INSERT INTO genie_messages (
+        message_id, genie_message_id, session_id, conversation_id, user_id, content, role,
+        status, query_text, created_at
+    ) VALUES (
+        {message_id}, {genie_message_id}, {session_id}, {conversation_id}, {user_id}, {content}, {role},
+        'COMPLETED', {query_text}, {created_at}
+    )
+    ON CONFLICT (message_id) DO NOTHING
+"""
+_SAVE_MESSAGE_PARAMS = ["session_id", "user_id", "conversation_id", "content", "created_at",
+                        "message_id", "genie_message_id", "role", "query_text"]
+_SAVE_MESSAGE_TYPES = ["text", "text", "text", "text", "timestamptz", "text", "text", "text", "text"]
+
+# asyncpg prepares and caches statements itself, so the async path binds the body directly
+SAVE_MESSAGE_SQL = text(_SAVE_MESSAGE_BODY.format(**{name: f":{name}" for name in _SAVE_MESSAGE_PARAMS}))
+
+# psycopg2 has no statement cache, so the sync path prepares it once per physical connection
+SAVE_MESSAGE_STATEMENT = "genie_save_message"
+PREPARE_SAVE_MESSAGE_SQL = text(
+    f"PREPARE {SAVE_MESSAGE_STATEMENT} ({', '.join(_SAVE_MESSAGE_TYPES)}) AS "
+    + _SAVE_MESSAGE_BODY.format(**{name: f"${i}" for i, name in enumerate(_SAVE_MESSAGE_PARAMS, 1)})
+)
+EXECUTE_SAVE_MESSAGE_SQL = text(
+    f"EXECUTE {SAVE_MESSAGE_STATEMENT} ({', '.join(f':{name}' for name in _SAVE_MESSAGE_PARAMS)})"
+)
+
+# An answer and its results in one statement. Results this process has not stored
+# before are sent with their data and inserted unless another message stored them
+# first; the rest are referenced by hash only. Blobs are never deleted, so a hash
+# once stored stays valid.
+SAVE_MESSAGE_WITH_RESULTS_SQL = text("""
+    WITH new_session AS (
+        INSERT INTO genie_sessions (session_id, user_id, conversation_id, first_query, created_at, is_active)
+        VALUES (:session_id, :user_id, :conversation_id, :content, :created_at, TRUE)
+        ON CONFLICT (session_id) DO NOTHING
+    ), sent AS (
+        INSERT INTO genie_result_blobs (result_hash, data, raw_bytes)
+        SELECT * FROM unnest(CAST(:blob_hashes AS TEXT[]), CAST(:blob_data AS BYTEA[]), CAST(:blob_sizes AS BIGINT[]))
+        ON CONFLICT (result_hash) DO NOTHING
+    )
+    INSERT INTO genie_messages (
+        message_id, genie_message_id, session_id, conversation_id, user_id, content, role,
+        status, query_text, created_at, result_hashes
+    ) VALUES (
+        :message_id, :genie_message_id, :session_id, :conversation_id, :user_id, :content, :role,
+        'COMPLETED', :query_text, :created_at, CAST(:result_hashes AS TEXT[])
+    )
+    ON CONFLICT (message_id) DO NOTHING
+""")
+
+SELECT_RESULT_BLOBS_SQL = text("""
+    SELECT result_hash, data, raw_bytes
+    FROM genie_result_blobs
+    WHERE result_hash = ANY(CAST(:result_hashes AS TEXT[]))
+""")
+
+DELETE_RATING_SQL = text("""
+    DELETE FROM genie_message_ratings
+    WHERE message_id = :message_id AND user_id = :user_id
+""")
+
+UPSERT_RATING_SQL = text("""
+    INSERT INTO genie_message_ratings (message_id, user_id, rating)
+    VALUES (:message_id, :user_id, :rating)
+    ON CONFLICT(message_id, user_id) DO UPDATE SET rating = EXCLUDED.rating
+""")
+
+SELECT_RATING_SQL = text("""
+    SELECT rating
+    FROM genie_message_ratings
+    WHERE message_id = :message_id AND user_id = :user_id
+""")
+
+# Sessions newest first. Pages continue from the last row seen, (created_at, session_id)
+# being unique, so each page costs the same however far back it is.
+_SELECT_SESSIONS_BODY = """
+    SELECT session_id, conversation_id, first_query, created_at, is_active
+    FROM genie_sessions
+    WHERE user_id = :user_id AND is_active {after}
+    ORDER BY created_at DESC, session_id DESC
+    LIMIT :limit
+"""
+SELECT_SESSIONS_SQL = text(_SELECT_SESSIONS_BODY.format(after=""))
+SELECT_SESSIONS_BEFORE_SQL = text(_SELECT_SESSIONS_BODY.format(
+    after="AND (created_at, session_id) < (:cursor_created_at, :cursor_key)"))
+
+# A session's messages oldest first, paged the same way
+_SELECT_MESSAGES_BODY = """
+    SELECT message_id, genie_message_id, content, role, query_text, created_at
+    FROM genie_messages
+    WHERE session_id = :session_id AND user_id = :user_id {after}
+    ORDER BY created_at, message_id
+    LIMIT :limit
+"""
+SELECT_MESSAGES_SQL = text(_SELECT_MESSAGES_BODY.format(after=""))
+SELECT_MESSAGES_AFTER_SQL = text(_SELECT_MESSAGES_BODY.format(
+    after="AND (created_at, message_id) > (:cursor_created_at, :cursor_key)"))
+
+def encode_cursor(created_at: datetime, key: str) -> str:
+    """Opaque keyset cursor for the row with this created_at and id"""
+    return f"{created_at.isoformat()}|{key}"
+
+def _cursor_params(cursor: str) -> dict:
+    created_at, key = cursor.split("|", 1)
+    return {"cursor_created_at": datetime.fromisoformat(created_at), "cursor_key": key}
+
+def _page(rows: list, limit: int, key_column: str) -> Tuple[list, Optional[str]]:
+    """The first limit rows and the cursor of the next page; rows holds up to limit + 1"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, getattr(rows[-1], key_column))
+
+def _session_query(user_id: str, limit: int, before: Optional[str]):
+    params = {"user_id": user_id, "limit": limit + 1}
+    if before:
+        return SELECT_SESSIONS_BEFORE_SQL, {**params, **_cursor_params(before)}
+    return SELECT_SESSIONS_SQL, params
+
+def _message_query(session_id: str, user_id: str, limit: int, after: Optional[str]):
+    params = {"session_id": session_id, "user_id": user_id, "limit": limit + 1}
+    if after:
+        return SELECT_MESSAGES_AFTER_SQL, {**params, **_cursor_params(after)}
+    return SELECT_MESSAGES_SQL, params
+
+def _session_item(row) -> ChatHistoryItem:
+    return ChatHistoryItem(
+        conversationId=row.conversation_id,
+        firstQuery=row.first_query,
+        messages=[],  # Loaded separately with get_session_messages
+        timestamp=row.created_at,
+        isActive=row.is_active,
+        created_at=row.created_at,
+        session_id=row.session_id
+    )
+
+def _message_response(row) -> MessageResponse:
+    return MessageResponse(
+        message_id=row.message_id,
+        genie_message_id=row.genie_message_id,
+        content=row.content,
+        role=row.role,
+        timestamp=row.created_at,
+        created_at=row.created_at,
+        query_text=row.query_text
+    )
+
+def _save_message_params(session_id: str, user_id: str, message: MessageResponse, conversation_id: str, query_text: str = None) -> dict:
+    return {
+        'session_id': session_id,
+        'user_id': user_id,
+        'conversation_id': conversation_id,
+        'content': message.content,
+        'created_at': message.timestamp,
+        'message_id': message.message_id,
+        'genie_message_id': message.genie_message_id,
+        'role': message.role,
+        'query_text': query_text
+    }
+
+def _save_results_params(params: dict, results: Sequence[ResultBlob]) -> Tuple[dict, Dict[str, ResultBlob]]:
+    """Statement parameters for saving a message with its results, and the blobs sent with data"""
+    sent = {}
+    for blob in results:
+        if blob.result_hash not in result_blob_index:
+            sent[blob.result_hash] = blob
+    return {
+        **params,
+        'result_hashes': [blob.result_hash for blob in results],
+        'blob_hashes': list(sent),
+        'blob_data': [blob.data for blob in sent.values()],
+        'blob_sizes': [blob.raw_bytes for blob in sent.values()]
+    }, sent
+
+def _saved_results(results: Sequence[ResultBlob], sent: Dict[str, ResultBlob]) -> None:
+    """Remember results as stored once their message is committed"""
+    distinct = {blob.result_hash for blob in results}
+    RESULT_BLOB_WRITES.inc(len(sent), result="sent")
+    RESULT_BLOB_WRITES.inc(len(distinct) - len(sent), result="deduplicated")
+    result_blob_index.add(distinct)
+
+def _decoded_results(rows: list) -> Dict[str, "pd.DataFrame"]:
+    results = {row.result_hash: decode_result(row.data, row.raw_bytes) for row in rows}
+    result_blob_index.add(results)
+    return results
+
 class ChatDatabase:
+    """
+    Chat sessions, messages and ratings in Postgres.
+    The tables are created on first use rather than on construction, so
+    creating a ChatDatabase opens no connection.
+    """
     _initialized = False
     _init_lock = threading.Lock()
+    search_available = False
 
     def __init__(self):
         self.first_message_cache = {}
-        self._init_db()
-    
-    def _init_db(self):
+
+    def initialize(self):
         """Initialize database tables if they don't exist."""
         if not ChatDatabase._initialized:
             with ChatDatabase._init_lock:
@@ -25,148 +362,326 @@ class ChatDatabase:
                     try:
                         logger.info("Initializing database tables")
                         with db_manager.managed_connection() as conn:
-                            # Create genie_sessions table
-                            conn.execute(text("""
-                                CREATE TABLE IF NOT EXISTS genie_sessions (
-                                    session_id TEXT PRIMARY KEY,
-                                    user_id TEXT NOT NULL,
-                                    conversation_id TEXT NOT NULL,
-                                    first_query TEXT,
-                                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                                    is_active BOOLEAN DEFAULT TRUE
-                                )
-                            """))
-                            
-                            # Create genie_messages table
-                            conn.execute(text("""
-                                CREATE TABLE IF NOT EXISTS genie_messages (
-                                    message_id TEXT PRIMARY KEY,
-                                    genie_message_id TEXT NOT NULL,
-                                    session_id TEXT NOT NULL,
-                                    conversation_id TEXT NOT NULL,
-                                    user_id TEXT NOT NULL,
-                                    content TEXT NOT NULL,
-                                    role TEXT NOT NULL,
-                                    status TEXT DEFAULT 'completed',
-                                    query_text TEXT,
-                                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                                    FOREIGN KEY (session_id) REFERENCES genie_sessions(session_id)
-                                )
-                            """))
-                            
-                            # Create genie_message_ratings table
-                            conn.execute(text("""
-                                CREATE TABLE IF NOT EXISTS genie_message_ratings (
-                                    message_id TEXT NOT NULL,
-                                    user_id TEXT NOT NULL,
-                                    rating TEXT,
-                                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                                    PRIMARY KEY (message_id, user_id),
-                                    FOREIGN KEY (message_id) REFERENCES genie_messages(message_id)
-                                )
-                            """))
-                            
+                            for statement in SCHEMA_STATEMENTS:
+                                conn.execute(statement)
                             conn.commit()
                             ChatDatabase._initialized = True
                             logger.info("Database initialized successfully")
                     except Exception as e:
                         logger.error(f"Error initializing database: {str(e)}")
                         raise
+                    self._init_search()
 
-    def save_message_to_session(self, session_id: str, user_id: str, message: MessageResponse, conversation_id: str, query_text: str = None):
-        """Save a message to a chat session, creating the session if it doesn't exist"""
+    def _init_search(self):
         try:
-            logger.info(f"Starting to save message: session_id={session_id}, user_id={user_id}, message_id={message.message_id}")
             with db_manager.managed_connection() as conn:
-                # Check if session exists
-                result = conn.execute(text(
-                    'SELECT session_id FROM genie_sessions WHERE session_id = :session_id AND user_id = :user_id'
-                ), {'session_id': session_id, 'user_id': user_id})
-                
-                if not result.fetchone():
-                    logger.info(f"Creating new session: session_id={session_id}, user_id={user_id}")
-                    # Create new session
-                    conn.execute(text("""
-                        INSERT INTO genie_sessions (session_id, user_id, conversation_id, first_query, created_at, is_active)
-                        VALUES (:session_id, :user_id, :conversation_id, :first_query, :created_at, :is_active)
-                    """), {
-                        'session_id': session_id,
-                        'user_id': user_id,
-                        'conversation_id': conversation_id,
-                        'first_query': message.content,
-                        'created_at': message.timestamp,
-                        'is_active': True
-                    })
-                
-                # Save message
-                logger.debug("Saving message to database")
-                conn.execute(text("""
-                    INSERT INTO genie_messages (
-                        message_id, genie_message_id, session_id, conversation_id, user_id, content, role, 
-                        status, query_text, created_at
-                    ) VALUES (
-                        :message_id, :genie_message_id, :session_id, :conversation_id, :user_id, :content, :role,
-                        :status, :query_text, :created_at
-                    )
-                """), {
-                    'message_id': message.message_id,
-                    'genie_message_id': message.genie_message_id,
-                    'session_id': session_id,
-                    'conversation_id': conversation_id,
-                    'user_id': user_id,
-                    'content': message.content,
-                    'role': message.role,
-                    'status': 'COMPLETED',
-                    'query_text': query_text,
-                    'created_at': message.timestamp
-                })
-                
+                for statement in SEARCH_SCHEMA_STATEMENTS:
+                    conn.execute(statement)
                 conn.commit()
-                logger.info("Message saved successfully")
+            ChatDatabase.search_available = True
+        except Exception as e:
+            logger.warning(f"Chat search is unavailable, its indexes could not be created: {str(e)}")
+
+    def save_message_to_session(self, session_id: str, user_id: str, message: MessageResponse, conversation_id: str,
+                                query_text: str = None, results: Sequence[ResultBlob] = ()):
+        """
+        Save a message to a chat session, creating the session if it doesn't exist.
+        Runs as a single autocommitted statement, prepared once per connection.
+
+        results are the blobs of the query results the message's content refers
+        to; only those not already stored are sent with their data.
+        """
+        self.initialize()
+        params = _save_message_params(session_id, user_id, message, conversation_id, query_text)
+        try:
+            with db_manager.managed_connection() as conn:
+                if results:
+                    self._save_with_results(conn, params, results)
+                else:
+                    conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+                    self._prepare_statements(conn)
+                    conn.execute(EXECUTE_SAVE_MESSAGE_SQL, params)
         except Exception as e:
             logger.error(f"Error saving message to session: {str(e)}")
             raise
+        logger.debug("Message saved", extra=log_fields(session_id=session_id, message_id=message.message_id))
+
+    @staticmethod
+    def _save_with_results(conn, params: dict, results: Sequence[ResultBlob]) -> None:
+        params, sent = _save_results_params(params, results)
+        conn.execute(SAVE_MESSAGE_WITH_RESULTS_SQL, params)
+        conn.commit()
+        _saved_results(results, sent)
+
+    @staticmethod
+    def _prepare_statements(conn):
+        """Prepare the write statements on this physical connection if it hasn't been yet"""
+        # Connection info lives on the pool record and is cleared whenever it reconnects
+        info = conn.connection.info
+        if not info.get("statements_prepared"):
+            conn.execute(PREPARE_SAVE_MESSAGE_SQL)
+            info["statements_prepared"] = True
 
     def update_message_rating(self, message_id: str, user_id: str, rating: str | None) -> bool:
         """Update or remove the rating for a message."""
         try:
-            logger.info(f"Updating message rating: message_id={message_id}, user_id={user_id}, rating={rating}")
+            self.initialize()
+            logger.info("Updating message rating to %s", rating, extra=log_fields(message_id=message_id, user_id=user_id))
             with db_manager.managed_connection() as conn:
                 if rating is None:
                     # Remove the rating
-                    conn.execute(text("""
-                        DELETE FROM genie_message_ratings 
-                        WHERE message_id = :message_id AND user_id = :user_id
-                    """), {'message_id': message_id, 'user_id': user_id})
+                    conn.execute(DELETE_RATING_SQL, {'message_id': message_id, 'user_id': user_id})
                 else:
                     # Insert or update the rating
-                    conn.execute(text("""
-                        INSERT INTO genie_message_ratings (message_id, user_id, rating)
-                        VALUES (:message_id, :user_id, :rating)
-                        ON CONFLICT(message_id, user_id) DO UPDATE SET rating = EXCLUDED.rating
-                    """), {'message_id': message_id, 'user_id': user_id, 'rating': rating})
+                    conn.execute(UPSERT_RATING_SQL, {'message_id': message_id, 'user_id': user_id, 'rating': rating})
                 conn.commit()
-                logger.info("Message rating updated successfully")
                 return True
         except Exception as e:
             logger.error(f"Error updating message rating: {str(e)}")
             return False
 
+    def list_sessions(self, user_id: str, limit: int = 20, before: str = None) -> Tuple[List[ChatHistoryItem], Optional[str]]:
+        """
+        A page of the user's active chat sessions, newest first, without their messages.
+
+        Args:
+            user_id: Owner of the sessions
+            limit: Maximum number of sessions to return
+            before: Cursor returned with the previous page, or None for the first page
+
+        Returns:
+            (sessions, cursor of the next page or None when there are no more)
+        """
+        self.initialize()
+        statement, params = _session_query(user_id, limit, before)
+        try:
+            with db_manager.managed_connection() as conn:
+                rows = conn.execute(statement, params).fetchall()
+        except Exception as e:
+            logger.error(f"Error listing chat sessions: {str(e)}")
+            raise
+        rows, cursor = _page(rows, limit, "session_id")
+        return [_session_item(row) for row in rows], cursor
+
+    def get_session_messages(self, session_id: str, user_id: str, limit: int = 200, after: str = None) -> Tuple[List[MessageResponse], Optional[str]]:
+        """
+        A page of a session's messages, oldest first.
+
+        Args:
+            session_id: Session to read
+            user_id: Owner of the session
+            limit: Maximum number of messages to return
+            after: Cursor returned with the previous page, or None for the first page
+
+        Returns:
+            (messages, cursor of the next page or None when there are no more)
+        """
+        self.initialize()
+        statement, params = _message_query(session_id, user_id, limit, after)
+        try:
+            with db_manager.managed_connection() as conn:
+                rows = conn.execute(statement, params).fetchall()
+        except Exception as e:
+            logger.error(f"Error loading messages of session {session_id}: {str(e)}")
+            raise
+        rows, cursor = _page(rows, limit, "message_id")
+        return [_message_response(row) for row in rows], cursor
+
+    def get_results(self, result_hashes: Sequence[str]) -> Dict[str, "pd.DataFrame"]:
+        """
+        Stored query results by hash, for answers whose content refers to them.
+        Hashes without a stored blob are left out.
+        """
+        if not result_hashes:
+            return {}
+        self.initialize()
+        try:
+            with db_manager.managed_connection() as conn:
+                rows = conn.execute(SELECT_RESULT_BLOBS_SQL, {'result_hashes': list(set(result_hashes))}).fetchall()
+        except Exception as e:
+            logger.error(f"Error loading stored results: {str(e)}")
+            raise
+        return _decoded_results(rows)
+
+
+    def search_messages(self, user_id: str, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[SearchHit], Optional[int]]:
+        """
+        Past questions and answers matching a search, best first. Matches words
+        of questions, answers and SQL, and questions spelled similarly.
+
+        Args:
+            user_id: Owner of the messages
+            query: Search text; supports quoted phrases, "or" and -exclusions
+            limit: Maximum number of hits to return
+            offset: Number of hits to skip, from the previous page
+
+        Returns:
+            (hits, offset of the next page or None when there are no more)
+        """
+        self.initialize()
+        if not ChatDatabase.search_available:
+            raise RuntimeError("Chat search is unavailable")
+        try:
+            with db_manager.managed_connection() as conn:
+                rows = conn.execute(SEARCH_MESSAGES_SQL, _search_params(user_id, query, limit, offset)).fetchall()
+        except Exception as e:
+            logger.error(f"Error searching messages: {str(e)}")
+            raise
+        return _search_page(rows, limit, offset)
+
     def get_message_rating(self, message_id: str, user_id: str) -> str | None:
         """Get the rating of a message"""
         try:
-            logger.debug(f"Getting message rating: message_id={message_id}, user_id={user_id}")
+            self.initialize()
+            logger.debug("Getting message rating", extra=log_fields(message_id=message_id, user_id=user_id))
             with db_manager.managed_connection() as conn:
-                result = conn.execute(text("""
-                    SELECT rating
-                    FROM genie_message_ratings
-                    WHERE message_id = :message_id AND user_id = :user_id
-                """), {'message_id': message_id, 'user_id': user_id})
-                
+                result = conn.execute(SELECT_RATING_SQL, {'message_id': message_id, 'user_id': user_id})
+
                 row = result.fetchone()
                 rating = row[0] if row else None
-                logger.debug(f"Retrieved rating: {rating}")
+                logger.debug("Retrieved rating: %s", rating)
                 return rating
         except Exception as e:
             logger.error(f"Error getting message rating: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+class AsyncChatDatabase:
+    """
+    Asyncio counterpart of ChatDatabase on the asyncpg-backed engine. Like
+    ChatDatabase, each method creates the schema on first use.
+    """
+    _initialized = False
+    _init_lock = None
+    search_available = False
+
+    def __init__(self):
+        self.db_manager = get_async_db_manager()
+
+    async def initialize(self):
+        """Initialize database tables if they don't exist."""
+        if AsyncChatDatabase._initialized:
+            return
+        if AsyncChatDatabase._init_lock is None:
+            AsyncChatDatabase._init_lock = asyncio.Lock()
+        async with AsyncChatDatabase._init_lock:
+            if AsyncChatDatabase._initialized:  # Double-check pattern
+                return
+            try:
+                logger.info("Initializing database tables")
+                async with self.db_manager.managed_connection() as conn:
+                    for statement in SCHEMA_STATEMENTS:
+                        await conn.execute(statement)
+                    await conn.commit()
+                AsyncChatDatabase._initialized = True
+                logger.info("Database initialized successfully")
+            except Exception as e:
+                logger.error(f"Error initializing database: {str(e)}")
+                raise
+            try:
+                async with self.db_manager.managed_connection() as conn:
+                    for statement in SEARCH_SCHEMA_STATEMENTS:
+                        await conn.execute(statement)
+                    await conn.commit()
+                AsyncChatDatabase.search_available = True
+            except Exception as e:
+                logger.warning(f"Chat search is unavailable, its indexes could not be created: {str(e)}")
+
+    async def save_message_to_session(self, session_id: str, user_id: str, message: MessageResponse, conversation_id: str,
+                                      query_text: str = None, results: Sequence[ResultBlob] = ()):
+        """Save a message to a chat session, creating the session if it doesn't exist"""
+        await self.initialize()
+        params = _save_message_params(session_id, user_id, message, conversation_id, query_text)
+        try:
+            async with self.db_manager.managed_connection() as conn:
+                if results:
+                    params, sent = _save_results_params(params, results)
+                    await conn.execute(SAVE_MESSAGE_WITH_RESULTS_SQL, params)
+                    await conn.commit()
+                    _saved_results(results, sent)
+                else:
+                    conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                    await conn.execute(SAVE_MESSAGE_SQL, params)
+        except Exception as e:
+            logger.error(f"Error saving message to session: {str(e)}")
+            raise
+        logger.debug("Message saved", extra=log_fields(session_id=session_id, message_id=message.message_id))
+
+    async def update_message_rating(self, message_id: str, user_id: str, rating: str | None) -> bool:
+        """Update or remove the rating for a message."""
+        try:
+            await self.initialize()
+            async with self.db_manager.managed_connection() as conn:
+                if rating is None:
+                    await conn.execute(DELETE_RATING_SQL, {'message_id': message_id, 'user_id': user_id})
+                else:
+                    await conn.execute(UPSERT_RATING_SQL, {'message_id': message_id, 'user_id': user_id, 'rating': rating})
+                await conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error updating message rating: {str(e)}")
+            return False
+
+    async def list_sessions(self, user_id: str, limit: int = 20, before: str = None) -> Tuple[List[ChatHistoryItem], Optional[str]]:
+        """A page of the user's active chat sessions, newest first, without their messages"""
+        await self.initialize()
+        statement, params = _session_query(user_id, limit, before)
+        try:
+            async with self.db_manager.managed_connection() as conn:
+                rows = (await conn.execute(statement, params)).fetchall()
+        except Exception as e:
+            logger.error(f"Error listing chat sessions: {str(e)}")
+            raise
+        rows, cursor = _page(rows, limit, "session_id")
+        return [_session_item(row) for row in rows], cursor
+
+    async def get_session_messages(self, session_id: str, user_id: str, limit: int = 200, after: str = None) -> Tuple[List[MessageResponse], Optional[str]]:
+        """A page of a session's messages, oldest first"""
+        await self.initialize()
+        statement, params = _message_query(session_id, user_id, limit, after)
+        try:
+            async with self.db_manager.managed_connection() as conn:
+                rows = (await conn.execute(statement, params)).fetchall()
+        except Exception as e:
+            logger.error(f"Error loading messages of session {session_id}: {str(e)}")
+            raise
+        rows, cursor = _page(rows, limit, "message_id")
+        return [_message_response(row) for row in rows], cursor
+
+    async def get_results(self, result_hashes: Sequence[str]) -> Dict[str, "pd.DataFrame"]:
+        """Stored query results by hash; hashes without a stored blob are left out"""
+        if not result_hashes:
+            return {}
+        await self.initialize()
+        try:
+            async with self.db_manager.managed_connection() as conn:
+                rows = (await conn.execute(SELECT_RESULT_BLOBS_SQL, {'result_hashes': list(set(result_hashes))})).fetchall()
+        except Exception as e:
+            logger.error(f"Error loading stored results: {str(e)}")
+            raise
+        return _decoded_results(rows)
+
+
+    async def search_messages(self, user_id: str, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[SearchHit], Optional[int]]:
+        """Past questions and answers matching a search, best first"""
+        await self.initialize()
+        if not AsyncChatDatabase.search_available:
+            raise RuntimeError("Chat search is unavailable")
+        try:
+            async with self.db_manager.managed_connection() as conn:
+                rows = (await conn.execute(SEARCH_MESSAGES_SQL, _search_params(user_id, query, limit, offset))).fetchall()
+        except Exception as e:
+            logger.error(f"Error searching messages: {str(e)}")
+            raise
+        return _search_page(rows, limit, offset)
+
+    async def get_message_rating(self, message_id: str, user_id: str) -> str | None:
+        """Get the rating of a message"""
+        try:
+            await self.initialize()
+            async with self.db_manager.managed_connection() as conn:
+                result = await conn.execute(SELECT_RATING_SQL, {'message_id': message_id, 'user_id': user_id})
+                row = result.fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Error getting message rating: {str(e)}")
+            return None
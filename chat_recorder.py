@@ -0,0 +1,307 @@
+import heapq
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from typing import Optional, Sequence, Tuple
+from models import AnswerPart, MessageResponse
+from result_blobs import ResultBlob, saved_answer
+from tracing import tracer
+from structured_logging import log_fields
+
+logger = logging.getLogger(__name__)
+
+# Fixed namespace so the same Genie message always maps to the same database ids
+RECORD_NAMESPACE = uuid.UUID("6f1d3c1e-8a4b-4f57-9a43-2b0b7f3f1c55")
+
+def session_id_for(conversation_id: str) -> str:
+    """Deterministic chat session id for a Genie conversation"""
+    return str(uuid.uuid5(RECORD_NAMESPACE, f"session:{conversation_id}"))
+
+def message_id_for(genie_message_id: str, role: str) -> str:
+    """Deterministic database message id for a Genie message and role"""
+    return str(uuid.uuid5(RECORD_NAMESPACE, f"message:{genie_message_id}:{role}"))
+
+# Conversation and message ids of turns answered without asking Genie, such as
+# reused answers; Genie has no such conversation to send follow-ups to
+REUSED_ID_PREFIX = "reused-"
+
+def reused_id() -> str:
+    """A fresh conversation or message id for a turn answered without Genie"""
+    return f"{REUSED_ID_PREFIX}{uuid.uuid4().hex}"
+
+def is_reused(genie_id: Optional[str]) -> bool:
+    return bool(genie_id) and genie_id.startswith(REUSED_ID_PREFIX)
+
+@dataclass
+class PendingRecord:
+    conversation_id: str
+    genie_message_id: str
+    content: Optional[str]
+    role: str
+    timestamp: datetime
+    user_id: str = "default_user"
+    query_text: Optional[str] = None
+    parts: Tuple[AnswerPart, ...] = ()  # An answer's parts, turned into content and results when first written
+    answered_in: Optional[Tuple[str, str]] = None  # Genie conversation and message of the parts, if not this one's
+    results: Tuple[ResultBlob, ...] = ()
+    session_id: Optional[str] = None  # Defaults to the conversation's own session
+    attempts: int = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.genie_message_id}:{self.role}"
+
+@dataclass
+class PendingRating:
+    genie_message_id: str
+    rating: Optional[str]
+    user_id: str
+    seq: int  # Only the latest rating of a message and user is written
+    attempts: int = 0
+
+    @property
+    def key(self) -> str:
+        return f"{self.genie_message_id}:rating:{self.user_id}:{self.seq}"
+
+class ChatRecorder:
+    """
+    Persists chat messages to Postgres on a background thread.
+    Records are keyed by Genie message id and role, so enqueueing the same
+    message twice stores it once, and database failures are retried with
+    backoff without ever touching the Genie API call that produced them.
+
+    Ratings go through the same queue, so a rating given before its answer
+    was written waits for it, and a superseded rating is never written.
+    """
+    def __init__(self, max_attempts: int = 8, base_delay: float = 0.5, max_delay: float = 60.0,
+                 max_pending: int = 10000, remembered_keys: int = 50000):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.remembered_keys = remembered_keys
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._retries = []  # heap of (due_time, seq, record)
+        self._seq = itertools.count()
+        self._pending = set()
+        self._recorded = OrderedDict()
+        self._ratings = {}  # (genie message id, user id) -> seq of the latest rating
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+        self._db = None
+
+    def record(self, conversation_id: str, genie_message_id: str, content: str = None,
+               role: str = "assistant", query_text: str = None, user_id: str = "default_user",
+               parts: Sequence[AnswerPart] = (), session_id: str = None,
+               answered_in: Tuple[str, str] = None) -> bool:
+        """
+        Queue a message for persistence. Never blocks on or raises from the database.
+        An answer is given as its parts, whose results are encoded on the recorder's
+        thread rather than the caller's; its content and query text come from them.
+        Results are saved with the Genie message they came from, answered_in
+        when the answer was reused from another conversation, so they can be
+        fetched again when the chat is reopened.
+        It joins session_id if given, so a chat whose turns span several Genie
+        conversations stays one session, and the conversation's own session otherwise.
+
+        Returns:
+            bool: True if the message was queued, False if it was a duplicate or dropped
+        """
+        if not conversation_id or not genie_message_id:
+            logger.warning("Skipping chat record without conversation or message id")
+            return False
+
+        record = PendingRecord(
+            conversation_id=conversation_id,
+            genie_message_id=genie_message_id,
+            content=content,
+            role=role,
+            timestamp=datetime.now(timezone.utc),
+            user_id=user_id,
+            query_text=query_text,
+            # Copied so later changes to the caller's parts don't reach the saved answer
+            parts=tuple(replace(part) for part in parts),
+            answered_in=answered_in,
+            session_id=session_id
+        )
+        with self._lock:
+            if record.key in self._pending or record.key in self._recorded:
+                return False
+            self._pending.add(record.key)
+        return self._enqueue(record)
+
+    def rate(self, genie_message_id: str, rating: Optional[str], user_id: str = "default_user") -> bool:
+        """
+        Queue setting (or, with None, removing) the rating of an answer.
+
+        Returns:
+            bool: True if the rating was queued
+        """
+        if not genie_message_id:
+            return False
+        with self._lock:
+            record = PendingRating(genie_message_id, rating, user_id, next(self._seq))
+            self._ratings[(genie_message_id, user_id)] = record.seq
+            self._pending.add(record.key)
+        return self._enqueue(record)
+
+    def _enqueue(self, record) -> bool:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(record.key)
+                self._idle.notify_all()
+            logger.error("Chat recorder queue full, dropping %s", record.key,
+                         extra=log_fields(message_id=record.genie_message_id))
+            return False
+        self._ensure_started()
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until every queued record has been written or given up on"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush outstanding records and stop the background thread"""
+        self.flush(timeout)
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self._stop.clear()
+
+    def reset_after_fork(self) -> None:
+        """
+        Start clean in a forked child: the parent's thread does not exist here and
+        records it had queued remain the parent's to write.
+        """
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._retries = []
+        self._pending = set()
+        self._ratings = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+        self._db = None
+
+    def _ensure_started(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="chat-recorder", daemon=True)
+            self._thread.start()
+
+    def _get_db(self):
+        if self._db is None:
+            # Imported here so a database outage never breaks importing the Genie client
+            from chat_database import ChatDatabase
+            self._db = ChatDatabase()
+        return self._db
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            timeout = 1.0
+            if self._retries:
+                timeout = max(0.0, min(timeout, self._retries[0][0] - time.monotonic()))
+            try:
+                self._write(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            while self._retries and self._retries[0][0] <= time.monotonic():
+                _, _, record = heapq.heappop(self._retries)
+                self._write(record)
+
+    def _write(self, record) -> None:
+        if isinstance(record, PendingRating):
+            with self._lock:
+                superseded = self._ratings.get((record.genie_message_id, record.user_id)) != record.seq
+            if superseded:
+                self._finish(record, recorded=False)
+                return
+        try:
+            if isinstance(record, PendingRating):
+                with tracer.span("db.save_rating", message_id=record.genie_message_id, attempt=record.attempts + 1):
+                    self._save_rating(record)
+            else:
+                with tracer.span("db.save_message", conversation_id=record.conversation_id,
+                                 message_id=record.genie_message_id, role=record.role, attempt=record.attempts + 1):
+                    self._save(record)
+        except Exception as e:
+            record.attempts += 1
+            if record.attempts >= self.max_attempts:
+                logger.error("Giving up on chat record %s after %d attempts: %s", record.key, record.attempts, e,
+                             extra=log_fields(message_id=record.genie_message_id))
+                self._finish(record, recorded=False)
+                return
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** record.attempts))
+            logger.warning("Saving chat record %s failed, retrying in %.2f seconds: %s", record.key, delay, e,
+                           extra=log_fields(message_id=record.genie_message_id))
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), record))
+            return
+        self._finish(record, recorded=True)
+
+    def _save(self, record: PendingRecord) -> None:
+        if record.parts:
+            # Encoded once; retries reuse the content and results
+            conversation_id, genie_message_id = record.answered_in or (record.conversation_id, record.genie_message_id)
+            if is_reused(conversation_id):
+                # Genie has no such conversation to fetch the results from
+                conversation_id = genie_message_id = None
+            with tracer.span("db.encode_results", parts=len(record.parts)):
+                record.content, record.query_text, results = saved_answer(record.parts, conversation_id, genie_message_id)
+            record.results, record.parts = tuple(results), ()
+        self._get_db().save_message_to_session(
+            session_id=record.session_id or session_id_for(record.conversation_id),
+            user_id=record.user_id,
+            message=MessageResponse(
+                message_id=message_id_for(record.genie_message_id, record.role),
+                genie_message_id=record.genie_message_id,
+                content=record.content,
+                role=record.role,
+                timestamp=record.timestamp
+            ),
+            conversation_id=record.conversation_id,
+            query_text=record.query_text,
+            results=record.results
+        )
+
+    def _save_rating(self, record: PendingRating) -> None:
+        # Answers are saved under the assistant message's id, and the rating refers to it
+        if not self._get_db().update_message_rating(
+                message_id_for(record.genie_message_id, "assistant"), record.user_id, record.rating):
+            raise RuntimeError("the rating was not saved")
+
+    def _finish(self, record, recorded: bool) -> None:
+        with self._lock:
+            self._pending.discard(record.key)
+            if isinstance(record, PendingRating):
+                if self._ratings.get((record.genie_message_id, record.user_id)) == record.seq:
+                    del self._ratings[(record.genie_message_id, record.user_id)]
+            elif recorded:
+                self._recorded[record.key] = None
+                while len(self._recorded) > self.remembered_keys:
+                    self._recorded.popitem(last=False)
+            if not self._pending:
+                self._idle.notify_all()
+
+# Initialize chat recorder
+chat_recorder = ChatRecorder()
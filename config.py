@@ -13,6 +13,15 @@ class DatabaseConfig:
     max_overflow: int = 10
     pool_timeout: int = 30
     pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    pool_auto_tune: bool = False
+    pool_min_size: int = 2
+    pool_max_size: int = 20
+    pool_tune_interval: int = 60
+    pool_sweep_interval: int = 30
+    pool_recycle_jitter: int = 300
+    pool_recycle_per_sweep: int = 2
+    result_index_entries: int = 100_000
 
 @dataclass
 class DatabricksConfig:
@@ -20,6 +29,61 @@ class DatabricksConfig:
     client_secret: str
     host: str
     space_id: str
+    poll_interval: float = 2.0
+    poll_timeout: int = 300
+
+    @property
+    def workspace_url(self) -> str:
+        return workspace_url(self.host)
+
+@dataclass
+class DisplayConfig:
+    table_max_rows: int = 1000
+    table_max_bytes: int = 2_000_000
+    sample_rows: int = 100
+    page_size: int = 10
+    result_store_bytes: int = 256_000_000
+    result_store_disk_bytes: int = 2_000_000_000
+    refresh_ttl: int = 300
+    history_page_size: int = 20
+    history_message_limit: int = 200
+    render_cache_bytes: int = 64_000_000
+
+@dataclass
+class SimilarQuestionConfig:
+    enabled: bool = True
+    threshold: float = 0.75
+    max_entries: int = 1000
+    ttl: int = 3600
+
+@dataclass
+class LoggingConfig:
+    level: str = "INFO"
+    format: str = "text"
+    buffer_size: int = 10000
+    sample_rates: str = ""
+
+@dataclass
+class ServerConfig:
+    host: str = "0.0.0.0"
+    port: int = 8050
+    workers: int = 2
+    threads: int = 8
+    worker_class: str = "gthread"
+    timeout: int = 360
+    graceful_timeout: int = 30
+    preload: bool = True
+    debug: bool = False
+    state_dir: Optional[str] = None
+
+# Seconds allowed on top of the Genie poll timeout to fetch an answer's results
+ANSWER_TIMEOUT_MARGIN = 60
+
+def workspace_url(host: str) -> str:
+    """Base URL for a workspace host; a host with an explicit scheme (e.g. a local stand-in) is used as-is"""
+    if host and host.startswith(("http://", "https://")):
+        return host.rstrip("/")
+    return f"https://{host}"
 
 class Config:
     def __init__(self):
@@ -30,7 +94,18 @@ class Config:
             username=os.getenv("DATABRICKS_CLIENT_ID", ""),  # This appears to be used as the username
             host=os.getenv("DB_HOST", ""),
             port=os.getenv("DB_PORT", "5432"),
-            database=os.getenv("DB_NAME", "")
+            database=os.getenv("DB_NAME", ""),
+            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_pre_ping=os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+            pool_auto_tune=os.getenv("DB_POOL_AUTO_TUNE", "false").lower() == "true",
+            pool_min_size=int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            pool_max_size=int(os.getenv("DB_POOL_MAX_SIZE", "20")),
+            pool_tune_interval=int(os.getenv("DB_POOL_TUNE_INTERVAL", "60")),
+            pool_sweep_interval=int(os.getenv("DB_POOL_SWEEP_INTERVAL", "30")),
+            pool_recycle_jitter=int(os.getenv("DB_POOL_RECYCLE_JITTER", "300")),
+            pool_recycle_per_sweep=int(os.getenv("DB_POOL_RECYCLE_PER_SWEEP", "2")),
+            result_index_entries=int(os.getenv("DB_RESULT_INDEX_ENTRIES", "100000"))
         )
         
         # Databricks configuration
@@ -38,11 +113,66 @@ class Config:
             client_id=os.getenv("DATABRICKS_CLIENT_ID", ""),
             client_secret=os.getenv("DATABRICKS_CLIENT_SECRET", ""),
             host=os.getenv("DATABRICKS_HOST", ""),
-            space_id=os.getenv("SPACE_ID", "")
+            space_id=os.getenv("SPACE_ID", ""),
+            poll_interval=float(os.getenv("GENIE_POLL_INTERVAL", "2")),
+            poll_timeout=int(os.getenv("GENIE_POLL_TIMEOUT", "300"))
+        )
+
+        # Result display configuration; answers above either table limit are summarized and paged server-side
+        self.display = DisplayConfig(
+            table_max_rows=int(os.getenv("RESULT_TABLE_MAX_ROWS", "1000")),
+            table_max_bytes=int(os.getenv("RESULT_TABLE_MAX_BYTES", "2000000")),
+            sample_rows=int(os.getenv("RESULT_SAMPLE_ROWS", "100")),
+            page_size=int(os.getenv("RESULT_PAGE_SIZE", "10")),
+            result_store_bytes=int(os.getenv("RESULT_STORE_BYTES", "256000000")),
+            result_store_disk_bytes=int(os.getenv("RESULT_STORE_DISK_BYTES", "2000000000")),
+            refresh_ttl=int(os.getenv("RESULT_REFRESH_TTL", "300")),
+            history_page_size=int(os.getenv("HISTORY_PAGE_SIZE", "20")),
+            history_message_limit=int(os.getenv("HISTORY_MESSAGE_LIMIT", "200")),
+            render_cache_bytes=int(os.getenv("RENDER_CACHE_BYTES", "64000000"))
+        )
+
+        # Reuse of answers to near-duplicate questions; threshold is the character trigram Jaccard similarity required
+        self.similar_questions = SimilarQuestionConfig(
+            enabled=os.getenv("SIMILAR_QUESTIONS", "true").lower() == "true",
+            threshold=float(os.getenv("SIMILAR_QUESTION_THRESHOLD", "0.75")),
+            max_entries=int(os.getenv("SIMILAR_QUESTION_MAX_ENTRIES", "1000")),
+            ttl=int(os.getenv("SIMILAR_QUESTION_TTL", "3600"))
+        )
+
+        # Logging; format is "text" or "json", sample_rates a comma-separated list of logger=rate
+        # keeping that fraction of the logger's records below WARNING (e.g. "genie.trace=0.1")
+        self.logging = LoggingConfig(
+            level=os.getenv("LOG_LEVEL", "INFO").upper(),
+            format=os.getenv("LOG_FORMAT", "text").lower(),
+            buffer_size=int(os.getenv("LOG_BUFFER_SIZE", "10000")),
+            sample_rates=os.getenv("LOG_SAMPLE_RATES", "")
+        )
+
+        # Web server configuration; worker_class is "gthread" (threads per process) or "sync" (one request per process).
+        # A sync worker is silent while it waits for Genie, so timeout defaults to the poll timeout plus a margin
+        # for fetching results.
+        # With several workers, results and question progress are shared through state_dir (serve.py creates
+        # one for the run when unset); an empty SHARED_STATE_DIR keeps them in each process
+        self.server = ServerConfig(
+            host=os.getenv("WEB_HOST", "0.0.0.0"),
+            port=int(os.getenv("DATABRICKS_APP_PORT") or os.getenv("PORT") or "8050"),
+            workers=int(os.getenv("WEB_WORKERS") or str(os.cpu_count() or 2)),
+            threads=int(os.getenv("WEB_THREADS", "8")),
+            worker_class=os.getenv("WEB_WORKER_CLASS", "gthread"),
+            timeout=int(os.getenv("WEB_TIMEOUT") or self.databricks.poll_timeout + ANSWER_TIMEOUT_MARGIN),
+            graceful_timeout=int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30")),
+            preload=os.getenv("WEB_PRELOAD", "true").lower() == "true",
+            debug=os.getenv("DASH_DEBUG", "false").lower() == "true",
+            state_dir=os.getenv("SHARED_STATE_DIR")
         )
 
     @property
     def database_url(self) -> str:
         return f"postgresql+psycopg2://{self.db.username}:@{self.db.host}:{self.db.port}/{self.db.database}"
 
+    @property
+    def async_database_url(self) -> str:
+        return f"postgresql+asyncpg://{self.db.username}:@{self.db.host}:{self.db.port}/{self.db.database}"
+
 config = Config() 
\ No newline at end of file
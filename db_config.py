@@ -1,40 +1,366 @@
+import asyncio
 import logging
+import math
+import os
+import random
+import threading
+import time
+import weakref
+from datetime import datetime
+from typing import Optional
 from sqlalchemy import create_engine, event
-from contextlib import contextmanager
-from sqlalchemy.exc import OperationalError, TimeoutError
-from token_minter import tokenminter
+from contextlib import contextmanager, asynccontextmanager
+from sqlalchemy.exc import DisconnectionError, OperationalError, TimeoutError
+from token_minter import tokenminter, TokenMinter
 from config import config
+from metrics import registry
 
 logger = logging.getLogger(__name__)
 
+POOL_CHECKOUT_SECONDS = registry.histogram(
+    "genie_db_pool_checkout_seconds", "Time spent waiting for a pooled database connection")
+POOL_CONNECT_SECONDS = registry.histogram(
+    "genie_db_pool_connect_seconds", "Time to open a new physical database connection, including the token fetch",
+    ("path",))
+POOL_TOKEN_FETCH_SECONDS = registry.histogram(
+    "genie_db_pool_token_fetch_seconds", "Time to fetch the OAuth token used as a connection password")
+POOL_TIMEOUTS = registry.counter(
+    "genie_db_pool_timeouts_total", "Checkouts that gave up waiting for a pooled connection")
+POOL_CONNECTIONS = registry.gauge(
+    "genie_db_pool_connections", "Pooled database connections by state", ("state",))
+POOL_SIZE = registry.gauge(
+    "genie_db_pool_size", "Configured number of persistent pooled connections")
+POOL_RESIZES = registry.counter(
+    "genie_db_pool_resizes_total", "Pool resizes made by the auto-tuner", ("direction",))
+POOL_BACKGROUND_RECYCLES = registry.counter(
+    "genie_db_pool_background_recycles_total", "Idle connections reconnected by the background sweep", ("result",))
+POOL_STALE_IDLE = registry.gauge(
+    "genie_db_pool_stale_idle_connections", "Idle connections opened with an older token generation")
+
+# Set while the recycler reconnects, so connects can be attributed to the background or a request
+_background = threading.local()
+
+def token_aligned_recycle(pool_recycle: int) -> int:
+    """Recycle pooled connections before the token they were opened with expires"""
+    token_seconds = int((TokenMinter.lifetime - TokenMinter.refresh_margin).total_seconds())
+    return min(pool_recycle, token_seconds) if pool_recycle > 0 else token_seconds
+
+class PoolAutoTuner:
+    """
+    Sizes the connection pool from observed concurrency.
+    Every interval the peak number of checked-out connections is compared with
+    the pool size: the pool grows straight away when it was saturated and
+    shrinks only after several quiet intervals in a row.
+    """
+    headroom = 1.25
+    shrink_after = 3
+
+    def __init__(self, manager: "DatabaseManager", min_size: int, max_size: int, interval: int):
+        self.manager = manager
+        self.min_size = min_size
+        self.max_size = max_size
+        self.interval = interval
+        self._peak = 0
+        self._timeouts = 0
+        self._quiet_intervals = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="db-pool-tuner", daemon=True)
+        self._thread.start()
+
+    def reset_after_fork(self) -> None:
+        """Restart in a forked child, where the parent's thread does not exist"""
+        self._lock = threading.Lock()
+        self._peak = 0
+        self._timeouts = 0
+        self.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def observe_checkout(self, checked_out: int) -> None:
+        with self._lock:
+            self._peak = max(self._peak, checked_out)
+
+    def observe_timeout(self) -> None:
+        with self._lock:
+            self._timeouts += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.tune()
+            except Exception as e:
+                logger.error(f"Error auto-tuning connection pool: {str(e)}")
+
+    def tune(self) -> int:
+        """Resize the pool for the last interval and return the new size"""
+        with self._lock:
+            peak, timeouts = self._peak, self._timeouts
+            self._peak = self.manager.engine.pool.checkedout()
+            self._timeouts = 0
+
+        current = self.manager.engine.pool.size()
+        target = max(self.min_size, min(self.max_size, math.ceil(peak * self.headroom)))
+        if timeouts:
+            target = max(target, min(self.max_size, current + max(1, current // 2)))
+
+        if target > current:
+            self._quiet_intervals = 0
+            self.manager.resize_pool(target)
+            return target
+        if target < current:
+            self._quiet_intervals += 1
+            if self._quiet_intervals >= self.shrink_after:
+                self._quiet_intervals = 0
+                self.manager.resize_pool(target)
+                return target
+        else:
+            self._quiet_intervals = 0
+        return current
+
+class ConnectionRecycler:
+    """
+    Replaces pooled connections before the token they authenticated with ages out.
+    Each connection gets a jittered deadline when it is opened and is reconnected
+    on the first checkout past it. While idle connections are overdue, a
+    background sweep checks out a few of them per pass through the pool's own
+    API, so most reconnects happen on its thread instead of a request's.
+    """
+    def __init__(self, manager: "DatabaseManager", interval: int, jitter: int, per_sweep: int):
+        self.manager = manager
+        self.interval = interval
+        self.jitter = jitter
+        self.per_sweep = per_sweep
+        self._idle = weakref.WeakSet()  # Connection records currently checked in
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="db-pool-recycler", daemon=True)
+        self._thread.start()
+
+    def reset_after_fork(self) -> None:
+        """Forget the parent's connections and restart the sweep in a forked child"""
+        self._idle = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def deadline_for(self, connected_at: float, token_expiry: Optional[datetime]) -> float:
+        """Wall-clock time after which a connection opened at connected_at should be replaced"""
+        deadline = connected_at + self.manager.pool_recycle
+        if token_expiry is not None:
+            deadline = min(deadline, token_expiry.timestamp())
+        # Land at least one sweep ahead of pool_recycle, which would otherwise recycle on checkout
+        deadline -= 2 * self.interval + random.uniform(0, self.jitter)
+        return max(deadline, connected_at + self.interval)
+
+    def checked_in(self, connection_record) -> None:
+        with self._lock:
+            self._idle.add(connection_record)
+
+    def checked_out(self, connection_record) -> None:
+        """Checkout listener: reconnect a connection past its deadline before it is used"""
+        with self._lock:
+            self._idle.discard(connection_record)
+        if connection_record.info.get("recycle_at", math.inf) <= time.time():
+            # The pool invalidates the connection, opens a new one and checks that out instead
+            raise DisconnectionError("Connection is due for recycling")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Error sweeping connection pool: {str(e)}")
+
+    def sweep(self) -> int:
+        """Reconnect overdue idle connections and return how many were replaced"""
+        now = time.time()
+        generation = tokenminter.generation
+        with self._lock:
+            idle = [record for record in self._idle if record.dbapi_connection is not None]
+        POOL_STALE_IDLE.set(sum(1 for record in idle if record.info.get("token_generation", generation) < generation))
+        overdue = sum(1 for record in idle if record.info.get("recycle_at", math.inf) <= now)
+
+        pool = self.manager.engine.pool
+        _background.active = True
+        _background.connects = 0
+        try:
+            # Each checkout takes the longest-idle connection, which the checkout
+            # listener reconnects if it is overdue; the rest go straight back
+            for _ in range(min(overdue, self.per_sweep)):
+                if not pool.checkedin():
+                    break
+                try:
+                    pool.connect().close()
+                except Exception as e:
+                    # The next checkout past the deadline reconnects it instead
+                    POOL_BACKGROUND_RECYCLES.inc(result="error")
+                    logger.warning(f"Background reconnect failed: {str(e)}")
+            recycled = _background.connects
+        finally:
+            _background.active = False
+        POOL_BACKGROUND_RECYCLES.inc(recycled, result="success")
+        return recycled
+
+def _close_on_checkin(dbapi_connection, connection_record) -> None:
+    """Checkin listener of a replaced pool: close each returning connection"""
+    connection_record.invalidate()
+
 class DatabaseManager:
+    """
+    Owns the sync engine and its pool. The engine, its listeners and the pool's
+    background threads are created on first use of engine, so constructing a
+    DatabaseManager does no work.
+    """
     def __init__(self):
-        self.engine = create_engine(
+        self.pool_recycle = token_aligned_recycle(config.db.pool_recycle)
+        self._engine = None
+        self._engine_lock = threading.Lock()
+        self.tuner = None
+        self.recycler = ConnectionRecycler(
+            self,
+            interval=config.db.pool_sweep_interval,
+            jitter=config.db.pool_recycle_jitter,
+            per_sweep=config.db.pool_recycle_per_sweep
+        )
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._engine_lock:
+                if self._engine is None:  # Double-check pattern
+                    self._start()
+        return self._engine
+
+    @property
+    def started(self) -> bool:
+        """Whether the engine has been created"""
+        return self._engine is not None
+
+    def _start(self):
+        self._engine = self._create_engine(config.db.pool_size)
+        self._setup_pool_gauges()
+        if config.db.pool_auto_tune:
+            self.tuner = PoolAutoTuner(
+                self,
+                min_size=config.db.pool_min_size,
+                max_size=config.db.pool_max_size,
+                interval=config.db.pool_tune_interval
+            )
+            self.tuner.start()
+        self.recycler.start()
+        logger.info("Created database engine")
+
+    def _create_engine(self, pool_size: int):
+        engine = create_engine(
             config.database_url,
-            pool_size=config.db.pool_size,
+            pool_size=pool_size,
             max_overflow=config.db.max_overflow,
             pool_timeout=config.db.pool_timeout,
-            pool_recycle=config.db.pool_recycle
+            pool_recycle=self.pool_recycle,
+            pool_pre_ping=config.db.pool_pre_ping
         )
-        self._setup_event_listeners()
+        self._setup_event_listeners(engine)
+        return engine
 
-    def _setup_event_listeners(self):
-        @event.listens_for(self.engine, "do_connect")
+    def _setup_event_listeners(self, engine):
+        @event.listens_for(engine, "do_connect")
         def provide_token(dialect, conn_rec, cargs, cparams):
-            """Provide token for new connection."""
+            """Provide token for new connection, record which token it used and time the connect."""
             try:
                 logger.debug("Attempting to provide token for new connection")
+                start = time.perf_counter()
                 cparams["password"] = tokenminter.get_token()
+                token_fetched = time.perf_counter()
+                POOL_TOKEN_FETCH_SECONDS.observe(token_fetched - start)
             except Exception as e:
                 logger.error(f"Error providing token: {str(e)}")
                 raise
+            conn_rec.info["token_generation"] = tokenminter.generation
+            conn_rec.info["recycle_at"] = self.recycler.deadline_for(time.time(), tokenminter.expiry_time)
+            connection = dialect.connect(*cargs, **cparams)
+            path = "request"
+            if getattr(_background, "active", False):
+                path = "background"
+                _background.connects += 1
+            POOL_CONNECT_SECONDS.observe(time.perf_counter() - start, path=path)
+            return connection
+
+        @event.listens_for(engine, "checkout")
+        def track_checkout(dbapi_connection, connection_record, connection_proxy):
+            if self.tuner and not getattr(_background, "active", False):
+                self.tuner.observe_checkout(self.engine.pool.checkedout())
+            self.recycler.checked_out(connection_record)
+
+        @event.listens_for(engine, "checkin")
+        def track_checkin(dbapi_connection, connection_record):
+            self.recycler.checked_in(connection_record)
+
+    def _setup_pool_gauges(self):
+        POOL_CONNECTIONS.set_function(lambda: self.engine.pool.checkedout(), state="in_use")
+        POOL_CONNECTIONS.set_function(lambda: self.engine.pool.checkedin(), state="idle")
+        POOL_CONNECTIONS.set_function(lambda: max(0, self.engine.pool.overflow()), state="overflow")
+        POOL_SIZE.set_function(lambda: self.engine.pool.size())
+
+    def pool_stats(self) -> dict:
+        """Snapshot of pool usage and checkout latency"""
+        pool = self.engine.pool
+        return {
+            "size": pool.size(),
+            "in_use": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "timeouts": POOL_TIMEOUTS.value(),
+            "checkout_p50_seconds": POOL_CHECKOUT_SECONDS.quantile(0.5),
+            "checkout_p99_seconds": POOL_CHECKOUT_SECONDS.quantile(0.99),
+            "connect_p50_seconds": POOL_CONNECT_SECONDS.quantile(0.5, path="request"),
+            "stale_idle": POOL_STALE_IDLE.value(),
+            "background_recycles": POOL_BACKGROUND_RECYCLES.value(result="success"),
+            # Reconnect time spent on the sweep thread instead of on request threads
+            "background_reconnect_seconds": POOL_CONNECT_SECONDS.samples().get(("background",), {}).get("sum", 0.0),
+            "token_fetch_p50_seconds": POOL_TOKEN_FETCH_SECONDS.quantile(0.5),
+        }
+
+    def resize_pool(self, pool_size: int) -> None:
+        """Swap in an engine with a new persistent pool size; checked-out connections finish on the old one"""
+        old_engine = self.engine
+        current = old_engine.pool.size()
+        if pool_size == current:
+            return
+        self._engine = self._create_engine(pool_size)
+        # Connections still checked out come back to the old pool after it is disposed;
+        # close them as they do instead of leaving them open in its queue
+        event.listen(old_engine.pool, "checkin", _close_on_checkin)
+        old_engine.dispose()
+        POOL_RESIZES.inc(direction="up" if pool_size > current else "down")
+        logger.info(f"Resized database connection pool from {current} to {pool_size}")
 
     @contextmanager
     def managed_connection(self):
         """Context manager for database connections with proper cleanup."""
         conn = None
         try:
-            conn = self.engine.connect()
+            start = time.perf_counter()
+            try:
+                conn = self.engine.connect()
+            except TimeoutError:
+                POOL_TIMEOUTS.inc()
+                if self.tuner:
+                    self.tuner.observe_timeout()
+                raise
+            finally:
+                POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
             yield conn
         except Exception as e:
             logger.error(f"Error in managed connection: {str(e)}")
@@ -46,18 +372,123 @@ class DatabaseManager:
                 except Exception as e:
                     logger.error(f"Error closing connection: {str(e)}")
 
+    def reset_after_fork(self):
+        """
+        Make a forked worker use its own connections and background threads.
+        Pooled connections inherited from the parent are dropped without being
+        closed, since the parent still owns their sockets.
+        """
+        self._engine_lock = threading.Lock()
+        if self._engine is None:
+            return
+        self._engine.dispose(close=False)
+        if self.tuner:
+            self.tuner.reset_after_fork()
+        self.recycler.reset_after_fork()
+        logger.info(f"Reset database connection pool after fork in process {os.getpid()}")
+
     def cleanup(self):
         """Clean up all resources before shutdown."""
+        if self._engine is None:
+            return
         try:
             logger.info("Starting database cleanup")
-            self.engine.dispose()
+            if self.tuner:
+                self.tuner.stop()
+            self.recycler.stop()
+            self._engine.dispose()
             logger.info("Database cleanup completed")
         except Exception as e:
             logger.error(f"Error during database cleanup: {str(e)}")
             raise
 
+class AsyncDatabaseManager:
+    """
+    Asyncio counterpart of DatabaseManager on an asyncpg-backed engine.
+    Connections authenticate with the same OAuth token, injected when each
+    physical connection is opened. Refreshing the token can block on the
+    token endpoint and the shared token cache's lock, so it is done on a
+    worker thread before checkout and the connect only reads the result.
+    """
+    def __init__(self):
+        # Imported here so the sync app doesn't need the asyncio extension loaded
+        from sqlalchemy.ext.asyncio import create_async_engine
+        self.engine = create_async_engine(
+            config.async_database_url,
+            pool_size=config.db.pool_size,
+            max_overflow=config.db.max_overflow,
+            pool_timeout=config.db.pool_timeout,
+            pool_recycle=token_aligned_recycle(config.db.pool_recycle),
+            pool_pre_ping=config.db.pool_pre_ping
+        )
+        self._setup_event_listeners()
+
+    def _setup_event_listeners(self):
+        @event.listens_for(self.engine.sync_engine, "do_connect")
+        def provide_token(dialect, conn_rec, cargs, cparams):
+            """Provide token for new connection."""
+            # managed_connection refreshed the token off the event loop; one that has
+            # since become due for refresh is still valid until it expires
+            token = tokenminter.token
+            if token is None:
+                logger.warning("No token fetched ahead of an async connect, fetching it on the event loop")
+                try:
+                    token = tokenminter.get_token()
+                except Exception as e:
+                    logger.error(f"Error providing token: {str(e)}")
+                    raise
+            cparams["password"] = token
+
+    @asynccontextmanager
+    async def managed_connection(self):
+        """Async context manager for database connections with proper cleanup."""
+        conn = None
+        try:
+            if tokenminter.cached_token() is None:
+                await asyncio.to_thread(tokenminter.get_token)
+            start = time.perf_counter()
+            try:
+                conn = await self.engine.connect()
+            except TimeoutError:
+                POOL_TIMEOUTS.inc()
+                raise
+            finally:
+                POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+            yield conn
+        except Exception as e:
+            logger.error(f"Error in managed connection: {str(e)}")
+            raise
+        finally:
+            if conn:
+                try:
+                    await conn.close()
+                except Exception as e:
+                    logger.error(f"Error closing connection: {str(e)}")
+
+    async def cleanup(self):
+        """Clean up all resources before shutdown."""
+        try:
+            logger.info("Starting async database cleanup")
+            await self.engine.dispose()
+            logger.info("Async database cleanup completed")
+        except Exception as e:
+            logger.error(f"Error during async database cleanup: {str(e)}")
+            raise
+
 # Initialize database manager
 db_manager = DatabaseManager()
 
+_async_db_manager = None
+_async_db_manager_lock = threading.Lock()
+
+def get_async_db_manager() -> AsyncDatabaseManager:
+    """Shared AsyncDatabaseManager, created on first use so asyncpg stays optional for the sync app"""
+    global _async_db_manager
+    if _async_db_manager is None:
+        with _async_db_manager_lock:
+            if _async_db_manager is None:
+                _async_db_manager = AsyncDatabaseManager()
+    return _async_db_manager
+
 
 
@@ -1,40 +1,122 @@
-import pandas as pd
+import ast
 import time
 import requests
 import os
 from dotenv import load_dotenv
-from typing import Dict, Any, Optional, List, Union, Tuple
+from typing import TYPE_CHECKING, Callable, Dict, Any, Iterator, Optional, List, Union, Tuple
 import logging
 import backoff
-import uuid
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 from token_minter import tokenminter
-from chat_database import ChatDatabase
-from models import MessageResponse
-from datetime import datetime, timezone
+from chat_recorder import chat_recorder, is_reused, reused_id, session_id_for
+from result_store import result_store, ResultSource
+from result_blobs import referenced_result
+from similar_questions import similar_questions
+from models import AnswerPart, GenieResponse
 from config import config
+from tracing import tracer
+from metrics import registry
+from structured_logging import log_fields
+
+if TYPE_CHECKING:
+    import pandas as pd  # Imported where frames are built, so loading the client doesn't load pandas
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+GENIE_REQUESTS = registry.counter(
+    "genie_client_requests_total", "Genie API requests by client method and outcome", ("method", "outcome"))
+GENIE_REQUEST_SECONDS = registry.histogram(
+    "genie_client_request_seconds", "Genie API request latency by client method", ("method",))
+GENIE_MESSAGE_POLLS = registry.histogram(
+    "genie_message_polls", "Status polls needed per message", buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 150))
+QUESTIONS_IN_FLIGHT = registry.gauge("genie_questions_in_flight", "Questions currently being answered")
+
+GENIE_QUESTION_SECONDS = registry.histogram(
+    "genie_question_seconds", "Time to answer a question by conversation mode (new, follow_up, restarted, similar)", ("mode",))
+
+# Upper bound on concurrent result fetches for one multi-query answer
+RESULT_FETCH_WORKERS = 8
+
+class ConversationExpiredError(Exception):
+    """The Genie conversation a follow-up was sent to no longer exists"""
+
+def conversation_expired(e: Exception) -> bool:
+    """Whether a failed request means the conversation is gone"""
+    response = getattr(e, "response", None)
+    if response is not None and response.status_code == 404:
+        return True
+    return "Conversation not found" in str(e)
+
+def instrumented(method):
+    """Count and time each attempt of a Genie API call"""
+    name = method.__name__.lstrip("_")
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = method(*args, **kwargs)
+            outcome = "success"
+            return result
+        finally:
+            GENIE_REQUEST_SECONDS.observe(time.perf_counter() - start, method=name)
+            GENIE_REQUESTS.inc(method=name, outcome=outcome)
+    return wrapper
+
 # Load environment variables
 SPACE_ID = os.environ.get("SPACE_ID")
 DATABRICKS_HOST = os.environ.get("DATABRICKS_HOST")
 
+def parse_query_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Pull the first chunk of rows, the schema and chunking details out of a statement_response"""
+    # Extract data_array from the correct nested location
+    data_array = []
+    next_chunk_index = None
+    if 'statement_response' in result:
+        if 'result' in result['statement_response']:
+            data_array = result['statement_response']['result'].get('data_array', [])
+            next_chunk_index = result['statement_response']['result'].get('next_chunk_index')
+        
+    return {
+                'data_array': data_array,
+                'schema': result.get('statement_response', {}).get('manifest', {}).get('schema', {}),
+                'statement_id': result.get('statement_response', {}).get('statement_id'),
+                'next_chunk_index': next_chunk_index
+            }
+
+def query_result_frame(query_result: Dict[str, Any]) -> "pd.DataFrame":
+    """DataFrame of a parsed query result's rows"""
+    import pandas as pd
+
+    data_array = query_result.get('data_array', [])
+    columns = [col.get('name') for col in query_result.get('schema', {}).get('columns', [])]
+
+    # If no columns from schema, create generic ones
+    if not columns and data_array:
+        columns = [f"column_{i}" for i in range(len(data_array[0]))]
+
+    with tracer.span("genie.build_dataframe", rows=len(data_array), columns=len(columns)):
+        return pd.DataFrame(data_array, columns=columns)
+
 class GenieClient:
-    def __init__(self):
+    def __init__(self, session_id: Optional[str] = None):
+        self.session_id = session_id  # Chat session messages are saved to, if not their conversation's own
         self.host = config.databricks.host
         self.space_id = config.databricks.space_id
-        self.db = ChatDatabase()
-        self.base_url = f"https://{self.host}/api/2.0/genie/spaces/{self.space_id}"
+        self.base_url = f"{config.databricks.workspace_url}/api/2.0/genie/spaces/{self.space_id}"
         self.update_headers()
-        logger.info(f"Initialized GenieClient with host: {self.host}, space_id: {self.space_id}")
+        logger.debug("Initialized GenieClient with host: %s, space_id: %s", self.host, self.space_id)
     
     def update_headers(self) -> None:
         """Update headers with fresh token from token_minter"""
         try:
-            token = tokenminter.get_token()
+            with tracer.span("genie.token_fetch"):
+                token = tokenminter.get_token()
             if not token:
                 raise ValueError("Failed to get token from token_minter")
             
@@ -47,36 +129,56 @@ class GenieClient:
             logger.error(f"Error updating headers: {str(e)}")
             raise
 
-    def save_to_database(self, conversation_id: str, genie_message_id: str, content: str, role: str = "assistant", query_text: str = None):
-        """Save message to database"""
-        try:
-            session_id = str(uuid.uuid4())  # Generate a unique session ID
-            user_id = "default_user"  
-            message_id = str(uuid.uuid4())  # Generate a unique message ID
-            
-            # Convert timestamp to UTC datetime
-            current_time = datetime.now(timezone.utc)
-            
-            message = MessageResponse(
-                message_id=message_id,
+    def save_to_database(self, conversation_id: str, genie_message_id: str, content: str = None, role: str = "assistant",
+                         query_text: str = None, parts: List[AnswerPart] = ()):
+        """
+        Queue a message for persistence. Writes happen on the chat recorder's
+        background thread, as does encoding the results of an answer given as
+        parts, so this never blocks on or raises from the database.
+        """
+        with tracer.span("genie.save_to_database", role=role):
+            chat_recorder.record(
+                conversation_id=conversation_id,
                 genie_message_id=genie_message_id,
                 content=content,
                 role=role,
-                timestamp=current_time
+                query_text=query_text,
+                parts=parts,
+                session_id=self.session_id
             )
-            
-            self.db.save_message_to_session(
-                session_id=session_id,
-                user_id=user_id,
-                message=message,
-                conversation_id=conversation_id,
-                query_text=query_text
-            )
-            logger.debug(f"Successfully saved message to database: message_id={message_id}, genie_message_id={genie_message_id}")
-        except Exception as e:
-            logger.error(f"Error saving to database: {str(e)}")
-            raise
     
+    def start_conversation(self, question: str) -> Dict[str, Any]:
+        """Start a new conversation with the given question"""
+        with tracer.span("genie.start_conversation") as span:
+            result = self._post_start_conversation(question)
+            span.set_attributes(conversation_id=result.get("conversation_id"), message_id=result.get("message_id"))
+        tracer.current_span().set_attributes(conversation_id=result.get("conversation_id"), message_id=result.get("message_id"))
+        
+        # Save user's question outside the retried request so persistence can never re-send it
+        self.save_to_database(
+            conversation_id=result.get("conversation_id"),
+            genie_message_id=result.get("message_id"),
+            content=question,
+            role="user"
+        )
+        return result
+
+    def send_message(self, conversation_id: str, message: str) -> Dict[str, Any]:
+        """Send a follow-up message to an existing conversation"""
+        with tracer.span("genie.send_message", conversation_id=conversation_id) as span:
+            result = self._post_message(conversation_id, message)
+            span.set_attribute("message_id", result.get("message_id"))
+        tracer.current_span().set_attributes(conversation_id=conversation_id, message_id=result.get("message_id"))
+        
+        # Save user's message outside the retried request so persistence can never re-send it
+        self.save_to_database(
+            conversation_id=conversation_id,
+            genie_message_id=result.get("message_id"),
+            content=message,
+            role="user"
+        )
+        return result
+
     @backoff.on_exception(
         backoff.expo,
         Exception,  
@@ -87,28 +189,19 @@ class GenieClient:
             f"API request failed. Retrying in {details['wait']:.2f} seconds (attempt {details['tries']})"
         )
     )
-    def start_conversation(self, question: str) -> Dict[str, Any]:
-        """Start a new conversation with the given question"""
+    @instrumented
+    def _post_start_conversation(self, question: str) -> Dict[str, Any]:
+        """POST the start-conversation request"""
         self.update_headers()  # Refresh token before API call
         url = f"{self.base_url}/start-conversation"
         payload = {"content": question}
         
-        logger.info(f"Starting conversation with question: {question[:50]}...")
+        logger.info("Starting conversation with question: %s...", question[:50])
         
         try:
             response = requests.post(url, headers=self.headers, json=payload)
             response.raise_for_status()
-            result = response.json()
-            
-            # Save user's question to database
-            self.save_to_database(
-                conversation_id=result.get("conversation_id"),
-                genie_message_id=result.get("message_id"),
-                content=question,
-                role="user"
-            )
-            
-            return result
+            return response.json()
         except Exception as e:
             logger.error(f"Error in start_conversation: {str(e)}")
             raise
@@ -119,12 +212,14 @@ class GenieClient:
         max_tries=5,
         factor=2,
         jitter=backoff.full_jitter,
+        giveup=conversation_expired,  # An expired conversation will not come back, so restart at once
         on_backoff=lambda details: logger.warning(
             f"API request failed. Retrying in {details['wait']:.2f} seconds (attempt {details['tries']})"
         )
     )
-    def send_message(self, conversation_id: str, message: str) -> Dict[str, Any]:
-        """Send a follow-up message to an existing conversation"""
+    @instrumented
+    def _post_message(self, conversation_id: str, message: str) -> Dict[str, Any]:
+        """POST a follow-up message request"""
         self.update_headers()
         url = f"{self.base_url}/conversations/{conversation_id}/messages"
         payload = {"content": message}
@@ -132,17 +227,7 @@ class GenieClient:
         try:
             response = requests.post(url, headers=self.headers, json=payload)
             response.raise_for_status()
-            result = response.json()
-            
-            # Save user's message to database
-            self.save_to_database(
-                conversation_id=conversation_id,
-                genie_message_id=result.get("message_id"),
-                content=message,
-                role="user"
-            )
-            
-            return result
+            return response.json()
         except Exception as e:
             logger.error(f"Error in send_message: {str(e)}")
             raise
@@ -157,6 +242,7 @@ class GenieClient:
             f"API request failed. Retrying in {details['wait']:.2f} seconds (attempt {details['tries']})"
         )
     )
+    @instrumented
     def get_message(self, conversation_id: str, message_id: str) -> Dict[str, Any]:
         """Get the details of a specific message"""
         self.update_headers()  # Refresh token before API call
@@ -176,25 +262,57 @@ class GenieClient:
             f"API request failed. Retrying in {details['wait']:.2f} seconds (attempt {details['tries']})"
         )
     )
+    @instrumented
     def get_query_result(self, conversation_id: str, message_id: str, attachment_id: str) -> Dict[str, Any]:
         """Get the query result using the attachment_id endpoint"""
         self.update_headers()  # Refresh token before API call
         url = f"{self.base_url}/conversations/{conversation_id}/messages/{message_id}/attachments/{attachment_id}/query-result"
         
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        result = response.json()
+        with tracer.span("genie.get_query_result", conversation_id=conversation_id, message_id=message_id, attachment_id=attachment_id):
+            response = requests.get(url, headers=self.headers)
+            response.raise_for_status()
+            result = response.json()
         
-        # Extract data_array from the correct nested location
-        data_array = []
-        if 'statement_response' in result:
-            if 'result' in result['statement_response']:
-                data_array = result['statement_response']['result'].get('data_array', [])
-            
-        return {
-                    'data_array': data_array,
-                    'schema': result.get('statement_response', {}).get('manifest', {}).get('schema', {})
-                }
+        return parse_query_result(result)
+
+    @backoff.on_exception(
+        backoff.expo,
+        Exception,  # Retry on any exception
+        max_tries=5,
+        factor=2,
+        jitter=backoff.full_jitter,
+        on_backoff=lambda details: logger.warning(
+            f"API request failed. Retrying in {details['wait']:.2f} seconds (attempt {details['tries']})"
+        )
+    )
+    @instrumented
+    def get_result_chunk(self, statement_id: str, chunk_index: int) -> Dict[str, Any]:
+        """Get one further chunk of a query result from the SQL statement execution API"""
+        self.update_headers()  # Refresh token before API call
+        url = f"{config.databricks.workspace_url}/api/2.0/sql/statements/{statement_id}/result/chunks/{chunk_index}"
+
+        with tracer.span("genie.get_result_chunk", statement_id=statement_id, chunk_index=chunk_index):
+            response = requests.get(url, headers=self.headers)
+            response.raise_for_status()
+            return response.json()
+
+    def iter_query_result(self, conversation_id: str, message_id: str, attachment_id: str) -> Iterator["pd.DataFrame"]:
+        """
+        Yield a query result one chunk at a time, following next_chunk_index,
+        so results larger than the first response can be streamed.
+        """
+        import pandas as pd
+
+        query_result = self.get_query_result(conversation_id, message_id, attachment_id)
+        first = query_result_frame(query_result)
+        columns = list(first.columns)
+        yield first
+
+        next_chunk_index = query_result.get('next_chunk_index')
+        while next_chunk_index is not None:
+            chunk = self.get_result_chunk(query_result['statement_id'], next_chunk_index)
+            yield pd.DataFrame(chunk.get('data_array', []), columns=columns)
+            next_chunk_index = chunk.get('next_chunk_index')
 
     @backoff.on_exception(
         backoff.expo,
@@ -206,6 +324,7 @@ class GenieClient:
             f"API request failed. Retrying in {details['wait']:.2f} seconds (attempt {details['tries']})"
         )
     )
+    @instrumented
     def execute_query(self, conversation_id: str, message_id: str, attachment_id: str) -> Dict[str, Any]:
         """Execute a query using the attachment_id endpoint"""
         self.update_headers()  # Refresh token before API call
@@ -216,97 +335,201 @@ class GenieClient:
         return response.json()
     
 
-    def wait_for_message_completion(self, conversation_id: str, message_id: str, timeout: int = 300, poll_interval: int = 2) -> Dict[str, Any]:
+    def wait_for_message_completion(self, conversation_id: str, message_id: str, timeout: int = None, poll_interval: float = None,
+                                    on_status: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
         """
         Wait for a message to reach a terminal state (COMPLETED, ERROR, etc.).
         
         Args:
             conversation_id: The ID of the conversation
             message_id: The ID of the message
-            timeout: Maximum time to wait in seconds
-            poll_interval: Time between status checks in seconds
+            timeout: Maximum time to wait in seconds, defaults to GENIE_POLL_TIMEOUT
+            poll_interval: Time between status checks in seconds, defaults to GENIE_POLL_INTERVAL
+            on_status: Called with the polled message whenever its status or attachments change
             
         Returns:
             The completed message
         """
+        timeout = config.databricks.poll_timeout if timeout is None else timeout
+        poll_interval = config.databricks.poll_interval if poll_interval is None else poll_interval
         start_time = time.time()
         attempt = 1
+        last_seen = None
         
-        while time.time() - start_time < timeout:
-            
-            message = self.get_message(conversation_id, message_id)
-            status = message.get("status")
-            
-            if status in ["COMPLETED", "ERROR", "FAILED"]:
-                return message
+        with tracer.span("genie.wait_for_message_completion", conversation_id=conversation_id, message_id=message_id) as span:
+            while time.time() - start_time < timeout:
                 
-            time.sleep(poll_interval)
-            attempt += 1
-            
-        raise TimeoutError(f"Message processing timed out after {timeout} seconds")
+                message = self.get_message(conversation_id, message_id)
+                status = message.get("status")
+                span.set_attributes(polls=attempt, status=status)
+
+                seen = (status, len(message.get("attachments") or []))
+                if on_status and seen != last_seen:
+                    last_seen = seen
+                    try:
+                        on_status(message)
+                    except Exception as e:
+                        logger.error(f"Error publishing message status: {str(e)}")
+                
+                if status in ["COMPLETED", "ERROR", "FAILED"]:
+                    GENIE_MESSAGE_POLLS.observe(attempt)
+                    return message
+                    
+                time.sleep(poll_interval)
+                attempt += 1
+                
+            GENIE_MESSAGE_POLLS.observe(attempt)
+            raise TimeoutError(f"Message processing timed out after {timeout} seconds")
 
-def process_genie_response(client, conversation_id, message_id, complete_message) -> Tuple[Union[str, pd.DataFrame], Optional[str], str]:
+def process_genie_response(client, conversation_id, message_id, complete_message) -> GenieResponse:
     """Process the response from Genie"""
-    # Check attachments first
-    attachments = complete_message.get("attachments", [])
-    for attachment in attachments:
-        attachment_id = attachment.get("attachment_id")
-        
-        # If there's text content in the attachment, return it
+    with tracer.span("genie.process_response", conversation_id=conversation_id, message_id=message_id):
+        return _process_genie_response(client, conversation_id, message_id, complete_message)
+
+def _fetch_query_part(client, conversation_id, message_id, part: AnswerPart) -> AnswerPart:
+    """Fetch one query attachment's result into its part"""
+    try:
+        query_result = client.get_query_result(conversation_id, message_id, part.attachment_id)
+    except Exception as e:
+        logger.error("Error fetching result: %s", e, extra=log_fields(
+            conversation_id=conversation_id, message_id=message_id, attachment_id=part.attachment_id))
+        part.error = str(e)
+        return part
+
+    part.data = query_result_frame(query_result)
+    part.complete = query_result.get('next_chunk_index') is None
+    # Keep the result server-side for paging and export; later chunks are re-fetched on export
+    result_store.put(part.attachment_id, part.data, ResultSource(
+        conversation_id=conversation_id,
+        message_id=message_id,
+        attachment_id=part.attachment_id,
+        complete=part.complete
+    ))
+    return part
+
+def _process_genie_response(client, conversation_id, message_id, complete_message) -> GenieResponse:
+    parts = []
+    for attachment in complete_message.get("attachments") or []:
         if "text" in attachment and "content" in attachment["text"]:
-            content = attachment["text"]["content"]
-            # Save assistant's response to database
-            client.save_to_database(
-                conversation_id=conversation_id,
-                genie_message_id=message_id,
-                content=content,
-                role="assistant"
-            )
-            return content, None, message_id
-        
-        # If there's a query, get the result
+            parts.append(AnswerPart(kind="text", attachment_id=attachment.get("attachment_id"),
+                                    text=attachment["text"]["content"]))
         elif "query" in attachment:
-            query_text = attachment.get("query", {}).get("query", "")
-            query_result = client.get_query_result(conversation_id, message_id, attachment_id)
-           
-            data_array = query_result.get('data_array', [])
-            schema = query_result.get('schema', {})
-            columns = [col.get('name') for col in schema.get('columns', [])]
-            
-            # If we have data, return as DataFrame
-            if data_array:
-                # If no columns from schema, create generic ones
-                if not columns and data_array and len(data_array) > 0:
-                    columns = [f"column_{i}" for i in range(len(data_array[0]))]
-                
-                df = pd.DataFrame(data_array, columns=columns)
-                # Save query result to database
-                client.save_to_database(
-                    conversation_id=conversation_id,
-                    genie_message_id=message_id,
-                    content=str(df.to_dict()),
-                    role="assistant",
-                    query_text=query_text
-                )
-                return df, query_text, message_id
-    
-    # If no attachments or no data in attachments, return text content
-    if 'content' in complete_message:
-        content = complete_message.get('content', '')
-        # Save assistant's response to database
-        client.save_to_database(
-            conversation_id=conversation_id,
-            genie_message_id=message_id,
-            content=content,
-            role="assistant"
-        )
-        return content, None, message_id
-    
-    return "No response available", None, message_id
+            query = attachment.get("query", {})
+            parts.append(AnswerPart(kind="query", attachment_id=attachment.get("attachment_id"),
+                                    query_text=query.get("query", ""), description=query.get("description")))
+
+    # Fetch every query result at once, so the answer takes as long as the slowest fetch
+    query_parts = [part for part in parts if part.kind == "query"]
+    if len(query_parts) == 1:
+        _fetch_query_part(client, conversation_id, message_id, query_parts[0])
+    elif query_parts:
+        with ThreadPoolExecutor(max_workers=min(len(query_parts), RESULT_FETCH_WORKERS)) as executor:
+            # Each fetch runs in a copy of this context so its spans nest under this one
+            futures = [
+                executor.submit(contextvars.copy_context().run, _fetch_query_part, client, conversation_id, message_id, part)
+                for part in query_parts
+            ]
+            for future in futures:
+                future.result()
+
+    # If no attachments, fall back to the message content
+    if not parts:
+        parts.append(AnswerPart(kind="text", text=complete_message.get("content") or "No response available"))
+
+    # Save the assistant's answer to the database as a single message, its results by reference
+    client.save_to_database(
+        conversation_id=conversation_id,
+        genie_message_id=message_id,
+        role="assistant",
+        parts=parts
+    )
+    return GenieResponse(conversation_id=conversation_id, message_id=message_id, parts=parts)
+
+def result_references(content: str) -> List[str]:
+    """Hashes of the stored results a saved answer refers to"""
+    return [reference.result_hash for reference in map(referenced_result, (content or "").split("\n\n")) if reference]
+
+def stored_answer_parts(content: str, query_text: Optional[str], message_id: str,
+                        results: Optional[Dict[str, "pd.DataFrame"]] = None,
+                        saved_at: Optional[float] = None) -> List[AnswerPart]:
+    """
+    Rebuild the parts of a saved answer. Parts are joined with blank lines,
+    which neither a result reference nor a result's dict repr (as answers were
+    saved before results were stored apart) ever contains, so each such block
+    is a result and the text between them is text. results holds the
+    referenced frames by hash. Result parts get the handle "<message_id>-<n>",
+    and are marked incomplete when only their first rows were saved.
+
+    Results are put in the result store under their handle, for paging and
+    export, with the Genie message they came from when it was saved; they
+    count as fetched at saved_at, so the refresher brings old ones up to date.
+    """
+    import pandas as pd
+
+    max_rows = config.display.table_max_rows
+    parts, text_blocks = [], []
+    for block in (content or "").split("\n\n"):
+        data = None
+        reference = referenced_result(block)
+        if reference:
+            if text_blocks:
+                parts.append(AnswerPart(kind="text", text="\n\n".join(text_blocks)))
+                text_blocks = []
+            data = (results or {}).get(reference.result_hash)
+            part = AnswerPart(kind="query", attachment_id=f"{message_id}-{len(parts)}", data=data,
+                              error=None if data is not None else "the stored result is no longer available",
+                              complete=not reference.partial)
+            source = None
+            if reference.attachment_id:
+                source = ResultSource(conversation_id=reference.conversation_id, message_id=reference.message_id,
+                                      attachment_id=reference.attachment_id, complete=part.complete,
+                                      fetched_at=saved_at or time.time())
+            else:
+                part.complete = part.complete and not _maybe_cut(data, max_rows)
+            if data is not None:
+                result_store.put(part.attachment_id, data, source)
+            parts.append(part)
+            continue
+        if block.startswith("{"):
+            try:
+                value = ast.literal_eval(block)
+                if isinstance(value, dict) and all(isinstance(column, dict) for column in value.values()):
+                    data = pd.DataFrame(value)
+            except (ValueError, SyntaxError):
+                pass
+        if data is None:
+            text_blocks.append(block)
+            continue
+        if text_blocks:
+            parts.append(AnswerPart(kind="text", text="\n\n".join(text_blocks)))
+            text_blocks = []
+        parts.append(AnswerPart(kind="query", attachment_id=f"{message_id}-{len(parts)}", data=data,
+                                complete=not _maybe_cut(data, max_rows)))
+        result_store.put(parts[-1].attachment_id, data)
+    if text_blocks:
+        parts.append(AnswerPart(kind="text", text="\n\n".join(text_blocks)))
 
-def start_new_conversation(question: str) -> Tuple[str, Union[str, pd.DataFrame], Optional[str], str]:
-    """Start a new conversation with Genie"""
-    client = GenieClient()
+    # Queries were saved joined the same way; attach them in order when they line up
+    query_parts = [part for part in parts if part.kind == "query"]
+    queries = query_text.split("\n\n") if query_text else []
+    if len(queries) == len(query_parts):
+        for part, query in zip(query_parts, queries):
+            part.query_text = query
+    elif query_parts and query_text:
+        query_parts[0].query_text = query_text
+    return parts
+
+def _maybe_cut(data: Optional["pd.DataFrame"], max_rows: int) -> bool:
+    # Results saved without their source were cut to exactly max_rows when they were cut
+    return data is not None and len(data) == max_rows
+
+def _error_response(conversation_id: Optional[str], text: str) -> GenieResponse:
+    return GenieResponse(conversation_id=conversation_id, message_id=None, parts=[AnswerPart(kind="text", text=text)])
+
+def start_new_conversation(question: str, on_status: Optional[Callable[[Dict[str, Any]], None]] = None,
+                           session_id: Optional[str] = None) -> GenieResponse:
+    """Start a new conversation with Genie, saved to session_id if given"""
+    client = GenieClient(session_id=session_id)
     
     try:
         # Start a new conversation
@@ -315,62 +538,125 @@ def start_new_conversation(question: str) -> Tuple[str, Union[str, pd.DataFrame]
         message_id = response.get("message_id")
         
         # Wait for the message to complete
-        complete_message = client.wait_for_message_completion(conversation_id, message_id)
+        complete_message = client.wait_for_message_completion(conversation_id, message_id, on_status=on_status)
         
         # Process the response
-        result, query_text, message_id = process_genie_response(client, conversation_id, message_id, complete_message)
-        
-        return conversation_id, result, query_text, message_id
+        return process_genie_response(client, conversation_id, message_id, complete_message)
         
     except Exception as e:
         logger.error(f"Error in start_new_conversation: {str(e)}")
-        return None, f"Sorry, an error occurred: {str(e)}. Please try again.", None, None
+        return _error_response(None, f"Sorry, an error occurred: {str(e)}. Please try again.")
 
-def continue_conversation(conversation_id: str, question: str) -> Tuple[Union[str, pd.DataFrame], Optional[str]]:
-    """Send a follow-up message in an existing conversation"""
-    logger.info(f"Continuing conversation {conversation_id} with question: {question[:30]}...")
+def continue_conversation(conversation_id: str, question: str, on_status: Optional[Callable[[Dict[str, Any]], None]] = None,
+                          session_id: Optional[str] = None) -> GenieResponse:
+    """
+    Send a follow-up message in an existing conversation, saved to session_id if given.
+
+    Raises:
+        ConversationExpiredError: if Genie no longer has the conversation
+    """
+    logger.info("Continuing conversation with question: %s...", question[:30], extra=log_fields(conversation_id=conversation_id))
     
-    client = GenieClient()
+    client = GenieClient(session_id=session_id)
     
     try:
         # Send follow-up message in existing conversation
-        response = client.send_message(conversation_id, question)
+        try:
+            response = client.send_message(conversation_id, question)
+        except Exception as e:
+            if conversation_expired(e):
+                raise ConversationExpiredError(conversation_id) from e
+            raise
         message_id = response.get("message_id")
         
         # Wait for the message to complete
-        complete_message = client.wait_for_message_completion(conversation_id, message_id)
+        complete_message = client.wait_for_message_completion(conversation_id, message_id, on_status=on_status)
         
         # Process the response
-        result, query_text, message_id = process_genie_response(client, conversation_id, message_id, complete_message)
-        
-        return result, query_text
+        return process_genie_response(client, conversation_id, message_id, complete_message)
         
+    except ConversationExpiredError:
+        raise
     except Exception as e:
         logger.error(f"Error in continue_conversation: {str(e)}")
         if "429" in str(e) or "Too Many Requests" in str(e):
-            return "Sorry, the system is currently experiencing high demand. Please try again in a few moments.", None
-        elif "Conversation not found" in str(e):
-            return "Sorry, the previous conversation has expired. Please try your query again to start a new conversation.", None
+            return _error_response(conversation_id, "Sorry, the system is currently experiencing high demand. Please try again in a few moments.")
         else:
-            return f"Sorry, an error occurred: {str(e)}", None
+            return _error_response(conversation_id, f"Sorry, an error occurred: {str(e)}")
+
+def record_reused_answer(question: str, answer: GenieResponse, session_id: Optional[str] = None) -> GenieResponse:
+    """
+    Save a reused answer and its question as a turn of their own, under a new
+    conversation and message id that only the chat history knows, so the turn
+    can be reopened and rated like any other. Its results are saved by the
+    same hashes as the original answer's, and refer to the original Genie message.
+    """
+    conversation_id, message_id = reused_id(), reused_id()
+    chat_recorder.record(conversation_id, message_id, question, role="user", session_id=session_id)
+    chat_recorder.record(conversation_id, message_id, role="assistant", parts=answer.parts, session_id=session_id,
+                         answered_in=(answer.conversation_id, answer.message_id))
+    return replace(answer, conversation_id=conversation_id, message_id=message_id)
+
+def _in_session(response: GenieResponse, session_id: Optional[str]) -> GenieResponse:
+    """The response marked with the chat session it was saved to; error responses are not saved"""
+    if not response.message_id or not response.conversation_id:
+        return response
+    return replace(response, session_id=session_id or session_id_for(response.conversation_id))
 
-def genie_query(question: str) -> Union[Tuple[str, Optional[str], str], Tuple[pd.DataFrame, str, str]]:
+def genie_query(question: str, conversation_id: Optional[str] = None,
+                on_status: Optional[Callable[[Dict[str, Any]], None]] = None,
+                session_id: Optional[str] = None) -> GenieResponse:
     """
     Main entry point for querying Genie.
     
     Args:
         question: The question to ask
+        conversation_id: The chat's Genie conversation, if it has one; the question is
+            sent as a follow-up so Genie keeps its context, restarting if it has expired
+        on_status: Called with the Genie message as its status changes while the answer is prepared
+        session_id: The chat's session, if it has one. Defaults to the session of
+            conversation_id, so a conversation started in its place saves to the same chat.
         
     Returns:
-        Tuple containing either:
-        - (text_response, None, message_id) for text responses
-        - (dataframe, sql_query, message_id) for data responses
+        GenieResponse with one part per answer attachment: text replies, and
+        queries with their SQL and result DataFrame (or fetch error), and the
+        session it was saved to. A question that starts a conversation may be
+        answered with the reused answer to a near-duplicate earlier question,
+        marked by similar_question and saved under a conversation of its own.
     """
+    QUESTIONS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    mode = "follow_up" if conversation_id else "new"
+    if conversation_id and not session_id:
+        session_id = session_id_for(conversation_id)
     try:
-        # Start a new conversation for each query
-        conversation_id, result, query_text, message_id = start_new_conversation(question)
-        return result, query_text, message_id
+        with tracer.span("genie.question", mode=mode) as span:
+            if is_reused(conversation_id):
+                # The chat was answered without Genie so far, so there is no conversation to follow up in
+                mode = "restarted"
+                span.set_attribute("mode", mode)
+            elif conversation_id:
+                try:
+                    return _in_session(continue_conversation(conversation_id, question, on_status=on_status,
+                                                             session_id=session_id), session_id)
+                except ConversationExpiredError:
+                    logger.info("Conversation has expired, starting a new one", extra=log_fields(conversation_id=conversation_id))
+                    mode = "restarted"
+                    span.set_attribute("mode", mode)
+            else:
+                # Follow-ups depend on their conversation, so only opening questions are reused
+                similar = similar_questions.lookup(question)
+                if similar is not None:
+                    mode = "similar"
+                    span.set_attribute("mode", mode)
+                    return _in_session(record_reused_answer(question, similar, session_id), session_id)
+            response = start_new_conversation(question, on_status=on_status, session_id=session_id)
+            similar_questions.add(question, response)
+            return _in_session(response, session_id)
             
     except Exception as e:
         logger.error(f"Error in conversation: {str(e)}. Please try again.")
-        return f"Sorry, an error occurred: {str(e)}. Please try again.", None, None
+        return _error_response(None, f"Sorry, an error occurred: {str(e)}. Please try again.")
+    finally:
+        GENIE_QUESTION_SECONDS.observe(time.perf_counter() - start, mode=mode)
+        QUESTIONS_IN_FLIGHT.dec()
@@ -0,0 +1,386 @@
+import threading
+import bisect
+import glob
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # No flock on Windows; retiring snapshots is then not serialized between processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond pool checkouts up to slow Genie answers
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+class Counter(_Metric):
+    """A monotonically increasing count"""
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+class Gauge(_Metric):
+    """A value that can go up and down, or be computed on read"""
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels) -> None:
+        """Compute the gauge from function each time it is read"""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def value(self, **labels) -> float:
+        return self.samples().get(self._key(labels), 0)
+
+    def samples(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = float(function())
+            except Exception:
+                continue
+        return values
+
+class Histogram(_Metric):
+    """Bucketed observations with a running count and sum"""
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last slot is +Inf), then count and sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    def samples(self) -> Dict[LabelValues, dict]:
+        with self._lock:
+            return {
+                key: {"buckets": list(state[0]), "count": state[1], "sum": state[2]}
+                for key, state in self._values.items()
+            }
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Approximate quantile from bucket upper bounds"""
+        state = self.samples().get(self._key(labels))
+        if not state or not state["count"]:
+            return None
+        target = q * state["count"]
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), state["buckets"]):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+class MetricsRegistry:
+    """Process-wide collection of named metrics"""
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, description: str, labelnames: Iterable[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, description, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, description: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, description, labelnames)
+
+    def gauge(self, name: str, description: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, description, labelnames)
+
+    def histogram(self, name: str, description: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description, labelnames, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def reset_after_fork(self) -> None:
+        """
+        Clear values inherited from the parent in a forked child, so per-process
+        snapshots are not double counted when merged; computed gauges are kept.
+        """
+        self._lock = threading.Lock()
+        for metric in self._metrics.values():
+            metric._lock = threading.Lock()
+            metric._values = {}
+
+    def snapshot(self) -> Dict[str, dict]:
+        """JSON-serializable view of every metric, keyed by name"""
+        snapshot = {}
+        for metric in self.metrics():
+            entry = {
+                "kind": metric.kind,
+                "description": metric.description,
+                "labelnames": list(metric.labelnames),
+                "samples": [[list(key), value] for key, value in metric.samples().items()],
+            }
+            if isinstance(metric, Histogram):
+                entry["buckets"] = list(metric.buckets)
+            snapshot[metric.name] = entry
+        return snapshot
+
+class MultiProcessExporter:
+    """
+    Shares metrics between worker processes through a directory.
+    Each process periodically writes its own snapshot to a file named after its
+    pid; a scrape merges every live process's file, summing counters,
+    histograms and gauges.
+
+    When a process exits, or a scrape finds it dead, its counters and
+    histograms are folded into a retired-totals file and its gauges dropped,
+    so merged counters never go backwards when a worker is replaced.
+    """
+    RETIRED_FILE = "retired.json"
+
+    def __init__(self, registry: MetricsRegistry, directory: str, interval: float = 5.0):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self._pid = None
+        self._retired_pid = None
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self) -> None:
+        """Start flushing from this process; safe to call again after a fork"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, name="metrics-flush", daemon=True).start()
+
+    def stop(self) -> None:
+        """Write this process's final counts into the retired totals"""
+        self._stop.set()
+        self.flush()
+        with self._flush_lock:
+            self.mark_process_dead(os.getpid())
+            # A flush after this would count the process twice
+            self._retired_pid = os.getpid()
+
+    def mark_process_dead(self, pid: int) -> None:
+        """Fold an exited process's counters and histograms into the retired totals"""
+        with self._retired_lock():
+            self._retire(self._path(pid))
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"metrics-{pid}.json")
+
+    def _snapshot_paths(self) -> Dict[int, str]:
+        return {int(os.path.basename(path)[len("metrics-"):-len(".json")]): path
+                for path in glob.glob(os.path.join(self.directory, "metrics-*.json"))}
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write this process's snapshot atomically"""
+        with self._flush_lock:
+            if self._retired_pid == os.getpid():
+                return
+            try:
+                self._write(self._path(os.getpid()), self.registry.snapshot())
+            except Exception as e:
+                logger.error(f"Error writing metrics snapshot: {str(e)}")
+
+    def _write(self, path: str, snapshot: Dict[str, dict]) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def _retired_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, "retired.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _retire(self, path: str) -> None:
+        """Move a snapshot's counters and histograms into the retired totals; hold the retired lock"""
+        snapshot = _read_snapshot(path)
+        if snapshot is None:
+            return
+        retired: Dict[str, dict] = {}
+        _merge_snapshot(retired, _read_snapshot(os.path.join(self.directory, self.RETIRED_FILE)) or {})
+        _merge_snapshot(retired, {name: entry for name, entry in snapshot.items() if entry["kind"] != "gauge"})
+        try:
+            self._write(os.path.join(self.directory, self.RETIRED_FILE), _sample_lists(retired))
+            os.remove(path)
+        except OSError as e:
+            logger.error(f"Error retiring metrics snapshot {path}: {str(e)}")
+
+    def collect(self) -> Dict[str, dict]:
+        """Merge the retired totals with the snapshots of every live process"""
+        self.flush()
+        merged: Dict[str, dict] = {}
+        with self._retired_lock():
+            for pid, path in self._snapshot_paths().items():
+                if not _pid_alive(pid):
+                    self._retire(path)
+            _merge_snapshot(merged, _read_snapshot(os.path.join(self.directory, self.RETIRED_FILE)) or {})
+        for path in self._snapshot_paths().values():
+            _merge_snapshot(merged, _read_snapshot(path) or {})
+        return _sample_lists(merged)
+
+def _read_snapshot(path: str) -> Optional[Dict[str, dict]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _merge_snapshot(merged: Dict[str, dict], snapshot: Dict[str, dict]) -> None:
+    """Add a snapshot's samples into merged, whose samples are keyed by label values"""
+    for name, entry in snapshot.items():
+        target = merged.setdefault(name, {**entry, "samples": {}})
+        for labels, value in entry["samples"]:
+            key = tuple(labels)
+            current = target["samples"].get(key)
+            target["samples"][key] = value if current is None else _merge_sample(current, value)
+
+def _sample_lists(merged: Dict[str, dict]) -> Dict[str, dict]:
+    return {name: {**entry, "samples": [[list(key), value] for key, value in entry["samples"].items()]}
+            for name, entry in merged.items()}
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _merge_sample(current, value):
+    if isinstance(current, dict):
+        return {
+            "buckets": [a + b for a, b in zip(current["buckets"], value["buckets"])],
+            "count": current["count"] + value["count"],
+            "sum": current["sum"] + value["sum"],
+        }
+    return current + value
+
+def _format_labels(names, values, extra: str = "") -> str:
+    parts = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f'{name}="{escaped}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_prometheus(snapshot: Dict[str, dict]) -> str:
+    """Render a registry snapshot in the Prometheus text exposition format"""
+    lines = []
+    for name, entry in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {entry['description']}")
+        lines.append(f"# TYPE {name} {entry['kind']}")
+        labelnames = entry["labelnames"]
+        for labels, value in entry["samples"]:
+            if entry["kind"] == "histogram":
+                cumulative = 0
+                for bound, count in zip(entry["buckets"] + [float("inf")], value["buckets"]):
+                    cumulative += count
+                    le = 'le="' + _format_value(bound) + '"'
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labelnames, labels)} {value['count']}")
+            else:
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# Shared by every cache in the app so hit ratios can be compared per cache
+CACHE_LOOKUPS = registry.counter("genie_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"))
+
+# GENIE_METRICS_DIR makes /metrics cover every worker process; serve.py sets it when it runs several
+multiprocess_exporter = MultiProcessExporter(registry, os.environ["GENIE_METRICS_DIR"]) if os.getenv("GENIE_METRICS_DIR") else None
+
+def render_latest() -> str:
+    """Current metrics for this process, or for every worker when a metrics directory is set"""
+    if multiprocess_exporter:
+        return render_prometheus(multiprocess_exporter.collect())
+    return render_prometheus(registry.snapshot())
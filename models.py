@@ -13,6 +13,7 @@ class MessageResponse:
     sources: Optional[List[Dict[str, Any]]] = None
     metrics: Optional[Dict[str, Any]] = None
     created_at: Optional[datetime] = None
+    query_text: Optional[str] = None
 
 @dataclass
 class ChatHistoryResponse:
@@ -26,3 +27,45 @@ class ChatHistoryItem:
     timestamp: datetime
     isActive: bool
     created_at: Optional[datetime] = None
+    session_id: Optional[str] = None
+
+@dataclass
+class SearchHit:
+    """A past question and answer matching a search, identified by its Genie message"""
+    genie_message_id: str
+    session_id: str
+    conversation_id: str
+    question: str
+    first_query: str
+    query_text: Optional[str]
+    created_at: datetime
+    score: float
+
+@dataclass
+class AnswerPart:
+    """One attachment of a Genie answer: a text reply or a query with its result"""
+    kind: str  # "text" or "query"
+    attachment_id: Optional[str] = None
+    text: Optional[str] = None
+    query_text: Optional[str] = None
+    description: Optional[str] = None
+    data: Optional[Any] = None  # pandas DataFrame for query parts
+    error: Optional[str] = None
+    complete: bool = True  # False when data holds only the first rows of the result
+
+@dataclass
+class GenieResponse:
+    conversation_id: Optional[str]
+    message_id: Optional[str]
+    parts: List[AnswerPart]
+    similar_question: Optional[str] = None  # Set when this is the reused answer to an earlier, similar question
+    session_id: Optional[str] = None  # The chat session the question and answer were recorded in
+
+    @property
+    def text(self) -> str:
+        """All text parts, for callers that only need a textual answer"""
+        return "\n\n".join(part.text for part in self.parts if part.text)
+
+    @property
+    def query_parts(self) -> List[AnswerPart]:
+        return [part for part in self.parts if part.kind == "query"]
@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Callable, Dict, Optional, Tuple
+from shared_state import SharedDirectory, shared_state
+
+logger = logging.getLogger(__name__)
+
+# What the user sees for each Genie message status
+STATUS_LABELS = {
+    "SUBMITTED": "Submitting your question...",
+    "FILTERING_CONTEXT": "Finding relevant tables...",
+    "FETCHING_METADATA": "Reading table metadata...",
+    "ASKING_AI": "Writing a query...",
+    "PENDING_WAREHOUSE": "Waiting for the SQL warehouse...",
+    "EXECUTING_QUERY": "Running the query...",
+    "COMPLETED": "Fetching results...",
+}
+
+@dataclass
+class QuestionProgress:
+    status: str = "SUBMITTED"
+    sql: Optional[str] = None
+    description: Optional[str] = None
+    version: int = 0
+    updated_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def label(self) -> str:
+        return STATUS_LABELS.get(self.status, "Thinking...")
+
+class ProgressBoard:
+    """
+    Latest progress of each question being answered, published by the Genie
+    polling loop and read by the UI. Entries are removed when a question
+    finishes, or expire after ttl seconds if it never does. With a shared
+    directory, each change is also written there, so the UI's polling finds
+    it whichever worker serves the poll; a worker reads another's entry
+    again only once its file has changed.
+    """
+    def __init__(self, ttl: float = 900.0, shared: Optional[SharedDirectory] = None):
+        self.ttl = ttl
+        self.shared = shared
+        self._questions: Dict[str, QuestionProgress] = {}
+        self._remote: Dict[str, Tuple[int, QuestionProgress]] = {}  # question id -> (file mtime, entry read)
+        self._lock = threading.Lock()
+        if shared:
+            shared.limit("progress", ".json", max_age=ttl)
+
+    def publish(self, question_id: str, message: Dict[str, Any]) -> None:
+        """Record the status and any query attachment of a polled Genie message"""
+        sql, description = None, None
+        for attachment in message.get("attachments") or []:
+            query = attachment.get("query")
+            if query and query.get("query"):
+                sql, description = query["query"], query.get("description")
+                break
+
+        now = time.monotonic()
+        with self._lock:
+            progress = self._questions.setdefault(question_id, QuestionProgress())
+            before = (progress.status, progress.sql, progress.description)
+            progress.status = message.get("status") or progress.status
+            progress.sql = sql or progress.sql
+            progress.description = description or progress.description
+            progress.version += 1
+            progress.updated_at = now
+            changed = progress.version == 1 or before != (progress.status, progress.sql, progress.description)
+            snapshot = replace(progress)
+            expired = [key for key, value in self._questions.items() if now - value.updated_at > self.ttl]
+            for key in expired:
+                del self._questions[key]
+        if self.shared and changed:
+            try:
+                self.shared.write_json(self.shared.path("progress", question_id, ".json"), asdict(snapshot))
+            except OSError as e:
+                logger.warning(f"Could not share progress of question {question_id}: {str(e)}")
+
+    def publisher(self, question_id: str) -> Callable[[Dict[str, Any]], None]:
+        """Callback for GenieClient.wait_for_message_completion's on_status"""
+        return lambda message: self.publish(question_id, message)
+
+    def get(self, question_id: str) -> Optional[QuestionProgress]:
+        """A snapshot of the question's progress, or None if it is unknown or finished"""
+        with self._lock:
+            progress = self._questions.get(question_id)
+            if progress:
+                return replace(progress)
+        if self.shared:
+            return self._shared_progress(question_id)
+        return None
+
+    def _shared_progress(self, question_id: str) -> Optional[QuestionProgress]:
+        """The entry published by the worker answering the question"""
+        path = self.shared.path("progress", question_id, ".json")
+        try:
+            info = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._remote.pop(question_id, None)
+            return None
+        if time.time() - info.st_mtime > self.ttl:
+            return None
+        with self._lock:
+            cached = self._remote.get(question_id)
+        if cached and cached[0] == info.st_mtime_ns:
+            return replace(cached[1])
+        entry = self.shared.read_json(path)
+        if not entry:
+            return None
+        progress = QuestionProgress(**entry)
+        cutoff = time.time_ns() - int(self.ttl * 1e9)
+        with self._lock:
+            self._remote[question_id] = (info.st_mtime_ns, progress)
+            for key in [key for key, (mtime, _) in self._remote.items() if mtime < cutoff]:
+                del self._remote[key]
+        return replace(progress)
+
+    def reset_after_fork(self) -> None:
+        self._questions = {}
+        self._remote = {}
+        self._lock = threading.Lock()
+
+    def finish(self, question_id: str) -> None:
+        with self._lock:
+            self._questions.pop(question_id, None)
+            self._remote.pop(question_id, None)
+        if self.shared:
+            self.shared.remove(self.shared.path("progress", question_id, ".json"))
+
+# Initialize progress board
+progress_board = ProgressBoard(shared=shared_state)
@@ -0,0 +1,98 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+from config import config
+from metrics import registry, CACHE_LOOKUPS
+from result_refresh import result_refresher
+from result_store import result_store
+from structured_logging import log_fields
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RenderedMessage:
+    payload: bytes  # Component tree as Dash sends it to the browser
+    versions: Dict[str, int]  # Refresh version of each result shown, when rendered
+
+def render_options() -> Tuple:
+    """Settings that change how an answer renders, part of every cache key"""
+    display = config.display
+    return (display.page_size, display.table_max_rows, display.table_max_bytes, display.sample_rows)
+
+class RenderCache:
+    """
+    Serialized component trees of rendered Genie answers, keyed by Genie
+    message id, the position ids were derived from and render_options(), so
+    re-showing a stored chat costs a lookup instead of parsing its results,
+    building tables and formatting SQL again. Least recently used entries are
+    evicted once the byte budget is exceeded.
+
+    An entry is only reused while every result it shows is still in the
+    result store, for paging and export, and unchanged by a background refresh.
+    """
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = config.display.render_cache_bytes if max_bytes is None else max_bytes
+        self._entries: "OrderedDict[Tuple, RenderedMessage]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def get(self, message_id: str, query_index: str) -> Optional[Dict[str, Any]]:
+        """The cached component tree as JSON, or None if it is missing or out of date"""
+        key = (message_id, query_index, render_options())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and not self._current(entry):
+            self._discard(key)
+            entry = None
+        CACHE_LOOKUPS.inc(cache="renders", result="hit" if entry is not None else "miss")
+        return json.loads(entry.payload) if entry is not None else None
+
+    def put(self, message_id: str, query_index: str, component, handles: Iterable[str] = ()) -> None:
+        """Cache a rendered answer along with the results it shows"""
+        # Imported here so loading the cache doesn't load plotly
+        from plotly.io.json import to_json_plotly
+
+        payload = to_json_plotly(component).encode()
+        if len(payload) > self.max_bytes:
+            logger.warning("Rendered message of %d bytes exceeds the render cache budget, not caching it", len(payload),
+                           extra=log_fields(message_id=message_id))
+            return
+        key = (message_id, query_index, render_options())
+        entry = RenderedMessage(payload, {handle: result_refresher.version(handle) for handle in handles})
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self._bytes -= len(previous.payload)
+            self._entries[key] = entry
+            self._bytes += len(payload)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.payload)
+
+    def _current(self, entry: RenderedMessage) -> bool:
+        return all(handle in result_store and result_refresher.version(handle) == version
+                   for handle, version in entry.versions.items())
+
+    def _discard(self, key: Tuple) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= len(entry.payload)
+
+# Initialize render cache
+render_cache = RenderCache()
+
+RENDER_CACHE_BYTES = registry.gauge("genie_render_cache_bytes", "Bytes of serialized answer components held for re-showing chats")
+RENDER_CACHE_BYTES.set_function(lambda: render_cache.nbytes)
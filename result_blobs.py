@@ -0,0 +1,156 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+from config import config
+from metrics import registry
+from models import AnswerPart
+from structured_logging import log_fields
+
+logger = logging.getLogger(__name__)
+
+RESULT_BLOB_WRITES = registry.counter(
+    "genie_result_blob_writes_total",
+    "Query results referenced by saved answers, by whether their data had to be sent to the database",
+    ("result",))
+
+# Codec of stored blobs; the hash is taken before compression, so changing it
+# only affects new blobs
+BLOB_CODEC = "zstd"
+
+# How a saved answer refers to a stored result, on a block of its own: its hash,
+# then the Genie conversation, message and attachment it came from when known
+RESULT_REFERENCE_PATTERN = re.compile(r"\[result ([0-9a-f]{64})(?: ([^\s/\]]+)/([^\s/\]]+)/([^\s/\]]+))?( partial)?\]")
+GENIE_ID_PATTERN = re.compile(r"[^\s/\]]+")
+
+@dataclass(frozen=True)
+class ResultReference:
+    result_hash: str
+    conversation_id: Optional[str] = None
+    message_id: Optional[str] = None
+    attachment_id: Optional[str] = None
+    partial: bool = False  # The blob holds only the first rows of the result
+
+@dataclass(frozen=True)
+class ResultBlob:
+    result_hash: str  # SHA-256 of the canonical serialization
+    data: bytes  # Canonical serialization, compressed
+    raw_bytes: int  # Size before compression
+
+def canonical_bytes(df) -> bytes:
+    """
+    Arrow IPC stream of a result's columns, without its index or pandas
+    metadata, so equal results serialize to equal bytes.
+    """
+    import pyarrow as pa
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Columns mixing value types are stored as strings
+        table = pa.Table.from_pandas(df.astype({column: "string" for column in df.columns[df.dtypes == object]}),
+                                     preserve_index=False)
+    table = table.replace_schema_metadata(None)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def encode_result(df) -> ResultBlob:
+    """A result's content hash and compressed canonical serialization"""
+    import pyarrow as pa
+
+    raw = canonical_bytes(df)
+    return ResultBlob(result_hash=hashlib.sha256(raw).hexdigest(),
+                      data=pa.compress(raw, codec=BLOB_CODEC, asbytes=True),
+                      raw_bytes=len(raw))
+
+def decode_result(data: bytes, raw_bytes: int):
+    """The DataFrame of a blob written by encode_result"""
+    import pyarrow as pa
+
+    raw = pa.decompress(data, decompressed_size=raw_bytes, codec=BLOB_CODEC)
+    return pa.ipc.open_stream(raw).read_all().to_pandas()
+
+def result_reference(reference: ResultReference) -> str:
+    ids = (reference.conversation_id, reference.message_id, reference.attachment_id)
+    source = f" {'/'.join(ids)}" if all(value and GENIE_ID_PATTERN.fullmatch(value) for value in ids) else ""
+    return f"[result {reference.result_hash}{source}{' partial' if reference.partial else ''}]"
+
+def referenced_result(block: str) -> Optional[ResultReference]:
+    """The result a saved answer block refers to, or None if it is not a reference"""
+    match = RESULT_REFERENCE_PATTERN.fullmatch(block)
+    if not match:
+        return None
+    result_hash, conversation_id, message_id, attachment_id, partial = match.groups()
+    return ResultReference(result_hash, conversation_id, message_id, attachment_id, partial=bool(partial))
+
+def saved_answer(parts: Sequence[AnswerPart], conversation_id: str = None,
+                 message_id: str = None) -> Tuple[str, Optional[str], List[ResultBlob]]:
+    """
+    The content, query text and results an answer is saved with. Results are
+    referenced with the Genie conversation and message they came from, when
+    given, so they can be fetched again.
+    """
+    results = []
+    content = "\n\n".join(_stored_content(part, results, conversation_id, message_id) for part in parts)
+    query_text = "\n\n".join(part.query_text for part in parts if part.kind == "query" and part.query_text) or None
+    return content, query_text, results
+
+def _stored_content(part: AnswerPart, results: List[ResultBlob], conversation_id: Optional[str],
+                    message_id: Optional[str]) -> str:
+    """A part as saved in the answer's content; results are appended to results and referenced by hash"""
+    if part.kind == "text":
+        return part.text
+    if part.data is None:
+        return f"Error fetching query result: {part.error}"
+    # Capped so huge results are not stored whole; the reference says when they were cut
+    max_rows = config.display.table_max_rows
+    data = part.data.head(max_rows)
+    try:
+        blob = encode_result(data)
+    except Exception as e:
+        logger.warning("Storing result inline, it could not be serialized: %s", e,
+                       extra=log_fields(attachment_id=part.attachment_id))
+        return str(data.to_dict())
+    results.append(blob)
+    return result_reference(ResultReference(blob.result_hash, conversation_id, message_id, part.attachment_id,
+                                            partial=not part.complete or len(part.data) > max_rows))
+
+class ResultBlobIndex:
+    """
+    Hashes of results this process knows to be stored, most recently used
+    last, so saving an answer whose result was saved before sends only its
+    hash. Blobs are never deleted, so an entry never goes stale.
+    """
+    def __init__(self, max_entries: int = None):
+        self.max_entries = config.db.result_index_entries if max_entries is None else max_entries
+        self._hashes: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, result_hash: str) -> bool:
+        with self._lock:
+            if result_hash not in self._hashes:
+                return False
+            self._hashes.move_to_end(result_hash)
+            return True
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def add(self, result_hashes: Iterable[str]) -> None:
+        with self._lock:
+            for result_hash in result_hashes:
+                self._hashes[result_hash] = None
+                self._hashes.move_to_end(result_hash)
+            while len(self._hashes) > self.max_entries:
+                self._hashes.popitem(last=False)
+
+# Initialize result blob index
+result_blob_index = ResultBlobIndex()
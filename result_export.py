@@ -0,0 +1,140 @@
+import io
+import logging
+import zlib
+from dataclasses import replace
+from itertools import chain
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Tuple
+from metrics import registry
+from result_store import result_store
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Rows serialized per streamed piece of an export from the result store
+EXPORT_CHUNK_ROWS = 10000
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+RESULT_EXPORTS = registry.counter(
+    "genie_result_exports_total", "Result exports by format and where the rows came from", ("format", "source"))
+
+def parquet_available() -> bool:
+    """Whether pyarrow is installed; it is optional and only imported for a Parquet export"""
+    return find_spec("pyarrow") is not None
+
+def frame_pages(df: "pd.DataFrame", chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator["pd.DataFrame"]:
+    """Split a stored result into row slices without copying it"""
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def stored_result(handle: str) -> Optional["pd.DataFrame"]:
+    """
+    A result from the result store, or fetched again from Genie when no worker
+    holds it any more but its source is known; None if the handle is unknown.
+    """
+    df = result_store.get(handle)
+    if df is not None:
+        return df
+    source = result_store.source(handle)
+    if source is None:
+        return None
+    # Imported here so the export helpers load without the Genie client's configuration
+    from genie_room import GenieClient, query_result_frame
+
+    logger.info("Fetching evicted result %s again from Genie", handle)
+    query_result = GenieClient().get_query_result(source.conversation_id, source.message_id, source.attachment_id)
+    df = query_result_frame(query_result)
+    result_store.put(handle, df, replace(source, complete=query_result.get("next_chunk_index") is None))
+    return df
+
+def result_pages(handle: str) -> Optional[Tuple[Iterator["pd.DataFrame"], str]]:
+    """
+    The rows of a result as a sequence of DataFrames, from the result store when
+    it holds the complete result, otherwise fetched again from Genie chunk by chunk.
+
+    Returns:
+        (pages, "store" or "genie"), or None if the handle is unknown
+    """
+    source = result_store.source(handle)
+    df = result_store.get(handle)
+    if df is not None and (source is None or source.complete):
+        return frame_pages(df), "store"
+    if source is None:
+        return None
+    # Imported here so the export helpers load without the Genie client's configuration
+    from genie_room import GenieClient
+    pages = GenieClient().iter_query_result(source.conversation_id, source.message_id, source.attachment_id)
+    # Fetch the first chunk now so a failing fetch surfaces before the response starts
+    first = next(pages)
+    return chain([first], pages), "genie"
+
+def csv_stream(pages: Iterable["pd.DataFrame"]) -> Iterator[bytes]:
+    """CSV with a single header row, one encoded piece per page"""
+    header = True
+    for page in pages:
+        yield page.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever has been written since the last drain"""
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def parquet_stream(pages: Iterable["pd.DataFrame"]) -> Iterator[bytes]:
+    """Parquet with one row group per page; every column is written as a string, as Genie returns them"""
+    if not parquet_available():
+        raise RuntimeError("Parquet export requires pyarrow")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = None
+    try:
+        for page in pages:
+            if writer is None:
+                schema = pa.schema([(str(column), pa.string()) for column in page.columns])
+                writer = pq.ParquetWriter(sink, schema)
+            table = pa.Table.from_pandas(page.astype("string"), schema=schema, preserve_index=False)
+            writer.write_table(table)
+            yield sink.drain()
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a byte stream into a single gzip member as it is produced"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_stream(pages: Iterable["pd.DataFrame"], export_format: str, compress: bool = False) -> Iterator[bytes]:
+    """Encode result pages in export_format, optionally gzipped"""
+    stream = parquet_stream(pages) if export_format == "parquet" else csv_stream(pages)
+    return gzip_stream(stream) if compress else stream
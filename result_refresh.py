@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+from config import config
+from metrics import registry
+from result_store import result_store
+from shared_state import SharedDirectory, shared_state
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RESULT_REFRESHES = registry.counter(
+    "genie_result_refreshes_total", "Background re-runs of stored query attachments by outcome", ("result",))
+
+def fingerprint(df: "pd.DataFrame") -> str:
+    """Content hash of a result, columns included, for detecting changed data"""
+    import pandas as pd
+
+    digest = hashlib.sha1("\x00".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+class ResultRefresher:
+    """
+    Re-runs the SQL of stored query attachments with execute_query when an old
+    answer is viewed again, at most once per ttl seconds per attachment. The
+    new rows replace the stored result only if they differ, and each change
+    bumps the attachment's version so the UI re-renders just those tables.
+
+    With a shared directory, versions and in-flight markers live there, so
+    one worker refreshes an attachment at a time and the UI's polling sees
+    the outcome whichever worker serves it.
+    """
+    # An in-flight marker older than this was left by a worker that died mid-refresh
+    stale_after = 600.0
+
+    def __init__(self, ttl: float = None, max_workers: int = 4, shared: Optional[SharedDirectory] = None):
+        self.ttl = config.display.refresh_ttl if ttl is None else ttl
+        self.max_workers = max_workers
+        self.shared = shared
+        if shared:
+            shared.limit("refresh", ".version", max_entries=result_store.max_sources)
+            shared.limit("refresh", ".running", max_age=self.stale_after)
+        self._executor = None
+        self._in_flight = set()
+        self._versions: Dict[str, int] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, handles: Iterable[str]) -> int:
+        """
+        Start background refreshes for the stale attachments among handles.
+
+        Returns:
+            int: The number of refreshes started
+        """
+        started = 0
+        now = time.time()
+        for handle in handles:
+            source = result_store.source(handle)
+            if source is None:
+                continue
+            if now - source.fetched_at < self.ttl:
+                RESULT_REFRESHES.inc(result="fresh")
+                continue
+            with self._lock:
+                if handle in self._in_flight or not self._claim(handle):
+                    continue
+                self._in_flight.add(handle)
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="result-refresh")
+            self._executor.submit(self._refresh, handle, source)
+            started += 1
+        return started
+
+    def reset_after_fork(self) -> None:
+        """Drop the parent's worker threads and in-flight refreshes in a forked child"""
+        self._executor = None
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def pending(self, handles: Iterable[str]) -> bool:
+        """Whether any of handles is still being refreshed, here or by another worker"""
+        handles = list(handles)
+        with self._lock:
+            if any(handle in self._in_flight for handle in handles):
+                return True
+        if self.shared:
+            for handle in handles:
+                age = self.shared.age(self.shared.path("refresh", handle, ".running"))
+                if age is not None and age < self.stale_after:
+                    return True
+        return False
+
+    def version(self, handle: str) -> int:
+        """How many times the attachment's data has changed since it was first fetched"""
+        if self.shared:
+            return self.shared.read_json(self.shared.path("refresh", handle, ".version")) or 0
+        return self._versions.get(handle, 0)
+
+    def _claim(self, handle: str) -> bool:
+        """Mark handle as being refreshed for every worker; False if another worker already is"""
+        if not self.shared:
+            return True
+        marker = self.shared.path("refresh", handle, ".running")
+        try:
+            if self.shared.create(marker):
+                return True
+            age = self.shared.age(marker)
+            if age is not None and age >= self.stale_after:
+                self.shared.remove(marker)
+                return self.shared.create(marker)
+        except OSError as e:
+            logger.warning(f"Could not mark result {handle} as refreshing: {str(e)}")
+            return True
+        return False
+
+    def _bump_version(self, handle: str) -> None:
+        with self._lock:
+            version = self._versions[handle] = self.version(handle) + 1
+        if self.shared:
+            # Only the worker holding the in-flight marker writes the version
+            self.shared.write_json(self.shared.path("refresh", handle, ".version"), version)
+
+    def _refresh(self, handle: str, source) -> None:
+        try:
+            # Imported here so the refresher loads without the Genie client's configuration
+            from genie_room import GenieClient, parse_query_result, query_result_frame
+
+            query_result = parse_query_result(
+                GenieClient().execute_query(source.conversation_id, source.message_id, source.attachment_id))
+            df = query_result_frame(query_result)
+            new_fingerprint = fingerprint(df)
+            old_fingerprint = self._stored_fingerprint(handle)
+
+            result_store.put(handle, df, replace(
+                source, complete=query_result.get("next_chunk_index") is None, fetched_at=time.time()))
+            with self._lock:
+                self._fingerprints[handle] = new_fingerprint
+            if new_fingerprint != old_fingerprint:
+                self._bump_version(handle)
+            RESULT_REFRESHES.inc(result="changed" if new_fingerprint != old_fingerprint else "unchanged")
+        except Exception as e:
+            RESULT_REFRESHES.inc(result="error")
+            logger.error(f"Error refreshing result {handle}: {str(e)}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(handle)
+            if self.shared:
+                self.shared.remove(self.shared.path("refresh", handle, ".running"))
+
+    def _stored_fingerprint(self, handle: str) -> Optional[str]:
+        with self._lock:
+            known = self._fingerprints.get(handle)
+        if known is not None:
+            return known
+        df = result_store.get(handle)
+        return fingerprint(df) if df is not None else None
+
+# Initialize result refresher
+result_refresher = ResultRefresher(shared=shared_state)
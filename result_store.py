@@ -0,0 +1,248 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from config import config
+from metrics import registry, CACHE_LOOKUPS
+from shared_state import SharedDirectory, shared_state
+from structured_logging import log_fields
+
+if TYPE_CHECKING:
+    import pandas as pd  # Imported where used, so loading the store doesn't load pandas
+
+logger = logging.getLogger(__name__)
+
+# Rows measured when estimating the in-memory size of a large result
+SIZE_SAMPLE_ROWS = 1000
+
+@dataclass
+class StoredResult:
+    df: "pd.DataFrame"
+    nbytes: int
+    file_id: Optional[int] = None  # Inode of the shared file the frame was written to or read from
+
+@dataclass
+class ResultSource:
+    """Where a result came from, so it can be fetched again once evicted"""
+    conversation_id: str
+    message_id: str
+    attachment_id: str
+    complete: bool = True  # False when the stored frame holds only the first result chunk
+    fetched_at: float = field(default_factory=time.time)
+
+def estimate_bytes(df: "pd.DataFrame") -> int:
+    """Approximate in-memory size, measuring at most SIZE_SAMPLE_ROWS rows deeply"""
+    if len(df) <= SIZE_SAMPLE_ROWS:
+        return int(df.memory_usage(deep=True).sum())
+    sample = df.iloc[:SIZE_SAMPLE_ROWS]
+    return int(sample.memory_usage(deep=True).sum() * len(df) / SIZE_SAMPLE_ROWS)
+
+def is_large_result(df: "pd.DataFrame", max_rows: int = None, max_bytes: int = None) -> bool:
+    """Whether a result is too big to send to the browser as a full table"""
+    max_rows = config.display.table_max_rows if max_rows is None else max_rows
+    max_bytes = config.display.table_max_bytes if max_bytes is None else max_bytes
+    # Checking rows first keeps the byte measurement bounded by max_rows
+    return len(df) > max_rows or estimate_bytes(df) > max_bytes
+
+def summarize_columns(df: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    One row per column with its type, non-null and null counts, distinct values,
+    and min/max. Genie returns every value as a string, so columns whose values
+    all parse as numbers are summarized numerically.
+    """
+    import pandas as pd
+
+    non_null = df.count()
+    numeric = df.apply(pd.to_numeric, errors="coerce")
+    is_numeric = (numeric.count() == non_null) & (non_null > 0)
+
+    minimums, maximums = {}, {}
+    numeric_columns = list(df.columns[is_numeric.values])
+    if numeric_columns:
+        minimums.update(numeric[numeric_columns].min().to_dict())
+        maximums.update(numeric[numeric_columns].max().to_dict())
+    for column in df.columns[~is_numeric.values]:
+        values = df[column].dropna().astype(str)
+        if not values.empty:
+            minimums[column] = values.min()
+            maximums[column] = values.max()
+
+    return pd.DataFrame({
+        "column": df.columns,
+        "type": ["numeric" if is_numeric[column] else "text" for column in df.columns],
+        "non_null": non_null.values,
+        "nulls": (len(df) - non_null).values,
+        "distinct": df.nunique(dropna=True).values,
+        "min": [minimums.get(column) for column in df.columns],
+        "max": [maximums.get(column) for column in df.columns],
+    })
+
+def page_records(df: "pd.DataFrame", page_current: int, page_size: int) -> List[Dict[str, Any]]:
+    """Rows of one table page as DataTable records"""
+    start = max(page_current or 0, 0) * page_size
+    rows = df.iloc[start:start + page_size]
+    # Missing values as None so the page serializes to JSON null
+    return rows.astype(object).where(rows.notna(), None).to_dict("records")
+
+class ResultStore:
+    """
+    Keeps query results on the server, keyed by a handle, so the browser only
+    ever receives the page it is looking at and exports never pass through it.
+    Least recently used results are evicted once the byte budget is exceeded;
+    their sources are remembered longer so exports can fetch them again.
+
+    With a shared directory, results and sources are also written there as
+    Arrow files and JSON, so a page or export request finds them whichever
+    worker serves it. A frame held in memory is read again once another
+    worker has replaced its file, as a background refresh does.
+    """
+    def __init__(self, max_bytes: int = None, max_sources: int = 10000,
+                 shared: Optional[SharedDirectory] = None, max_shared_bytes: int = None):
+        self.max_bytes = config.display.result_store_bytes if max_bytes is None else max_bytes
+        self.max_sources = max_sources
+        self.shared = shared
+        self.max_shared_bytes = config.display.result_store_disk_bytes if max_shared_bytes is None else max_shared_bytes
+        if shared:
+            shared.limit("results", ".arrow", max_bytes=self.max_shared_bytes)
+            shared.limit("results", ".source.json", max_entries=max_sources)
+        self._results: "OrderedDict[str, StoredResult]" = OrderedDict()
+        self._sources: "OrderedDict[str, ResultSource]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def put(self, handle: str, df: "pd.DataFrame", source: Optional[ResultSource] = None) -> None:
+        if source is not None:
+            self._remember_source(handle, source)
+            if self.shared:
+                self._share_source(handle, source)
+        nbytes = estimate_bytes(df)
+        file_id = self._share(handle, df, nbytes) if self.shared else None
+        if nbytes > self.max_bytes:
+            logger.warning("Result of %d bytes exceeds the result store budget, not storing it", nbytes,
+                           extra=log_fields(handle=handle))
+            return
+        self._hold(handle, StoredResult(df, nbytes, file_id))
+
+    def _remember_source(self, handle: str, source: ResultSource) -> None:
+        with self._lock:
+            self._sources[handle] = source
+            self._sources.move_to_end(handle)
+            while len(self._sources) > self.max_sources:
+                self._sources.popitem(last=False)
+
+    def _hold(self, handle: str, stored: StoredResult) -> None:
+        with self._lock:
+            previous = self._results.pop(handle, None)
+            if previous:
+                self._bytes -= previous.nbytes
+            self._results[handle] = stored
+            self._bytes += stored.nbytes
+            while self._bytes > self.max_bytes:
+                evicted_handle, evicted = self._results.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                logger.debug("Evicted result %s from the result store", evicted_handle)
+
+    def reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def __contains__(self, handle: str) -> bool:
+        with self._lock:
+            if handle in self._results:
+                return True
+        return bool(self.shared) and os.path.exists(self.shared.path("results", handle, ".arrow"))
+
+    def get(self, handle: str) -> Optional["pd.DataFrame"]:
+        with self._lock:
+            stored = self._results.get(handle)
+            if stored is not None:
+                self._results.move_to_end(handle)
+        if self.shared:
+            stored = self._shared_result(handle, stored)
+        CACHE_LOOKUPS.inc(cache="results", result="hit" if stored is not None else "miss")
+        return stored.df if stored is not None else None
+
+    def source(self, handle: str) -> Optional[ResultSource]:
+        with self._lock:
+            source = self._sources.get(handle)
+        if source is None and self.shared:
+            entry = self.shared.read_json(self.shared.path("results", handle, ".source.json"))
+            if entry:
+                source = ResultSource(**entry)
+                self._remember_source(handle, source)
+        return source
+
+    def page(self, handle: str, page_current: int, page_size: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Rows for one table page.
+
+        Returns:
+            The page as DataTable records, or None if the result is no longer stored
+        """
+        df = self.get(handle)
+        if df is None:
+            return None
+        return page_records(df, page_current, page_size)
+
+    def _share(self, handle: str, df: "pd.DataFrame", nbytes: int) -> Optional[int]:
+        """Write a result for the other workers and return the file's inode, or None if it was not written"""
+        if nbytes > self.max_shared_bytes:
+            return None
+        path = self.shared.path("results", handle, ".arrow")
+        try:
+            import pyarrow as pa
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            self.shared.write_bytes(path, sink.getvalue().to_pybytes())
+            return os.stat(path).st_ino
+        except Exception as e:
+            # Other workers fetch it again from its source instead
+            logger.warning("Could not share result with other workers: %s", e, extra=log_fields(handle=handle))
+            return None
+
+    def _share_source(self, handle: str, source: ResultSource) -> None:
+        try:
+            self.shared.write_json(self.shared.path("results", handle, ".source.json"), asdict(source))
+        except OSError as e:
+            logger.warning("Could not share the source of result: %s", e, extra=log_fields(handle=handle))
+
+    def _shared_result(self, handle: str, stored: Optional[StoredResult]) -> Optional[StoredResult]:
+        """The shared copy of a result when it is newer than the one held here"""
+        path = self.shared.path("results", handle, ".arrow")
+        try:
+            # A stat is enough while the held frame is still the file's
+            if stored is not None and stored.file_id == os.stat(path).st_ino:
+                return stored
+            with open(path, "rb") as f:
+                file_id = os.fstat(f.fileno()).st_ino
+                if stored is not None and stored.file_id == file_id:
+                    return stored
+                import pyarrow as pa
+
+                df = pa.ipc.open_file(f).read_all().to_pandas()
+            # Read from disk counts as a use, so the file is pruned last
+            os.utime(path)
+        except FileNotFoundError:
+            return stored
+        except Exception as e:
+            logger.warning("Could not read shared result: %s", e, extra=log_fields(handle=handle))
+            return stored
+        loaded = StoredResult(df, estimate_bytes(df), file_id)
+        if loaded.nbytes <= self.max_bytes:
+            self._hold(handle, loaded)
+        return loaded
+
+# Initialize result store
+result_store = ResultStore(shared=shared_state)
+
+RESULT_STORE_BYTES = registry.gauge("genie_result_store_bytes", "Approximate bytes of query results held for server-side paging")
+RESULT_STORE_BYTES.set_function(lambda: result_store.nbytes)
@@ -0,0 +1,159 @@
+"""
+Production entry point: serves the Dash app with gunicorn.
+
+The app is imported once in the master process (preload) and forked into
+config.server.workers processes, each running config.server.threads request
+threads with the "gthread" worker class, or one request at a time with "sync".
+Every worker opens its own database pool, so the database sees up to
+workers * (pool_size + max_overflow) connections.
+
+With several workers, stored results, question progress and result refresh
+state are shared between them through files in SHARED_STATE_DIR, so any
+worker can serve a chat's pagination, export and progress requests, and
+their metrics are merged through GENIE_METRICS_DIR, so /metrics covers every
+worker. Either directory left unset is created privately for the run and
+removed when the server exits; a single worker keeps its state in memory.
+The index of similar questions stays per worker: a miss there only means
+Genie answers afresh. OAuth tokens are shared between workers through a
+file-locked cache in TOKEN_CACHE_DIR.
+"""
+import logging
+import os
+import shutil
+import tempfile
+from gunicorn.app.base import BaseApplication
+from config import ANSWER_TIMEOUT_MARGIN, config
+
+logger = logging.getLogger(__name__)
+
+WORKER_CLASSES = ("gthread", "sync")
+
+# Directories created for this run, removed when the server exits
+_run_directories = []
+
+def _run_directory(name: str) -> str:
+    path = tempfile.mkdtemp(prefix=f"genie-{name}-")  # Private to this user
+    _run_directories.append(path)
+    return path
+
+def shared_directories() -> None:
+    """
+    With several workers, give them directories to merge metrics and share
+    state through, unless configured. Must run before the app is imported.
+    """
+    if config.server.workers <= 1:
+        return
+    if not os.getenv("GENIE_METRICS_DIR"):
+        os.environ["GENIE_METRICS_DIR"] = _run_directory("metrics")
+    if config.server.state_dir is None:
+        config.server.state_dir = _run_directory("state")
+
+def post_fork(server, worker):
+    """Re-create what a forked worker must not share with the master: connections, locks and threads"""
+    if not server.cfg.preload_app:
+        return  # Each worker imported the app itself, so there is nothing inherited to reset
+    from chat_recorder import chat_recorder
+    from db_config import db_manager
+    from metrics import multiprocess_exporter, registry
+    from progress import progress_board
+    from render_cache import render_cache
+    from result_blobs import result_blob_index
+    from result_refresh import result_refresher
+    from result_store import result_store
+    from shared_state import shared_state
+    from similar_questions import similar_questions
+    from structured_logging import log_pipeline
+    from token_minter import tokenminter
+
+    log_pipeline.reset_after_fork()
+    registry.reset_after_fork()
+    tokenminter.reset_after_fork()
+    db_manager.reset_after_fork()
+    chat_recorder.reset_after_fork()
+    result_store.reset_after_fork()
+    result_refresher.reset_after_fork()
+    progress_board.reset_after_fork()
+    similar_questions.reset_after_fork()
+    render_cache.reset_after_fork()
+    result_blob_index.reset_after_fork()
+    if shared_state:
+        shared_state.reset_after_fork()
+    if multiprocess_exporter:
+        multiprocess_exporter.start()
+    logger.info(f"Worker {os.getpid()} ready")
+
+def shutdown() -> None:
+    """Write queued chat records and close pooled connections before the process exits"""
+    from chat_recorder import chat_recorder
+    from db_config import db_manager
+    from metrics import multiprocess_exporter
+
+    try:
+        chat_recorder.stop(timeout=config.server.graceful_timeout)
+        db_manager.cleanup()
+    except Exception as e:
+        logger.error(f"Error during shutdown of process {os.getpid()}: {str(e)}")
+    finally:
+        if multiprocess_exporter:
+            multiprocess_exporter.stop()
+
+def worker_exit(server, worker):
+    shutdown()
+
+def child_exit(server, worker):
+    """Keep a worker's counters in /metrics after it exits, however it exited"""
+    from metrics import multiprocess_exporter
+
+    if multiprocess_exporter:
+        multiprocess_exporter.mark_process_dead(worker.pid)
+
+def on_exit(server):
+    shutdown()
+    for path in _run_directories:
+        shutil.rmtree(path, ignore_errors=True)
+
+class GenieServer(BaseApplication):
+    """gunicorn application serving app.server with settings from config.server"""
+    def __init__(self, options: dict = None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import app
+        return app.server
+
+def server_options() -> dict:
+    server = config.server
+    if server.worker_class not in WORKER_CLASSES:
+        raise ValueError(f"Unsupported WEB_WORKER_CLASS {server.worker_class!r}; expected one of {', '.join(WORKER_CLASSES)}")
+    timeout = server.timeout
+    answer_timeout = config.databricks.poll_timeout + ANSWER_TIMEOUT_MARGIN
+    if server.worker_class == "sync" and timeout < answer_timeout:
+        # A sync worker sends no heartbeat while it answers, so a shorter timeout kills it mid-answer
+        logger.warning(f"Raising WEB_TIMEOUT from {timeout} to {answer_timeout} seconds, "
+                       f"the longest a sync worker may spend answering a question")
+        timeout = answer_timeout
+    return {
+        "bind": f"{server.host}:{server.port}",
+        "workers": server.workers,
+        "threads": server.threads if server.worker_class == "gthread" else 1,
+        "worker_class": server.worker_class,
+        "timeout": timeout,
+        "graceful_timeout": server.graceful_timeout,
+        "preload_app": server.preload,
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+        "child_exit": child_exit,
+        "on_exit": on_exit,
+    }
+
+if __name__ == "__main__":
+    shared_directories()
+    from structured_logging import log_pipeline
+
+    log_pipeline.configure()
+    GenieServer(server_options()).run()
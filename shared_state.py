@@ -0,0 +1,175 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from config import config
+
+logger = logging.getLogger(__name__)
+
+def private_directory(directory: str) -> bool:
+    """Create directory with mode 0700 if missing; whether it belongs to this user and is private to it"""
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        info = os.stat(directory)
+    except OSError as e:
+        logger.warning(f"Cannot use {directory}: {str(e)}")
+        return False
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        logger.warning(f"Cannot use {directory}: it must belong to this user with mode 0700")
+        return False
+    return True
+
+class SharedDirectory:
+    """
+    Files every worker process on this host can read, for state a request may
+    need from whichever worker serves it. Entries are named by a hash of their
+    key, so any string is a safe key, and replaced atomically, so readers
+    always see a whole file.
+
+    Nothing touches the disk until the first write, which creates the
+    directory. Limits set with limit() are enforced by a background thread
+    every prune_interval seconds, so writers never scan the directory.
+    """
+    def __init__(self, directory: str, prune_interval: float = 60.0):
+        self.directory = directory
+        self.prune_interval = prune_interval
+        self._limits: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._usable = None  # Whether the directory is private to this user, once checked
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @classmethod
+    def open(cls, directory: Optional[str]) -> Optional["SharedDirectory"]:
+        """The shared directory, or None when state is kept in each process"""
+        return cls(directory) if directory else None
+
+    def limit(self, namespace: str, suffix: str, max_entries: int = None, max_bytes: int = None,
+              max_age: float = None) -> None:
+        """Keep the namespace's files with suffix within these limits, oldest removed first"""
+        self._limits[(namespace, suffix)] = {"max_entries": max_entries, "max_bytes": max_bytes, "max_age": max_age}
+
+    def reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def path(self, namespace: str, key: str, suffix: str) -> str:
+        name = hashlib.sha256(key.encode()).hexdigest()[:32]
+        return os.path.join(self.directory, namespace, f"{name}{suffix}")
+
+    def _prepare(self, path: str) -> None:
+        """Check the directory on first use and create path's namespace; start pruning"""
+        if self._usable is None:
+            with self._lock:
+                if self._usable is None:
+                    self._usable = private_directory(self.directory)
+        if not self._usable:
+            raise PermissionError(f"{self.directory} is not private to this user")
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        self._ensure_pruning()
+
+    def write_bytes(self, path: str, data: bytes) -> None:
+        self._prepare(path)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def write_json(self, path: str, value: Any) -> None:
+        self.write_bytes(path, json.dumps(value).encode())
+
+    def read_json(self, path: str) -> Optional[Any]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read shared state {path}: {str(e)}")
+            return None
+
+    def create(self, path: str) -> bool:
+        """Create an empty marker file; False if it already exists"""
+        self._prepare(path)
+        try:
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+            return True
+        except FileExistsError:
+            return False
+
+    def age(self, path: str) -> Optional[float]:
+        """Seconds since path was last written, or None if it does not exist"""
+        try:
+            return time.time() - os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def remove(self, path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def entries(self, namespace: str, suffix: str) -> List[Tuple[str, os.stat_result]]:
+        """(path, stat) of the namespace's files with suffix, least recently written first"""
+        entries = []
+        try:
+            with os.scandir(os.path.join(self.directory, namespace)) as scan:
+                for entry in scan:
+                    if entry.name.endswith(suffix):
+                        try:
+                            entries.append((entry.path, entry.stat()))
+                        except FileNotFoundError:
+                            continue
+        except FileNotFoundError:
+            return []
+        return sorted(entries, key=lambda item: item[1].st_mtime)
+
+    def prune(self, namespace: str, suffix: str, max_entries: int = None, max_bytes: int = None,
+              max_age: float = None) -> int:
+        """Remove the oldest files with suffix beyond the given limits and return how many were removed"""
+        entries = self.entries(namespace, suffix)
+        total = sum(info.st_size for _, info in entries)
+        now = time.time()
+        removed = 0
+        for index, (path, info) in enumerate(entries):
+            remaining = len(entries) - index
+            if not ((max_entries is not None and remaining > max_entries)
+                    or (max_bytes is not None and total > max_bytes)
+                    or (max_age is not None and now - info.st_mtime > max_age)):
+                break
+            self.remove(path)
+            total -= info.st_size
+            removed += 1
+        return removed
+
+    def _ensure_pruning(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="shared-state-prune", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.prune_interval)
+            for (namespace, suffix), limits in list(self._limits.items()):
+                try:
+                    self.prune(namespace, suffix, **limits)
+                except Exception as e:
+                    logger.warning(f"Could not prune shared {namespace} state: {str(e)}")
+
+# Initialize shared state; serve.py sets state_dir when it runs several workers,
+# and an empty SHARED_STATE_DIR keeps state in each process
+shared_state = SharedDirectory.open(config.server.state_dir)
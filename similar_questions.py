@@ -0,0 +1,250 @@
+import functools
+import logging
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+from config import config
+from metrics import registry, CACHE_LOOKUPS
+from models import GenieResponse
+from result_store import result_store
+from structured_logging import log_fields
+
+logger = logging.getLogger(__name__)
+
+SIMILAR_LOOKUP_SECONDS = registry.histogram(
+    "genie_similar_question_lookup_seconds", "Time to search the index of answered questions",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01))
+
+# Character n-grams compared between questions
+SHINGLE_SIZE = 3
+# MinHash signature length, split into LSH bands of BAND_ROWS values; questions
+# sharing any band are candidates, which at 16 bands of 4 finds pairs with a
+# similarity of 0.75 more than 99% of the time
+BANDS = 16
+BAND_ROWS = 4
+MINHASH_PRIME = (1 << 31) - 1
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Words that may appear in only one of two questions without changing what is asked
+FILLER_WORDS = frozenset((
+    "a", "an", "the", "in", "of", "for", "to", "on", "at", "by", "with", "and", "is", "are", "was", "were",
+    "be", "been", "do", "does", "did", "there", "that", "this", "it", "its", "me", "us", "please", "show",
+    "list", "tell", "give", "what", "which", "who", "how", "many", "much", "all", "s",
+))
+# Words that change the meaning of a question whenever they differ
+NEGATIONS = frozenset(("not", "no", "never", "without", "except", "excluding", "nor"))
+
+@dataclass(frozen=True)
+class QuestionFeatures:
+    normalized: str
+    shingles: FrozenSet[str]
+    words: FrozenSet[str]
+    bands: Tuple[Tuple[int, bytes], ...]
+
+@dataclass
+class _Entry:
+    question: str
+    features: QuestionFeatures
+    response: GenieResponse  # Parts without data; results stay in the result store
+    added_at: float
+
+def normalize(question: str) -> str:
+    """Lower-case words and numbers of a question, with punctuation and apostrophes dropped"""
+    return " ".join(TOKEN_PATTERN.findall(question.lower().replace("'", "").replace("’", "")))
+
+@functools.lru_cache(maxsize=1)
+def _hash_coefficients():
+    import numpy as np
+
+    # Fixed seed, so every worker matches questions the same way
+    rng = np.random.default_rng(20250)
+    size = BANDS * BAND_ROWS
+    return (rng.integers(1, MINHASH_PRIME, size=size, dtype=np.uint64)[:, None],
+            rng.integers(0, MINHASH_PRIME, size=size, dtype=np.uint64)[:, None])
+
+def minhash(shingles: FrozenSet[str]):
+    """MinHash signature of a set of shingles, one uint32 per hash function"""
+    import numpy as np
+
+    a, b = _hash_coefficients()
+    hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    # a < 2^31 and hashes < 2^32, so the products fit in 64 bits
+    return ((a * hashes + b) % MINHASH_PRIME).min(axis=1).astype(np.uint32)
+
+def question_features(question: str) -> Optional[QuestionFeatures]:
+    """Shingles, words and LSH band keys of a question, or None if it has no words"""
+    normalized = normalize(question)
+    if not normalized:
+        return None
+    padded = f" {normalized} "
+    shingles = frozenset(padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1))
+    signature = minhash(shingles)
+    bands = tuple((band, signature[band * BAND_ROWS:(band + 1) * BAND_ROWS].tobytes()) for band in range(BANDS))
+    return QuestionFeatures(normalized, shingles, frozenset(normalized.split()), bands)
+
+def similarity(a: QuestionFeatures, b: QuestionFeatures) -> float:
+    """Jaccard similarity of two questions' character shingles"""
+    return len(a.shingles & b.shingles) / len(a.shingles | b.shingles)
+
+def same_meaning(a: QuestionFeatures, b: QuestionFeatures) -> bool:
+    """
+    Whether the words that differ between two questions leave them asking the
+    same thing. Shingle similarity alone rates "most goals in 2024" close to
+    "most goals in 2025", or "won" to "lost", so questions that each have a
+    word the other lacks, or that differ in a number or a negation, never match.
+    """
+    only_a = a.words - b.words - FILLER_WORDS
+    only_b = b.words - a.words - FILLER_WORDS
+    if only_a and only_b:
+        return False
+    return not any(word in NEGATIONS or any(c.isdigit() for c in word) for word in only_a | only_b)
+
+class _SpaceIndex:
+    """Answered questions of one Genie space, least recently used first"""
+    def __init__(self):
+        self.entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self.buckets: Dict[Tuple[int, bytes], Set[int]] = {}
+        self.by_text: Dict[str, int] = {}
+        self.next_key = 0
+
+    def add(self, entry: _Entry, max_entries: int) -> None:
+        existing = self.by_text.get(entry.features.normalized)
+        if existing is not None:
+            self.remove(existing)
+        key = self.next_key
+        self.next_key += 1
+        self.entries[key] = entry
+        self.by_text[entry.features.normalized] = key
+        for band in entry.features.bands:
+            self.buckets.setdefault(band, set()).add(key)
+        while len(self.entries) > max_entries:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key: int) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.by_text.pop(entry.features.normalized, None)
+        for band in entry.features.bands:
+            keys = self.buckets.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.buckets[band]
+
+    def best_match(self, features: QuestionFeatures, threshold: float, oldest: float) -> Optional[Tuple[int, _Entry]]:
+        candidates = set()
+        for band in features.bands:
+            candidates.update(self.buckets.get(band, ()))
+        best, best_score = None, threshold
+        for key in candidates:
+            entry = self.entries[key]
+            if entry.added_at < oldest:
+                self.remove(key)
+                continue
+            score = similarity(features, entry.features)
+            if score >= best_score and same_meaning(features, entry.features):
+                best, best_score = (key, entry), score
+        if best is not None:
+            self.entries.move_to_end(best[0])
+        return best
+
+class SimilarQuestions:
+    """
+    Recently answered questions per Genie space, so a new question that is a
+    near-duplicate of one of them ("how many teams in the 2025 league" against
+    "How many teams participated in the 2025 league?") gets the earlier answer
+    without asking Genie again. Questions are compared by the Jaccard similarity
+    of their character trigrams, found through MinHash locality-sensitive
+    hashing so a lookup only scores the few questions sharing a band.
+
+    The index keeps at most max_entries questions per space for ttl seconds.
+    Result frames are not held here: reusing an answer needs its results to
+    still be in the result store.
+    """
+    def __init__(self, threshold: float = None, max_entries: int = None, ttl: float = None, enabled: bool = None):
+        settings = config.similar_questions
+        self.enabled = settings.enabled if enabled is None else enabled
+        self.threshold = settings.threshold if threshold is None else threshold
+        self.max_entries = settings.max_entries if max_entries is None else max_entries
+        self.ttl = settings.ttl if ttl is None else ttl
+        self._spaces: Dict[str, _SpaceIndex] = {}
+        self._lock = threading.Lock()
+
+    def reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def add(self, question: str, response: GenieResponse, space_id: str = None) -> bool:
+        """
+        Remember a fresh answer to question, if it is complete enough to reuse.
+
+        Returns:
+            bool: Whether the answer was added
+        """
+        if not self.enabled or not response.message_id or any(
+                part.error or (part.kind == "query" and (part.data is None or not part.attachment_id))
+                for part in response.parts):
+            return False
+        features = question_features(question)
+        if features is None:
+            return False
+        stored = GenieResponse(conversation_id=response.conversation_id, message_id=response.message_id,
+                               parts=[replace(part, data=None) for part in response.parts])
+        space_id = config.databricks.space_id if space_id is None else space_id
+        with self._lock:
+            index = self._spaces.setdefault(space_id, _SpaceIndex())
+            index.add(_Entry(question, features, stored, time.time()), self.max_entries)
+        return True
+
+    def lookup(self, question: str, space_id: str = None) -> Optional[GenieResponse]:
+        """
+        The answer to the most similar earlier question, if one passes the threshold.
+
+        The answer has no conversation of its own and its results are stored
+        under new handles, so it can be shown next to the original.
+        """
+        if not self.enabled:
+            return None
+        start = time.perf_counter()
+        features = question_features(question)
+        space_id = config.databricks.space_id if space_id is None else space_id
+        match = None
+        if features is not None:
+            with self._lock:
+                index = self._spaces.get(space_id)
+                if index is not None:
+                    match = index.best_match(features, self.threshold, time.time() - self.ttl)
+        SIMILAR_LOOKUP_SECONDS.observe(time.perf_counter() - start)
+
+        response = self._reuse(match[1]) if match else None
+        if match and response is None:
+            with self._lock:
+                self._spaces[space_id].remove(match[0])
+        CACHE_LOOKUPS.inc(cache="similar_questions", result="hit" if response is not None else "miss")
+        return response
+
+    def _reuse(self, entry: _Entry) -> Optional[GenieResponse]:
+        """A copy of the entry's answer with its results, or None once any has been evicted"""
+        parts = []
+        for part in entry.response.parts:
+            if part.kind != "query":
+                parts.append(part)
+                continue
+            df = result_store.get(part.attachment_id)
+            if df is None:
+                return None
+            handle = f"{part.attachment_id}-{uuid.uuid4().hex[:8]}"
+            result_store.put(handle, df, result_store.source(part.attachment_id))
+            parts.append(replace(part, attachment_id=handle, data=df))
+        logger.info("Reusing the answer to similar question: %s...", entry.question[:30],
+                    extra=log_fields(message_id=entry.response.message_id))
+        return GenieResponse(conversation_id=None, message_id=entry.response.message_id,
+                             parts=parts, similar_question=entry.question)
+
+# Initialize similar question index; it stays per worker, as a miss only means a fresh answer from Genie
+similar_questions = SimilarQuestions()
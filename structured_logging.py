@@ -0,0 +1,267 @@
+import atexit
+import collections
+import itertools
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from config import config
+from metrics import registry
+from tracing import tracer
+
+LOG_RECORDS = registry.counter(
+    "genie_log_records_total", "Log records by outcome: written, sampled out, or dropped with the buffer full", ("outcome",))
+LOG_CALLER_SECONDS = registry.histogram(
+    "genie_log_caller_seconds", "Time a logging call spends on the calling thread, for one call in CALLER_TIMING_INTERVAL",
+    buckets=(0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.001, 0.01))
+LOG_WRITE_SECONDS = registry.histogram(
+    "genie_log_write_seconds", "Time the log writer thread spends formatting and writing a record",
+    buckets=(0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.001, 0.01))
+
+# Span attributes copied onto records logged inside the span
+CONTEXT_FIELDS = ("conversation_id", "message_id")
+# How often the writer thread looks for new records when it has caught up
+WRITER_POLL_INTERVAL = 0.01
+# One logging call in this many is timed, so measuring the callers' cost stays cheap
+CALLER_TIMING_INTERVAL = 64
+# Argument types that cannot change between the logging call and the writer thread
+_IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+def log_fields(**fields) -> Dict[str, Any]:
+    """extra= for a logging call attaching structured fields, e.g. logger.info("...", extra=log_fields(conversation_id=id))"""
+    return {"fields": fields}
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """Logger name to sampling rate, from "genie.trace=0.1,genie_room=0.5" """
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of the records of high-volume loggers. A rate applies to
+    its logger and the loggers below it; warnings and errors are always kept.
+    """
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: Dict[str, float] = {}
+
+    def rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, logger_name = 1.0, name
+            while logger_name:
+                if logger_name in self.rates:
+                    rate = self.rates[logger_name]
+                    break
+                logger_name = logger_name.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rate(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        LOG_RECORDS.inc(outcome="sampled")
+        return False
+
+class ContextFilter(logging.Filter):
+    """Adds the trace and the conversation and message ids of the active span to a record's fields"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        fields = getattr(record, "fields", None)
+        fields = dict(fields) if fields else {}
+        span = tracer.current_span()
+        attributes = getattr(span, "attributes", None)
+        if attributes:
+            fields.setdefault("trace_id", span.trace_id)
+            for key in CONTEXT_FIELDS:
+                if key in attributes:
+                    fields.setdefault(key, attributes[key])
+        record.fields = fields
+        return True
+
+class TextFormatter(logging.Formatter):
+    """Plain log lines, with structured fields appended as key=value"""
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, structured fields as top-level keys"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class _WriterHandler(logging.StreamHandler):
+    """The stream handler run on the writer thread, timed"""
+    def emit(self, record: logging.LogRecord) -> None:
+        start = time.perf_counter()
+        super().emit(record)
+        LOG_WRITE_SECONDS.observe(time.perf_counter() - start)
+
+class AsyncLogHandler(logging.Handler):
+    """
+    Appends records to a bounded buffer drained by a writer thread, so a
+    logging call costs the calling thread its filters and a deque append.
+    Messages whose arguments are immutable are formatted on the writer thread;
+    others are formatted at the call, before their arguments can change. When
+    the buffer is full, records are dropped and counted instead of making the
+    caller wait; the writer logs how many once it catches up.
+    """
+    def __init__(self, max_records: int):
+        super().__init__()
+        self.max_records = max_records
+        self.records = collections.deque()
+        self._calls = itertools.count()
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # Unlike Handler.handle, takes no lock: appending to a deque is thread-safe
+        timed = next(self._calls) % CALLER_TIMING_INTERVAL == 0
+        start = time.perf_counter() if timed else 0.0
+        kept = self.filter(record)
+        if kept:
+            self.emit(record)
+        if timed:
+            LOG_CALLER_SECONDS.observe(time.perf_counter() - start)
+        return kept
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if len(self.records) >= self.max_records:
+            LOG_RECORDS.inc(outcome="dropped")
+            return
+        try:
+            self.records.append(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    @staticmethod
+    def prepare(record: logging.LogRecord) -> logging.LogRecord:
+        if not isinstance(record.msg, str) or not _immutable(record.args):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            # Tracebacks hold every frame alive until written, so they are rendered now
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def _immutable(args) -> bool:
+    if not args:
+        return True
+    return isinstance(args, tuple) and all(isinstance(arg, _IMMUTABLE_ARGS) for arg in args)
+
+class LogPipeline:
+    """
+    Root logging for the app: records are sampled and tagged with the active
+    trace on the calling thread, then formatted and written to stderr by one
+    writer thread per process.
+    """
+    def __init__(self):
+        self.handler: Optional[AsyncLogHandler] = None
+        self._writer: Optional[logging.Handler] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._dropped_reported = 0
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return self.handler is not None
+
+    def configure(self, settings=None) -> None:
+        """Replace the root logger's handlers with the async pipeline; later calls do nothing"""
+        settings = config.logging if settings is None else settings
+        with self._lock:
+            if self.handler is not None:
+                return
+            self._writer = _WriterHandler(sys.stderr)
+            self._writer.setFormatter(JsonFormatter() if settings.format == "json" else TextFormatter())
+            self.handler = AsyncLogHandler(settings.buffer_size)
+            self.handler.addFilter(SamplingFilter(parse_sample_rates(settings.sample_rates)))
+            self.handler.addFilter(ContextFilter())
+            root = logging.getLogger()
+            for existing in list(root.handlers):
+                root.removeHandler(existing)
+            root.addHandler(self.handler)
+            root.setLevel(settings.level)
+            self._start_writer()
+        atexit.register(self.stop)
+
+    def reset_after_fork(self) -> None:
+        """
+        Start a writer thread in a forked child. Records the parent had buffered
+        are left for the parent to write.
+        """
+        self._lock = threading.Lock()
+        self._dropped_reported = 0
+        if self.handler is None:
+            return
+        self.handler.records = collections.deque()
+        self.handler.createLock()
+        self._writer.createLock()
+        self._start_writer()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write every buffered record and stop the writer thread"""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._stop.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _start_writer(self) -> None:
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), name="log-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self, stop: threading.Event) -> None:
+        while not stop.wait(WRITER_POLL_INTERVAL):
+            self._drain()
+        self._drain()
+
+    def _drain(self) -> None:
+        records, written = self.handler.records, 0
+        while records:
+            self._writer.handle(records.popleft())
+            written += 1
+        if written:
+            LOG_RECORDS.inc(written, outcome="written")
+        dropped = LOG_RECORDS.value(outcome="dropped")
+        if dropped > self._dropped_reported:
+            self._writer.handle(logging.makeLogRecord({
+                "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": "Dropped %d log records, the log writer could not keep up",
+                "args": (dropped - self._dropped_reported,)}))
+            self._dropped_reported = dropped
+
+# Initialize log pipeline; configured by the entry points, so importing modules leaves logging alone
+log_pipeline = LogPipeline()
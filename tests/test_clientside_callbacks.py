@@ -0,0 +1,173 @@
+"""
+Parity of the clientside callbacks with the Python callbacks they replaced.
+
+Each JavaScript function is taken from the app's registered clientside
+callbacks and run under node; its outputs must equal those of the old Python
+callback, kept here as the reference, for the same inputs.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("dash")
+if shutil.which("node") is None:
+    pytest.skip("node is needed to run the clientside callbacks", allow_module_level=True)
+
+from dash import no_update
+import app
+
+# How no_update crosses from node to Python
+NO_UPDATE = "__no_update__"
+
+RUNNER = """
+const input = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+const noUpdate = {};
+global.window = {dash_clientside: {no_update: noUpdate, callback_context: {triggered: []}}};
+for (const script of input.scripts) {
+    eval(script);
+}
+const fn = window.dash_clientside._dashprivate_clientside_funcs[input.function_name];
+const results = input.calls.map(function(call) {
+    window.dash_clientside.callback_context = {triggered: call.triggered};
+    return fn.apply(null, call.args);
+});
+process.stdout.write(JSON.stringify(results, function(key, value) {
+    return value === noUpdate ? input.no_update : value;
+}));
+"""
+
+def clientside_function(output: str) -> str:
+    """Name of the clientside function of the callback whose outputs start with output"""
+    names = [callback["clientside_function"]["function_name"] for callback in app.app._callback_list
+             if callback.get("clientside_function") and callback["output"].lstrip(".").startswith(output)]
+    assert len(names) == 1, f"expected one clientside callback writing {output}, found {len(names)}"
+    return names[0]
+
+def run_clientside(output: str, calls):
+    """Results of the clientside callback writing output for each (args, triggered) call"""
+    payload = {
+        "scripts": [script for script in app.app._inline_scripts if "_dashprivate_clientside_funcs" in script],
+        "function_name": clientside_function(output),
+        "calls": [{"args": list(args), "triggered": triggered} for args, triggered in calls],
+        "no_update": NO_UPDATE,
+    }
+    completed = subprocess.run(["node", "-e", RUNNER], input=json.dumps(payload), capture_output=True,
+                               text=True, timeout=30, check=True)
+    return json.loads(completed.stdout)
+
+def as_json(value):
+    """A Python callback's return value as the clientside callback would return it"""
+    return json.loads(json.dumps(value, default=lambda obj: NO_UPDATE if obj is no_update else obj))
+
+# The Python callbacks the clientside ones replaced
+
+def old_toggle_sidebar(n_clicks, current_sidebar_class, current_left_component_class, current_main_content_class):
+    if n_clicks:
+        if "sidebar-open" in current_sidebar_class:
+            # Sidebar is closing
+            return "sidebar", {"display": "flex"}, {"display": "none"}, "logo-container", "nav-left", "left-component", "main-content"
+        else:
+            # Sidebar is opening
+            return "sidebar sidebar-open", {"display": "none"}, {"display": "flex"}, "logo-container logo-container-open", "nav-left nav-left-open", "left-component left-component-open", "main-content main-content-shifted"
+    # Initial state
+    return current_sidebar_class, {"display": "flex"}, {"display": "none"}, "logo-container", "nav-left", "left-component", current_main_content_class
+
+def old_toggle_query_visibility(n_clicks):
+    if n_clicks % 2 == 1:
+        return "query-code-container visible", "Hide code"
+    return "query-code-container hidden", "Show code"
+
+def old_toggle_input_disabled(query_running):
+    # Show tooltip when query is running, hide it otherwise
+    tooltip_class = "query-tooltip visible" if query_running else "query-tooltip hidden"
+
+    # Disable input and buttons when query is running
+    return query_running, query_running, query_running, query_running, tooltip_class, not query_running
+
+def old_reset_query_running(chat_messages):
+    # Return as a single-item list
+    if chat_messages:
+        return ["welcome-container hidden"]
+    else:
+        return ["welcome-container visible"]
+
+def old_open_modal(n_clicks, current_title, current_description, s1, s2, s3, s4):
+    if not n_clicks:
+        return [no_update] * 7
+    return True, current_title, current_description, s1, s2, s3, s4
+
+def old_active_classes(class_names, clicked_index, previous_index):
+    """The chat list's classNames after open_chat moved the active state from previous_index"""
+    class_names = list(class_names)
+    if previous_index is not None:
+        class_names[previous_index] = "chat-item"
+    class_names[clicked_index] = "chat-item active"
+    return class_names
+
+def test_sidebar_toggle():
+    cases = [
+        (None, "sidebar", "left-component", "main-content"),
+        (0, "sidebar sidebar-open", "left-component left-component-open", "main-content main-content-shifted"),
+        (1, "sidebar", "left-component", "main-content"),
+        (2, "sidebar sidebar-open", "left-component left-component-open", "main-content main-content-shifted"),
+        (3, "sidebar custom", "left-component", "main-content custom"),
+    ]
+    # The clientside callback no longer takes the left component's class, which was never used
+    results = run_clientside("sidebar.className", [((n, sidebar, main), []) for n, sidebar, _, main in cases])
+    assert results == [as_json(old_toggle_sidebar(*case)) for case in cases]
+
+def test_query_toggle():
+    clicks = [1, 2, 3, 4, 11]
+    results = run_clientside('{"index":["MATCH"],"type":"query-code"}.className', [((n,), []) for n in clicks])
+    assert results == [as_json(old_toggle_query_visibility(n)) for n in clicks]
+
+def test_input_disabled():
+    states = [True, False]
+    results = run_clientside("chat-input-fixed.disabled", [((running,), []) for running in states])
+    assert results == [as_json(old_toggle_input_disabled(running)) for running in states]
+
+def test_welcome_visibility():
+    messages = [[], None, [{"type": "Div", "props": {"children": "Hi"}}],
+                [{"type": "Div", "props": {}}, {"type": "Div", "props": {}}]]
+    results = run_clientside("welcome-container.className", [((children,), []) for children in messages])
+    assert results == [as_json(old_reset_query_running(children)) for children in messages]
+
+def test_open_modal():
+    texts = ("Welcome", "Ask about your data", "Question 1", "Question 2", "Question 3", "Question 4")
+    cases = [(None, *texts), (0, *texts), (1, *texts), (5, "", None, "a", "b", "c", "d")]
+    results = run_clientside("edit-welcome-modal.is_open", [(case, []) for case in cases])
+    assert results == [as_json(old_open_modal(*case)) for case in cases]
+
+def test_chat_item_active_state():
+    keys = ["a1", "b2", "c3", "d4"]
+    ids = [{"type": "chat-item", "index": key} for key in keys]
+
+    def clicked(key, n_clicks=1):
+        prop_id = json.dumps({"index": key, "type": "chat-item"}, separators=(",", ":")) + ".n_clicks"
+        return [{"prop_id": prop_id, "value": n_clicks}]
+
+    cases = [
+        # (classNames before, clicked index, previously active index)
+        (["chat-item active", "chat-item", "chat-item", "chat-item"], 2, 0),
+        (["chat-item", "chat-item", "chat-item active", "chat-item"], 2, 2),
+        (["chat-item", "chat-item", "chat-item", "chat-item"], 3, None),
+        (["chat-item", "chat-item active", "chat-item", "chat-item"], 0, 1),
+    ]
+    results = run_clientside('{"index":["ALL"],"type":"chat-item"}.className', [
+        (([1] * len(ids), ids), clicked(keys[index])) for _, index, _ in cases])
+    for (class_names, index, previous), (result_classes, chat_open) in zip(cases, results):
+        assert result_classes == old_active_classes(class_names, index, previous)
+        assert chat_open["key"] == keys[index]
+
+    # Items being added fire the callback with nothing clicked, which the old callback ignored too
+    ignored = run_clientside('{"index":["ALL"],"type":"chat-item"}.className', [
+        (([None] * len(ids), ids), clicked(keys[0], None)),
+        (([None] * len(ids), ids), []),
+    ])
+    assert ignored == [[NO_UPDATE, NO_UPDATE]] * 2
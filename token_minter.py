@@ -1,31 +1,149 @@
 import requests
 import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+import hashlib
+import json
 import logging
 import os
+import tempfile
+from typing import Iterator, Optional
 from dotenv import load_dotenv
+from metrics import registry, CACHE_LOOKUPS
+from config import workspace_url
 load_dotenv(override=True)
 
+try:
+    import fcntl
+except ImportError:  # No flock on Windows; each process then mints its own tokens
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+TOKEN_REFRESHES = registry.counter("genie_token_refreshes_total", "OAuth token refresh attempts", ("result",))
+
+def default_token_cache_dir() -> str:
+    """A per-user directory for the shared token, or "" where tokens cannot be shared"""
+    if fcntl is None:
+        return ""
+    return os.path.join(tempfile.gettempdir(), f"genie-tokens-{os.getuid()}")
+
+class SharedTokenCache:
+    """
+    The current token of one set of credentials, in a file shared by every
+    process of the app on this host. An exclusive flock on a companion lock
+    file elects the process that refreshes it; the others read the result.
+
+    The directory must belong to this user and be private to it, since the
+    file holds a bearer token.
+    """
+    def __init__(self, directory: str, client_id: str, host: str):
+        key = hashlib.sha256(f"{host}|{client_id}".encode()).hexdigest()[:16]
+        self.path = os.path.join(directory, f"token-{key}.json")
+        self.lock_path = os.path.join(directory, f"token-{key}.lock")
+
+    @classmethod
+    def open(cls, directory: str, client_id: str, host: str) -> Optional["SharedTokenCache"]:
+        """A cache in directory, created private if missing, or None if it cannot be used safely"""
+        if fcntl is None or not directory:
+            return None
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            info = os.stat(directory)
+            if info.st_uid != os.getuid() or info.st_mode & 0o077:
+                logger.warning(f"Not sharing tokens through {directory}: it must belong to this user with mode 0700")
+                return None
+        except OSError as e:
+            logger.warning(f"Not sharing tokens through {directory}: {str(e)}")
+            return None
+        return cls(directory, client_id, host)
+
+    def read(self) -> Optional[dict]:
+        """The shared token entry, or None if there is none yet or it is unreadable"""
+        try:
+            fd = os.open(self.path, os.O_RDONLY | os.O_NOFOLLOW)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Could not read the shared token: {str(e)}")
+            return None
+        try:
+            with os.fdopen(fd) as f:
+                entry = json.load(f)
+            if not isinstance(entry, dict) or not entry.get("token") or not isinstance(entry.get("expires_at"), (int, float)):
+                return None
+            return entry
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read the shared token: {str(e)}")
+            return None
+
+    def write(self, token: str, expires_at: float, generation: int) -> None:
+        """Replace the shared token; readers see either the old file or the new one"""
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o600)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"token": token, "expires_at": expires_at, "generation": generation}, f)
+            os.replace(temp_path, self.path)
+        except Exception:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    @contextmanager
+    def refresh_lock(self, wait: bool) -> Iterator[bool]:
+        """
+        Hold the refresher election. Yields whether this caller won it; without
+        wait, it loses at once while another process or thread holds it.
+        """
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(fd)
+
 class TokenMinter:
     """
     A class to handle OAuth token generation and renewal for Databricks.
-    Automatically refreshes the token before it expires.
+    The first token is minted on the first get_token call, and refreshed
+    automatically before it expires.
     Uses a reentrant lock for better concurrency.
+
+    With a shared cache, processes on the same host share one token: a
+    process whose token is due for refresh first takes a newer one from the
+    cache, and only the process elected as refresher calls the token
+    endpoint. While the election is held elsewhere, the others keep using
+    their token until it actually expires.
     """
-    def __init__(self, client_id: str, client_secret: str, host: str):
+    # Databricks OAuth tokens are valid for 60 minutes; treat them as expiring a little early
+    lifetime = timedelta(minutes=55)
+    refresh_margin = timedelta(minutes=5)
+
+    def __init__(self, client_id: str, client_secret: str, host: str, cache_dir: Optional[str] = None):
         self.client_id = client_id
         self.client_secret = client_secret
         self.host = host
         self.token = None
         self.expiry_time = None
+        self.generation = 0  # Incremented on every refresh so consumers can tell tokens apart
         self.lock = threading.RLock()  # Use reentrant lock
-        self._refresh_token()
+        self.shared = SharedTokenCache.open(cache_dir, client_id, host) if cache_dir else None
         
+    def reset_after_fork(self) -> None:
+        """Give a forked child its own lock; the cached token stays valid across processes"""
+        self.lock = threading.RLock()
+
     def _refresh_token(self) -> None:
         """Internal method to refresh the OAuth token"""
-        url = f"https://{self.host}/oidc/v1/token"
+        url = f"{workspace_url(self.host)}/oidc/v1/token"
         auth = (self.client_id, self.client_secret)
         data = {'grant_type': 'client_credentials', 'scope': 'all-apis'}
         
@@ -36,11 +154,14 @@ class TokenMinter:
             
             with self.lock:
                 self.token = token_data.get('access_token')
-                # Set expiry time to 55 minutes (slightly less than the 60-minute expiry)
-                self.expiry_time = datetime.now() + timedelta(minutes=55)
+                # Set expiry time slightly less than the 60-minute expiry
+                self.expiry_time = datetime.now() + self.lifetime
+                self.generation += 1
                 
+            TOKEN_REFRESHES.inc(result="success")
             logger.info("Successfully refreshed Databricks OAuth token")
         except Exception as e:
+            TOKEN_REFRESHES.inc(result="error")
             logger.error(f"Failed to refresh Databricks OAuth token: {str(e)}")
             raise
     
@@ -48,8 +169,15 @@ class TokenMinter:
         """Check if token needs refresh without holding the lock"""
         return (not self.token or 
                 not self.expiry_time or 
-                datetime.now() + timedelta(minutes=5) >= self.expiry_time)
-    
+                datetime.now() + self.refresh_margin >= self.expiry_time)
+
+    def cached_token(self) -> Optional[str]:
+        """The current token if it is not yet due for refresh, without refreshing or waiting; None otherwise"""
+        return None if self._needs_refresh() else self.token
+
+    def _expired(self) -> bool:
+        return not self.token or not self.expiry_time or datetime.now() >= self.expiry_time
+
     def get_token(self) -> str:
         """
         Get a valid token, refreshing if necessary.
@@ -60,15 +188,59 @@ class TokenMinter:
         """
         # First check without lock if refresh is needed
         if self._needs_refresh():
-            # Only acquire lock if we need to refresh
-            with self.lock:
+            # Only acquire lock if we need to refresh; while another thread holds it,
+            # a token that has not expired yet is still good to use
+            if not self.lock.acquire(blocking=self._expired()):
+                return self.token
+            try:
                 # Double-check pattern to avoid race conditions
                 if self._needs_refresh():
-                    self._refresh_token()
+                    if self.shared is None:
+                        self._refresh_token()
+                    else:
+                        self._refresh_shared()
+            finally:
+                self.lock.release()
         return self.token
 
+    def _refresh_shared(self) -> None:
+        """Take a newer token from the shared cache, or refresh it if elected"""
+        if self._adopt(self.shared.read()):
+            return
+        # Only wait for another refresher once the token in hand can no longer be used
+        with self.shared.refresh_lock(wait=self._expired()) as elected:
+            if not elected:
+                logger.debug("Another process is refreshing the shared token, using the current one meanwhile")
+                return
+            # The previous holder may have refreshed it while this process waited
+            entry = self.shared.read()
+            if self._adopt(entry):
+                return
+            self._refresh_token()
+            if entry:
+                self.generation = max(self.generation, int(entry.get("generation", 0)) + 1)
+            try:
+                self.shared.write(self.token, self.expiry_time.timestamp(), self.generation)
+            except OSError as e:
+                logger.warning(f"Could not share the refreshed token: {str(e)}")
+
+    def _adopt(self, entry: Optional[dict]) -> bool:
+        """Use the shared token if it is newer than this process's and not yet due for refresh"""
+        expiry_time = datetime.fromtimestamp(entry["expires_at"]) if entry else None
+        if (not entry or entry["token"] == self.token
+                or datetime.now() + self.refresh_margin >= expiry_time):
+            CACHE_LOOKUPS.inc(cache="tokens", result="miss")
+            return False
+        self.token = entry["token"]
+        self.expiry_time = expiry_time
+        self.generation = max(self.generation + 1, int(entry.get("generation", 0)))
+        CACHE_LOOKUPS.inc(cache="tokens", result="hit")
+        return True
+
+# TOKEN_CACHE_DIR set to an empty value keeps tokens per process
 tokenminter = TokenMinter(
     client_id=os.getenv("DATABRICKS_CLIENT_ID"),
     client_secret=os.getenv("DATABRICKS_CLIENT_SECRET"),
-    host=os.getenv("DATABRICKS_HOST")
+    host=os.getenv("DATABRICKS_HOST"),
+    cache_dir=os.getenv("TOKEN_CACHE_DIR", default_token_cache_dir())
 )
@@ -0,0 +1,200 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Attributes copied from a parent span to its children, so every stage carries them
+PROPAGATED_ATTRIBUTES = ("conversation_id", "message_id")
+
+_current_span = contextvars.ContextVar("genie_current_span", default=None)
+
+class Span:
+    """A timed stage of answering a question"""
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start_time",
+                 "end_time", "_start", "duration", "status", "error", "_token")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = {}
+        if parent:
+            for key in PROPAGATED_ATTRIBUTES:
+                if key in parent.attributes:
+                    self.attributes[key] = parent.attributes[key]
+        self.attributes.update(attributes)
+        self.start_time = time.time()
+        self.end_time = None
+        self._start = time.perf_counter()
+        self.duration = None
+        self.status = "OK"
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+class _SpanContext:
+    __slots__ = ("tracer", "span")
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self.span._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        span = self.span
+        span.duration = time.perf_counter() - span._start
+        span.end_time = span.start_time + span.duration
+        if exc is not None:
+            span.status = "ERROR"
+            span.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(span._token)
+        self.tracer._export(span)
+        return False
+
+class _NoopSpan:
+    """Stands in for both the span context and the span when tracing is disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes) -> None:
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class LogExporter:
+    """Writes one log record per finished span, its timing and attributes as structured fields"""
+    def __init__(self, level: int = logging.INFO):
+        self.level = level
+        self.logger = logging.getLogger("genie.trace")
+
+    def export(self, span: Span) -> None:
+        if self.logger.isEnabledFor(self.level):
+            fields = {"stage": span.name, "duration_ms": round(span.duration * 1000, 1), "status": span.status,
+                      "trace_id": span.trace_id, **span.attributes}
+            self.logger.log(self.level, "span %s", span.name, extra={"fields": fields})
+
+class JsonFileExporter:
+    """Appends finished spans to a file as JSON lines"""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+class InMemoryOTelExporter:
+    """
+    Keeps the most recent finished spans in memory in the OpenTelemetry
+    (OTLP JSON) span shape, for in-process inspection or forwarding.
+    """
+    def __init__(self, max_spans: int = 10000):
+        self._spans = deque(maxlen=max_spans)
+
+    def export(self, span: Span) -> None:
+        self._spans.append({
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "startTimeUnixNano": int(span.start_time * 1e9),
+            "endTimeUnixNano": int(span.end_time * 1e9),
+            "attributes": [{"key": key, "value": {"stringValue": str(value)}} for key, value in span.attributes.items()],
+            "status": {"code": "STATUS_CODE_ERROR" if span.status == "ERROR" else "STATUS_CODE_OK",
+                       "message": span.error or ""},
+        })
+
+    def get_finished_spans(self) -> List[Dict[str, Any]]:
+        return list(self._spans)
+
+    def clear(self) -> None:
+        self._spans.clear()
+
+class Tracer:
+    """
+    Creates spans for the stages of answering a question and hands finished
+    spans to the configured exporters. With no exporters, span() returns a
+    shared no-op object, so disabled tracing costs one attribute check.
+    """
+    def __init__(self, exporters: Optional[list] = None):
+        self.exporters = list(exporters or [])
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def add_exporter(self, exporter) -> None:
+        self.exporters.append(exporter)
+
+    def span(self, name: str, **attributes):
+        """Context manager timing a stage; yields the span so ids can be attached as they become known"""
+        if not self.exporters:
+            return _NOOP_SPAN
+        return _SpanContext(self, Span(name, _current_span.get(), attributes))
+
+    def current_span(self):
+        """The active span, or a no-op span outside of one"""
+        return _current_span.get() or _NOOP_SPAN
+
+    def _export(self, span: Span) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.error(f"Error exporting span {span.name}: {str(e)}")
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """Build a tracer from GENIE_TRACE_EXPORTERS, a comma-separated list of log, otel and json"""
+        exporters = []
+        for name in filter(None, (part.strip() for part in os.getenv("GENIE_TRACE_EXPORTERS", "").split(","))):
+            if name == "log":
+                exporters.append(LogExporter())
+            elif name == "otel":
+                exporters.append(InMemoryOTelExporter())
+            elif name == "json":
+                exporters.append(JsonFileExporter(os.getenv("GENIE_TRACE_FILE", "genie_traces.jsonl")))
+            else:
+                logger.warning(f"Unknown trace exporter: {name}")
+        return cls(exporters)
+
+tracer = Tracer.from_env()